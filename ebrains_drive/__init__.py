@@ -8,7 +8,8 @@ License: BSD 3-clause, see LICENSE.txt
 """
 
 from ebrains_drive.client import DriveApiClient, BucketApiClient
+from ebrains_drive.aio import AsyncDriveApiClient, AsyncBucketApiClient
 
-def connect(username=None, password=None, token=None, env=""):
-    client = DriveApiClient(username, password, token, env)
+def connect(username=None, password=None, token=None, env="", **kwargs):
+    client = DriveApiClient(username, password, token, env, **kwargs)
     return client
\ No newline at end of file
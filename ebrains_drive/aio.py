@@ -0,0 +1,721 @@
+"""
+Asyncio clients, for workloads issuing many concurrent requests from a single process.
+
+The async clients mirror :class:`ebrains_drive.client.DriveApiClient` and
+:class:`ebrains_drive.client.BucketApiClient`; the operations of the objects
+they return are coroutines (or async generators) instead of blocking calls.
+These objects only have the operations listed here: for the others (e.g.
+walks, copies and moves, segmented uploads), use the blocking clients.
+
+Requires httpx: ``pip install ebrains-drive[async]``
+"""
+import asyncio
+import os
+import posixpath
+import re
+import tempfile
+from contextlib import asynccontextmanager
+from getpass import getpass
+from typing import IO, Any, AsyncIterator, Dict, Iterable, List, Optional, Union
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from ebrains_drive.bucket import _BucketBase, _from_listing
+from ebrains_drive.buckets import _BucketsBase
+from ebrains_drive.auth import TokenManager
+from ebrains_drive.client import _I_AM_A_PUBLIC_BUCKET, _DriveEnvironment, _Environment
+from ebrains_drive.exceptions import ClientHttpError, DoesNotExist, UpstreamAPIException
+from ebrains_drive.files import ZERO_OBJ_ID, DataproxyDir, _DataproxyFileBase, _created_path, _load_dirent, _mmap_readonly
+from ebrains_drive.repo import ALLOWED_KEYS
+from ebrains_drive.repos import _remove_duplicate_repos
+from ebrains_drive.retry import RetryPolicy
+from ebrains_drive.session import SessionManager, body_rewinder
+from ebrains_drive.transfer import DEFAULT_CHUNK_SIZE, is_pathlike
+from ebrains_drive.utils import querystr, on_401_raise_unauthorized, raise_does_not_exist
+
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 20
+DEFAULT_KEEPALIVE_EXPIRY = 5.0
+# Seconds allowed to connect, and between two reads or writes of a request
+DEFAULT_TIMEOUT = 60.0
+
+
+def _is_retryable_error(exc, idempotent):
+    """httpx counterpart of :meth:`RetryPolicy._is_retryable_exception`"""
+    if idempotent:
+        return isinstance(exc, (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError))
+    # the request was never sent
+    return isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout))
+
+
+def _check_status(resp, expected=None):
+    """Raise :exc:`ClientHttpError` if the status of `resp` is not in `expected`
+    (default: any success), as :meth:`AsyncClientBase.send_request` does"""
+    if expected is None:
+        if resp.is_success:
+            return
+        expected = (200, )
+    elif resp.status_code in expected:
+        return
+    msg = 'Expected %s, but get %s' % \
+          (' or '.join(map(str, expected)), resp.status_code)
+    raise ClientHttpError(resp.status_code, msg)
+
+
+async def _run_sync(func, *args):
+    """Run the blocking `func` (e.g. local file I/O) in the default executor"""
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+class AsyncClientBase(_Environment):
+    """Base of the asyncio api clients.
+
+    Requests go through two :class:`httpx.AsyncClient` connection pools,
+    shared by all the coroutines using the client: one for the api, another
+    one for the transfers to/from presigned object store urls. Call
+    :meth:`aclose` (or use the client as an async context manager) to
+    release them.
+
+    :param:max_connections Maximum number of concurrent connections of each pool
+    :param:max_keepalive_connections Maximum number of idle connections kept alive
+    :param:keepalive_expiry Seconds an idle connection is kept alive
+    :param:timeout Passed to :class:`httpx.AsyncClient`
+    :param:retry_policy :class:`ebrains_drive.retry.RetryPolicy` applied to all
+        requests (default: its defaults)
+    :param:token_manager :class:`ebrains_drive.auth.TokenManager`, e.g. shared with other clients
+    :param:transport Optional :class:`httpx.AsyncBaseTransport`, e.g. for testing
+    """
+    def __init__(self, username=None, password=None, token=None, env="", *, max_connections=DEFAULT_MAX_CONNECTIONS,
+                 max_keepalive_connections=DEFAULT_MAX_KEEPALIVE_CONNECTIONS, keepalive_expiry=DEFAULT_KEEPALIVE_EXPIRY,
+                 timeout=DEFAULT_TIMEOUT, retry_policy: RetryPolicy=None, token_manager: TokenManager=None,
+                 transport=None) -> None:
+        if httpx is None:
+            raise ImportError("The asyncio clients require httpx: pip install ebrains-drive[async]")
+
+        self.username = username
+        self.password = password
+        self.server = None
+        self.retry_policy = retry_policy or RetryPolicy()
+        # not supported (yet) by the asyncio objects
+        self.content_cache = None
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections,
+                              keepalive_expiry=keepalive_expiry)
+        self.http = httpx.AsyncClient(limits=limits, timeout=timeout, transport=transport)
+        self.transfer_http = httpx.AsyncClient(limits=limits, timeout=timeout, transport=transport)
+
+        self._token_sessions = None
+        if token_manager is None:
+            if token is None:
+                if self.username is None:
+                    self.username = input("EBRAINS username: ")
+                if self.password is None:
+                    self.password = getpass()
+            # tokens are renewed (seldom) with blocking requests, in the default executor
+            self._token_sessions = SessionManager(retry_policy=self.retry_policy)
+            token_manager = TokenManager(token, username=self.username, password=self.password,
+                                         token_url=self.iam_token_url, session=self._token_sessions)
+        self.token_manager = token_manager
+
+    async def _auth_headers(self):
+        if self.token_manager.needs_refresh():
+            await _run_sync(lambda: self.token_manager.token)
+        return {'Authorization': 'Bearer ' + self.token_manager.token}
+
+    async def aclose(self):
+        """Close the pooled connections of this client"""
+        await self.http.aclose()
+        await self.transfer_http.aclose()
+        if self._token_sessions is not None:
+            self._token_sessions.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
+
+    async def get(self, *args, **kwargs):
+        return await self.send_request('GET', *args, **kwargs)
+
+    async def post(self, *args, **kwargs):
+        return await self.send_request('POST', *args, **kwargs)
+
+    async def put(self, *args, **kwargs):
+        return await self.send_request('PUT', *args, **kwargs)
+
+    async def delete(self, *args, **kwargs):
+        return await self.send_request('DELETE', *args, **kwargs)
+
+    async def _prepare(self, url, kwargs):
+        if not url.startswith('http'):
+            url = self.server.rstrip('/') + '/' + url.lstrip('/')
+
+        headers = await self._auth_headers()
+        headers.update(kwargs.get('headers') or {})
+        # like requests, leave out the headers and query parameters set to None
+        kwargs['headers'] = {key: value for key, value in headers.items() if value is not None}
+        if isinstance(kwargs.get('params'), dict):
+            kwargs['params'] = {key: value for key, value in kwargs['params'].items() if value is not None}
+        return url
+
+    async def send_request(self, method: str, url: str, **kwargs):
+        url = await self._prepare(url, kwargs)
+        expected = kwargs.pop('expected', 200)
+        if not hasattr(expected, '__iter__'):
+            expected = (expected, )
+        idempotent = kwargs.pop('idempotent', None)
+
+        send = lambda: self.http.request(method, url, **kwargs)
+        resp = await self.send_with_retries(method, send, idempotent=idempotent, rewind=body_rewinder(kwargs))
+        _check_status(resp, expected)
+        return resp
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, *, http=None, **kwargs):
+        """Async context manager sending an api request (or, with `http=self.transfer_http`,
+        a request to a presigned url) and yielding its response, whose body is not read yet."""
+        http = http or self.http
+        if http is self.http:
+            url = await self._prepare(url, kwargs)
+        send = lambda: http.send(http.build_request(method, url, **kwargs), stream=True)
+        resp = await self.send_with_retries(method, send)
+        try:
+            _check_status(resp)
+            yield resp
+        finally:
+            await resp.aclose()
+
+    async def send_with_retries(self, method: str, send, idempotent=None, rewind=None):
+        """Await `send()` (which sends the request and returns its response) until it succeeds,
+        fails in a non retryable way, or the attempts of :attr:`retry_policy` are exhausted.
+        See :meth:`ebrains_drive.retry.RetryPolicy.call`."""
+        policy = self.retry_policy
+        if idempotent is None:
+            idempotent = method.upper() in policy.idempotent_methods
+        attempt = 1
+        while True:
+            try:
+                resp = await send()
+            except httpx.TransportError as e:
+                if attempt >= policy.max_attempts or not _is_retryable_error(e, idempotent) \
+                        or (rewind is not None and not rewind()):
+                    raise
+                await asyncio.sleep(policy.backoff(attempt))
+                attempt += 1
+                continue
+
+            if attempt >= policy.max_attempts or not policy._is_retryable_response(resp, idempotent) \
+                    or (rewind is not None and not rewind()):
+                return resp
+            delay = policy.retry_after(resp) if policy.respect_retry_after else None
+            await resp.aclose()
+            await asyncio.sleep(policy.backoff(attempt) if delay is None else delay)
+            attempt += 1
+
+
+class AsyncDriveApiClient(_DriveEnvironment, AsyncClientBase):
+    """Asyncio counterpart of :class:`ebrains_drive.client.DriveApiClient`"""
+    def __init__(self, username=None, password=None, token=None, env="", **kwargs):
+        self._set_env(env)
+        super().__init__(username, password, token, env, **kwargs)
+
+        self.server = self.drive_url
+        # not supported (yet) by the asyncio objects
+        self.metadata_cache = None
+
+        self.repos = AsyncRepos(self)
+
+    def __str__(self):
+        return 'AsyncDriveApiClient[server=%s, user=%s]' % (self.server, self.username)
+
+    __repr__ = __str__
+
+
+class AsyncBucketApiClient(AsyncClientBase):
+    """Asyncio counterpart of :class:`ebrains_drive.client.BucketApiClient`"""
+    def __init__(self, username=None, password=None, token=_I_AM_A_PUBLIC_BUCKET, env="", **kwargs) -> None:
+        if env != "":
+            raise NotImplementedError("non prod environment for dataproxy access has not yet been implemented.")
+        self._set_env(env)
+
+        super().__init__(username, password, token, env, **kwargs)
+
+        self.server = "https://data-proxy.ebrains.eu/api"
+
+        self.buckets = AsyncBuckets(self)
+
+    async def _auth_headers(self):
+        if self.token_manager.token == _I_AM_A_PUBLIC_BUCKET:
+            return {}
+        return await super()._auth_headers()
+
+
+class AsyncRepos(object):
+    """Asyncio counterpart of :class:`ebrains_drive.repos.Repos`"""
+    def __init__(self, client):
+        self.client = client
+
+    @raise_does_not_exist('The requested library does not exist')
+    async def get_repo(self, repo_id):
+        """Get the repo which has the id `repo_id`.
+
+        Raises :exc:`DoesNotExist` if no such repo exists.
+        """
+        repo_json = (await self.client.get('/api2/repos/' + repo_id)).json()
+        return AsyncRepo.from_json(self.client, repo_json)
+
+    async def list_repos(self):
+        repos_json = (await self.client.get('/api2/repos/')).json()
+        repos = [AsyncRepo.from_json(self.client, j) for j in repos_json]
+        return _remove_duplicate_repos(repos)
+
+    async def get_repos_by_filter(self, filter_name, filter_value):
+        """Get all repos which have `filter_name` = `filter_value`.
+        """
+        repos_json = (await self.client.get('/api2/repos/')).json()
+        match_repos = [AsyncRepo.from_json(self.client, j) for j in repos_json
+                       if filter_name in j.keys() and j[filter_name] == filter_value]
+        return _remove_duplicate_repos(match_repos)
+
+    async def get_repos_by_name(self, repo_name):
+        """Get all repos which have the name `repo_name`.
+        """
+        return await self.get_repos_by_filter("name", repo_name)
+
+    async def get_default_repo(self):
+        """
+        Get the user's default repo (i.e. "My Library")
+        """
+        repos_json = (await self.client.get('/api2/default-repo')).json()
+        assert repos_json.get("exists"), f"Default repo does not exist."
+
+        repo_id = repos_json.get("repo_id")
+        assert repo_id, f"Expected repo_id to be populated, but wasn't"
+        return await self.get_repo(repo_id)
+
+
+class AsyncRepo(object):
+    """Asyncio counterpart of :class:`ebrains_drive.repo.Repo`"""
+    def __init__(self, client, **kwargs):
+        self.client = client
+        self.__dict__.update((key, value) for key, value in kwargs.items() if key in ALLOWED_KEYS)
+
+    def __str__(self):
+        return "(id='{}', name='{}')".format(self.id, self.name)
+
+    def __repr__(self):
+        return "ebrains_drive.aio.AsyncRepo(id='{}', name='{}')".format(self.id, self.name)
+
+    @classmethod
+    def from_json(cls, client, repo_json):
+        return cls(client, **repo_json)
+
+    @raise_does_not_exist('The requested file does not exist')
+    async def get_file(self, path):
+        """Get the file object located in `path` in this repo.
+
+        Return a :class:`AsyncSeafFile` object
+        """
+        assert path.startswith('/')
+        url = '/api2/repos/%s/file/detail/' % self.id + querystr(p=path)
+        file_json = (await self.client.get(url)).json()
+
+        return AsyncSeafFile(self, path, file_json['id'], "file", file_json['size'])
+
+    @raise_does_not_exist('The requested dir does not exist')
+    async def get_dir(self, path):
+        """Get the dir object located in `path` in this repo.
+
+        Return a :class:`AsyncSeafDir` object
+        """
+        assert path.startswith('/')
+        url = '/api2/repos/%s/dir/' % self.id + querystr(p=path)
+        resp = await self.client.get(url)
+        dir = AsyncSeafDir(self, path, resp.headers['oid'], "dir")
+        await dir.load_entries(resp.json())
+        return dir
+
+    async def delete(self):
+        """Remove this repo. Only the repo owner can do this"""
+        await self.client.delete('/api2/repos/' + self.id)
+
+
+class _AsyncDirentBase(object):
+    """Base class for :class:`AsyncSeafFile` and :class:`AsyncSeafDir`"""
+    isdir = None
+
+    def __init__(self, repo, path, object_id, obj_type, size=0):
+        self.client = repo.client
+        self.repo = repo
+        self.path = path
+        self.id = object_id
+        self.type = obj_type
+        self.size = size
+
+    @property
+    def name(self):
+        return posixpath.basename(self.path)
+
+    async def delete(self):
+        suffix = 'dir' if self.isdir else 'file'
+        url = '/api2/repos/%s/%s/' % (self.repo.id, suffix) + querystr(p=self.path)
+        return await self.client.delete(url)
+
+
+class AsyncSeafDir(_AsyncDirentBase):
+    """Asyncio counterpart of :class:`ebrains_drive.files.SeafDir`"""
+    isdir = True
+
+    def __init__(self, *args, **kwargs):
+        entries = kwargs.pop('entries', None)
+        super().__init__(*args, **kwargs)
+        self.entries = entries
+
+    async def ls(self, entity_type=None, force_refresh=True):
+        """List the entries in this dir.
+
+        Return a list of objects of class :class:`AsyncSeafFile` or :class:`AsyncSeafDir`.
+        """
+        if entity_type and entity_type not in ["file", "dir"]:
+            raise ValueError("Invalid value for parameter `entity_type`; must be 'file' or 'dir'!")
+        if self.entries is None or force_refresh:
+            await self.load_entries()
+
+        if entity_type:
+            return [x for x in self.entries if x.type == entity_type]
+        else:
+            return self.entries
+
+    async def check_exists(self, name, entity_type=None):
+        """Check if an entity with specified name exists in current directory"""
+        for e in await self.ls(entity_type=entity_type, force_refresh=True):
+            if e.name == name:
+                return e
+        return False
+
+    async def mkdir(self, name):
+        """Create a new sub folder right under this dir.
+
+        Return a :class:`AsyncSeafDir` object of the newly created sub folder,
+        named differently if `name` was created by someone else in the meantime,
+        see :meth:`ebrains_drive.files.SeafDir.mkdir`.
+        """
+        if await self.check_exists(name):
+            raise FileExistsError("File/directory with name = `{}` already exists in current directory!".format(name))
+
+        path = posixpath.join(self.path, name)
+        url = '/api2/repos/%s/dir/' % self.repo.id + querystr(p=path)
+        resp = await self.client.post(url, data={'operation': 'mkdir'}, expected=(200, 201))
+        created = AsyncSeafDir(self.repo, _created_path(resp, path), ZERO_OBJ_ID, "dir")
+        self.entries.append(created)
+        return created
+
+    async def _get_upload_link(self):
+        url = '/api2/repos/%s/upload-link/' % self.repo.id + querystr(p=self.path)
+        resp = await self.client.get(url)
+        return re.match(r'"(.*)"', resp.text).group(1)
+
+    async def upload(self, fileobj, filename):
+        """Upload a file to this folder.
+
+        :param:fileobj bytes, or binary :class:`File` like object
+        :param:filename The name of the file
+
+        Return a :class:`AsyncSeafFile` object of the newly uploaded file.
+        """
+        upload_url = await self._get_upload_link()
+        resp = await self.client.post(upload_url + '?ret-json=1', data={'parent_dir': self.path},
+                                      files={'file': (filename, fileobj)})
+        file_json = resp.json()[0]
+        return AsyncSeafFile(self.repo, posixpath.join(self.path, file_json['name']), file_json['id'], "file",
+                             file_json['size'])
+
+    async def load_entries(self, dirents_json=None):
+        if dirents_json is None:
+            url = '/api2/repos/%s/dir/' % self.repo.id + querystr(p=self.path)
+            dirents_json = (await self.client.get(url)).json()
+
+        self.entries = [self._load_dirent(entry_json) for entry_json in dirents_json]
+
+    def _load_dirent(self, dirent_json):
+        return _load_dirent(self.repo, self.path, dirent_json, AsyncSeafFile, AsyncSeafDir)
+
+    @property
+    def num_entries(self):
+        """Number of loaded entries (entries are not fetched, see :meth:`load_entries`)"""
+        return len(self.entries) if self.entries is not None else 0
+
+    def __str__(self):
+        return 'AsyncSeafDir[repo=%s, path=%s, entries=%s]' % \
+            (self.repo.id[:6], self.path, self.num_entries)
+
+    __repr__ = __str__
+
+
+class AsyncSeafFile(_AsyncDirentBase):
+    """Asyncio counterpart of :class:`ebrains_drive.files.SeafFile`"""
+    isdir = False
+
+    def __str__(self):
+        return 'AsyncSeafFile[repo=%s, path=%s, size=%s]' % \
+            (self.repo.id[:6], self.path, self.size)
+
+    __repr__ = __str__
+
+    async def get_download_link(self):
+        url = '/api2/repos/%s/file/' % self.repo.id + querystr(p=self.path)
+        resp = await self.client.get(url)
+        return re.match(r'"(.*)"', resp.text).group(1)
+
+    async def get_content(self):
+        """Get the content of the file"""
+        url = await self.get_download_link()
+        return (await self.client.get(url)).content
+
+    async def iter_content(self, chunk_size: int=DEFAULT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        """Iterate over the content of the file, `chunk_size` bytes at a time"""
+        url = await self.get_download_link()
+        async with self.client.stream('GET', url) as resp:
+            async for chunk in resp.aiter_bytes(chunk_size):
+                yield chunk
+
+    async def download_to(self, path_or_fileobj: Union[str, os.PathLike, IO[bytes]], *, chunk_size: int=DEFAULT_CHUNK_SIZE) -> int:
+        """Stream the content of the file to a local path, or to a writable binary file object.
+
+        Returns the number of bytes written.
+        """
+        return await _write_chunks(self.iter_content(chunk_size), path_or_fileobj)
+
+    async def open_mmap(self, *, chunk_size: int=DEFAULT_CHUNK_SIZE):
+        """Map the content of the file in memory, read-only, see :meth:`SeafFile.open_mmap`"""
+        return await _open_mmap(self.iter_content(chunk_size))
+
+
+async def _open_mmap(chunks):
+    # the content cache is not supported by the asyncio clients: always a temporary file
+    fp = await _run_sync(tempfile.TemporaryFile)
+    with fp:
+        await _write_chunks(chunks, fp)
+        await _run_sync(fp.flush)
+        return _mmap_readonly(fp)
+
+
+async def _write_chunks(chunks, path_or_fileobj):
+    if is_pathlike(path_or_fileobj):
+        fp = await _run_sync(open, path_or_fileobj, "wb")
+        try:
+            return await _write_chunks(chunks, fp)
+        finally:
+            await _run_sync(fp.close)
+
+    written = 0
+    async for chunk in chunks:
+        await _run_sync(path_or_fileobj.write, chunk)
+        written += len(chunk)
+    return written
+
+
+class AsyncBuckets(_BucketsBase):
+    """Asyncio counterpart of :class:`ebrains_drive.buckets.Buckets`"""
+
+    @on_401_raise_unauthorized('401 response. Check you/your token have access right and/or the bucket name has been spelt correctly.')
+    async def get_bucket(self, bucket_name: str, *, public: bool=False) -> 'AsyncBucket':
+        """Get the specified bucket according name."""
+        resp = await self.client.get(f"/v1/buckets/{bucket_name}/stat")
+        return AsyncBucket.from_json(self.client, resp.json(), public=public, target='buckets')
+
+    async def get_dataset(self, dataset_id: str, *, public: bool=False, request_access: bool=False):
+        request_sent = False
+        attempt_no = 0
+        while True:
+            try:
+                resp = await self.client.get(f"/v1/datasets/{dataset_id}/stat")
+                return AsyncBucket.from_json(self.client, resp.json(), public=public, target="datasets", dataset_id=dataset_id)
+            except ClientHttpError as e:
+                self._raise_unless_access_requested(e, request_access)
+                if not request_sent:
+                    await self.client.post(f"/v1/datasets/{dataset_id}", expected=(200, 201))
+                    request_sent = True
+                    print("Request sent. Please check the mail box associated with the token.")
+                attempt_no = attempt_no + 1
+                await asyncio.sleep(self._access_poll_interval(attempt_no))
+                print(f"Checking permission, attempt {attempt_no}")
+
+
+class AsyncBucket(_BucketBase):
+    """Asyncio counterpart of :class:`ebrains_drive.bucket.Bucket`.
+
+    Segmented uploads are not supported: use the threaded
+    :meth:`ebrains_drive.bucket.Bucket.upload_segmented` for very large files.
+    """
+
+    def __repr__(self):
+        return "ebrains_drive.aio.AsyncBucket(name='{}')".format(self.name)
+
+    async def _list_page(self, prefix: str, marker: str, page_size: int, delimiter: str=None) -> List[Dict[str, Any]]:
+        resp = await self.client.get(f"/v1/{self.target}/{self.dataproxy_entity_name}", params={
+            'limit': page_size,
+            'marker': marker,
+            'prefix': prefix,
+            'delimiter': delimiter,
+        })
+        return resp.json().get("objects", [])
+
+    @on_401_raise_unauthorized("Unauthorized.")
+    async def ls_pages(self, prefix: str=None, *, delimiter: str=None, page_size: int=None, prefetch: bool=True) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Iterate over the listing of the bucket one page (list of object json) at a time.
+
+        See :meth:`ebrains_drive.bucket.Bucket.ls_pages`.
+        """
+        page_size = page_size or self.LIMIT
+        marker = None
+        next_page = None
+        try:
+            page = await self._list_page(prefix, marker, page_size, delimiter)
+            while len(page) > 0:
+                for obj in page:
+                    name = obj.get("name", obj.get("subdir"))
+                    if name == marker:
+                        raise RuntimeError(f"Bucket.ls error: hash {marker} has already been visited.")
+                    marker = name
+
+                if prefetch:
+                    next_page = asyncio.ensure_future(self._list_page(prefix, marker, page_size, delimiter))
+                    yield page
+                    page = await next_page
+                else:
+                    yield page
+                    page = await self._list_page(prefix, marker, page_size, delimiter)
+        finally:
+            if next_page is not None and not next_page.done():
+                next_page.cancel()
+
+    @on_401_raise_unauthorized("Unauthorized.")
+    async def ls(self, prefix: str=None, *, delimiter: str=None, page_size: int=None, prefetch: bool=True) -> AsyncIterator[Union['AsyncDataproxyFile', DataproxyDir]]:
+        async for page in self.ls_pages(prefix, delimiter=delimiter, page_size=page_size, prefetch=prefetch):
+            for obj in page:
+                yield self._from_listing(obj)
+
+    def _from_listing(self, obj: Dict[str, Any]) -> Union['AsyncDataproxyFile', DataproxyDir]:
+        return _from_listing(self, obj, AsyncDataproxyFile)
+
+    @on_401_raise_unauthorized("Unauthorized")
+    async def get_file(self, name: str) -> 'AsyncDataproxyFile':
+        """Get the object `name`, in a single request, see :meth:`ebrains_drive.bucket.Bucket.get_file`"""
+        name = name.lstrip("/")
+        objects = await self._list_page(name, None, 1)
+        if not objects or objects[0].get("name") != name:
+            raise DoesNotExist(f"Cannot find {name}.")
+        return AsyncDataproxyFile.from_json(self.client, self, objects[0])
+
+    async def get_files(self, names: Iterable[str]) -> List[Optional['AsyncDataproxyFile']]:
+        """Get the objects `names` concurrently, with None for those which do not exist"""
+        async def get_file(name):
+            try:
+                return await self.get_file(name)
+            except DoesNotExist:
+                return None
+
+        return await asyncio.gather(*(get_file(name) for name in names))
+
+    async def _get_upload_url(self, filename: str, **kwargs) -> str:
+        resp = await self.client.put(f"/v1/{self.target}/{self.dataproxy_entity_name}/{filename}", **kwargs)
+        upload_url = resp.json().get("url")
+        if upload_url is None:
+            raise UpstreamAPIException(f"Bucket.upload did not get upload url.")
+        return upload_url
+
+    @on_401_raise_unauthorized("Unauthorized")
+    async def upload(self, filelike: Union[str, os.PathLike, bytes, IO[bytes]], filename: str, *, chunk_size: int=DEFAULT_CHUNK_SIZE, **kwargs):
+        """Upload a local file (path, bytes or binary file object) as `filename`.
+
+        Files are streamed `chunk_size` bytes at a time.
+        """
+        filename = filename.lstrip("/")
+        upload_url = await self._get_upload_url(filename, **kwargs)
+        if isinstance(filelike, bytes):
+            send = lambda: self.client.transfer_http.put(upload_url, content=filelike)
+            resp = await self.client.send_with_retries("PUT", send)
+        elif is_pathlike(filelike):
+            with open(filelike, "rb") as fp:
+                resp = await self._upload_fileobj(upload_url, fp, chunk_size)
+        else:
+            resp = await self._upload_fileobj(upload_url, filelike, chunk_size)
+        _check_status(resp)
+
+    async def _upload_fileobj(self, upload_url, fp, chunk_size):
+        rewind = body_rewinder({'data': fp})
+        headers = {}
+        try:
+            headers['Content-Length'] = str(os.fstat(fp.fileno()).st_size - fp.tell())
+        except (AttributeError, OSError):
+            pass
+
+        async def chunks():
+            while True:
+                chunk = await _run_sync(fp.read, chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+        send = lambda: self.client.transfer_http.put(upload_url, content=chunks(), headers=headers)
+        return await self.client.send_with_retries("PUT", send, rewind=rewind)
+
+
+class AsyncDataproxyFile(_DataproxyFileBase):
+    """Asyncio counterpart of :class:`ebrains_drive.files.DataproxyFile`"""
+    __slots__ = ()
+
+    async def get_download_link(self):
+        """n.b. this download link expires in the order of seconds
+        """
+        resp = await self.client.get(f"/v1/{self.bucket.target}/{self.bucket.dataproxy_entity_name}/{self.name}", params={
+            "redirect": False
+        })
+        return resp.json().get("url")
+
+    async def get_content(self):
+        """Get the content of the file as bytes.
+
+        n.b. the whole object is held in memory. For large objects, prefer
+        :meth:`iter_content` or :meth:`download_to`.
+        """
+        url = await self.get_download_link()
+        # Auth header must **NOT** be attached to the download link obtained, or we will get 401
+        send = lambda: self.client.transfer_http.get(url)
+        resp = await self.client.send_with_retries("GET", send)
+        _check_status(resp)
+        return resp.content
+
+    async def iter_content(self, chunk_size: int=DEFAULT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        """Iterate over the content of the file, `chunk_size` bytes at a time.
+
+        Only one chunk is held in memory at any time.
+        """
+        url = await self.get_download_link()
+        async with self.client.stream('GET', url, http=self.client.transfer_http) as resp:
+            async for chunk in resp.aiter_bytes(chunk_size):
+                yield chunk
+
+    async def download_to(self, path_or_fileobj: Union[str, os.PathLike, IO[bytes]], *, chunk_size: int=DEFAULT_CHUNK_SIZE) -> int:
+        """Stream the content of the file to a local path, or to a writable binary file object.
+
+        Returns the number of bytes written.
+        """
+        return await _write_chunks(self.iter_content(chunk_size), path_or_fileobj)
+
+    async def open_mmap(self, *, chunk_size: int=DEFAULT_CHUNK_SIZE):
+        """Map the content of the file in memory, read-only, see :meth:`DataproxyFile.open_mmap`"""
+        return await _open_mmap(self.iter_content(chunk_size))
+
+    @on_401_raise_unauthorized("Unauthorized")
+    async def delete(self):
+        resp = await self.client.delete(f"/v1/{self.bucket.target}/{self.bucket.dataproxy_entity_name}/{self.name}")
+        json_resp = resp.json()
+        if "failures" in json_resp:
+            assert len(json_resp.get("failures")) == 0
+        else:
+            assert "has been removed" in json_resp["detail"]
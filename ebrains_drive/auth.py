@@ -0,0 +1,110 @@
+import base64
+import binascii
+import json
+import logging
+import threading
+import time
+from ebrains_drive.exceptions import TokenExpired
+
+# Seconds before its expiry at which a token is renewed
+DEFAULT_REFRESH_MARGIN = 60
+IAM_CLIENT_ID = 'ebrains-drive'
+
+logger = logging.getLogger(__name__)
+
+
+def token_expiry(token: str):
+    """Expiry (seconds since the epoch) read from the `exp` claim of the JWT `token`,
+    or None if it is not a JWT or has no expiry"""
+    try:
+        hdr, info, sig = token.split('.')
+        # https://www.rfc-editor.org/rfc/rfc7519#section-2
+        exp = json.loads(base64.urlsafe_b64decode(info + '==').decode('utf-8')).get('exp')
+    except (ValueError, binascii.Error, UnicodeDecodeError, AttributeError):
+        return None
+    return exp if isinstance(exp, (int, float)) else None
+
+
+class TokenManager(object):
+    """Holds the access token of one or several clients, and renews it before it expires.
+
+    The claims of a token are decoded once, when it is set. A token is renewed
+    `refresh_margin` seconds before its expiry, with the refresh token obtained
+    along with it if any, else with the stored `username` and `password`.
+    While one thread renews it, the others keep using the still valid token.
+    Tokens which cannot be renewed (or whose renewal fails) are used until
+    they expire, after which :exc:`TokenExpired` (or the error of the
+    renewal) is raised.
+
+    The same manager can be shared by a :class:`DriveApiClient` and a
+    :class:`BucketApiClient` (`token_manager` parameter).
+
+    :param:token_url The openid-connect token endpoint
+    :param:session :class:`ebrains_drive.session.SessionManager` through which tokens are requested
+    """
+    def __init__(self, token=None, *, username=None, password=None, refresh_token=None, token_url=None,
+                 session=None, refresh_margin=DEFAULT_REFRESH_MARGIN) -> None:
+        self.username = username
+        self.password = password
+        self.token_url = token_url
+        self.session = session
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._set(token, refresh_token)
+
+    def _set(self, token, refresh_token=None):
+        self._token = token
+        self.expires_at = token_expiry(token) if token else None
+        self.refresh_token = refresh_token
+
+    @property
+    def can_refresh(self):
+        return self.token_url is not None and (
+            self.refresh_token is not None or (self.username is not None and self.password is not None))
+
+    def is_expired(self, now=None):
+        return self.expires_at is not None and (now or time.time()) >= self.expires_at
+
+    def needs_refresh(self, now=None):
+        """Whether the token is missing, or due for renewal"""
+        if self._token is None:
+            return True
+        return self.expires_at is not None and self.can_refresh and \
+            (now or time.time()) >= self.expires_at - self.refresh_margin
+
+    @property
+    def token(self) -> str:
+        """The access token, renewed first if due"""
+        if self.needs_refresh():
+            # an expired (or missing) token must be renewed before use, one still valid
+            # is renewed by a single thread while the others keep on using it
+            if self._lock.acquire(blocking=self._token is None or self.is_expired()):
+                try:
+                    if self.needs_refresh():
+                        self.refresh()
+                except Exception:
+                    # e.g. IAM briefly unreachable: the token is renewed on a later call
+                    if self._token is None or self.is_expired():
+                        raise
+                    logger.warning("Could not renew the access token, using it until it expires", exc_info=True)
+                finally:
+                    self._lock.release()
+        if self.is_expired():
+            raise TokenExpired
+        return self._token
+
+    def refresh(self):
+        """Request a new access token"""
+        if self.refresh_token is not None:
+            data = {'grant_type': 'refresh_token', 'refresh_token': self.refresh_token}
+        elif self.username is not None and self.password is not None:
+            data = {'grant_type': 'password', 'username': self.username, 'password': self.password}
+        else:
+            raise TokenExpired
+        response = self.session.post(self.token_url, auth=(IAM_CLIENT_ID, ''), data=data)
+        resp_json = response.json()
+        if 'access_token' not in resp_json and data['grant_type'] == 'refresh_token' and self.password is not None:
+            # the refresh token has expired too
+            self.refresh_token = None
+            return self.refresh()
+        self._set(resp_json['access_token'], resp_json.get('refresh_token'))
@@ -1,19 +1,43 @@
-from typing import Iterable
-import requests
-from ebrains_drive.exceptions import DoesNotExist, InvalidParameter, UpstreamAPIException
-from ebrains_drive.files import DataproxyFile
+import hashlib
+import json
+import math
+import os
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from ebrains_drive.exceptions import ClientHttpError, DoesNotExist, InvalidParameter, UpstreamAPIException
+from ebrains_drive.files import DataproxyDir, DataproxyFile
 from ebrains_drive.utils import on_401_raise_unauthorized
+from ebrains_drive.transfer import DEFAULT_MAX_WORKERS, STATE_SUFFIX, FileSlice, TransferState, split_ranges, swift_object_path
 from io import IOBase
 from typing import Union
 
-class Bucket(object):
+def _from_listing(bucket, obj: Dict[str, Any], file_class):
+    """The `file_class` object, or :class:`DataproxyDir`, of the object json `obj` of a listing of `bucket`"""
+    if "subdir" in obj:
+        return DataproxyDir(bucket.client, bucket, obj["subdir"])
+    return file_class.from_json(bucket.client, bucket, obj)
 
-    LIMIT = 100
 
-    """
-    A dataproxy bucket
+class DeleteResult(namedtuple('DeleteResult', ['deleted', 'failed'])):
+    """Outcome of a bulk delete: the list of the `deleted` object names, and a
+    dict of the exceptions raised for the objects which could not be, by name."""
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return not self.failed
+
+
+class _BucketBase(object):
+    """Fields of a dataproxy bucket, shared by :class:`Bucket` and
+    :class:`ebrains_drive.aio.AsyncBucket`.
     n.b. for a dataset bucket, role & is_public may be None
     """
+
+    LIMIT = 100
+
     def __init__(self, client, name: str, objects_count: int, bytes: int, last_modified: str, is_public: bool = None, is_initialized: bool = None, role: str = None, *, public: bool= False, target: str='buckets', dataset_id: str=None) -> None:
         if target != 'buckets' and target != 'datasets':
             raise InvalidParameter(f'Init Buckets exception: target can be left unset, but if set, must either be buckets or datasets')
@@ -36,54 +60,345 @@ class Bucket(object):
         self.dataproxy_entity_name = dataset_id or name
 
     @classmethod
-    def from_json(cls, client, bucket_json, *, public:bool = False, target: str='buckets', dataset_id=None) -> 'Bucket':
+    def from_json(cls, client, bucket_json, *, public:bool = False, target: str='buckets', dataset_id=None):
         return cls(client, **bucket_json, public=public, target=target, dataset_id=dataset_id)
 
     def __str__(self):
         return "(name='{}')".format(self.name)
 
+
+class Bucket(_BucketBase):
+
+    # Local files larger than this are uploaded in segments
+    MULTIPART_THRESHOLD = 1024 * 1024 * 1024
+    SEGMENT_SIZE = 128 * 1024 * 1024
+    # Maximum number of segments of a static large object manifest (Swift default)
+    MAX_SEGMENTS = 1000
+    # Prefix of the objects holding the segments of segmented uploads
+    SEGMENT_PREFIX = ".segments"
+
+    """
+    A dataproxy bucket
+    """
+
     def __repr__(self):
         return "ebrains_drive.bucket.Bucket(name='{}')".format(self.name)
 
+    def _list_page(self, prefix: str, marker: str, page_size: int, delimiter: str=None) -> List[Dict[str, Any]]:
+        resp = self.client.get(f"/v1/{self.target}/{self.dataproxy_entity_name}", params={
+            'limit': page_size,
+            'marker': marker,
+            'prefix': prefix,
+            'delimiter': delimiter,
+        })
+        return resp.json().get("objects", [])
+
     @on_401_raise_unauthorized("Unauthorized.")
-    def ls(self, prefix: str=None) -> Iterable[DataproxyFile]:
+    def ls_pages(self, prefix: str=None, *, delimiter: str=None, page_size: int=None, prefetch: bool=True) -> Iterator[List[Dict[str, Any]]]:
+        """Iterate over the listing of the bucket one page (list of object json) at a time.
+
+        :param:delimiter If set, the objects whose name contains `delimiter`
+            after `prefix` are grouped in a `{"subdir": <common prefix>}` entry
+        :param:page_size Number of objects per request (default :attr:`LIMIT`)
+        :param:prefetch Fetch the next page in the background while the
+            current one is being consumed
+        """
+        page_size = page_size or self.LIMIT
         marker = None
-        visited_name = set()
-        while True:
-            resp = self.client.get(f"/v1/{self.target}/{self.dataproxy_entity_name}", params={
-                'limit': self.LIMIT,
-                'marker': marker,
-                'prefix': prefix
-            })
-            objects = resp.json().get("objects", [])
-            if len(objects) == 0:
-                break
-
-            for obj in objects:
-
-                yield DataproxyFile.from_json(self.client, self, obj)
-                marker = obj.get("name")
-
-                if marker in visited_name:
-                    raise RuntimeError(f"Bucket.ls error: hash {marker} has already been visited.")
-                visited_name.add(marker)
-        return
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        try:
+            page = self._list_page(prefix, marker, page_size, delimiter)
+            while len(page) > 0:
+                for obj in page:
+                    name = obj.get("name", obj.get("subdir"))
+                    # the listing is sorted: a name repeating the last one means the server loops
+                    if name == marker:
+                        raise RuntimeError(f"Bucket.ls error: hash {marker} has already been visited.")
+                    marker = name
+
+                if executor is None:
+                    yield page
+                    page = self._list_page(prefix, marker, page_size, delimiter)
+                else:
+                    next_page = executor.submit(self._list_page, prefix, marker, page_size, delimiter)
+                    yield page
+                    page = next_page.result()
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False)
+
+    def _from_listing(self, obj: Dict[str, Any]) -> Union[DataproxyFile, DataproxyDir]:
+        return _from_listing(self, obj, DataproxyFile)
+
+    @on_401_raise_unauthorized("Unauthorized.")
+    def ls(self, prefix: str=None, *, delimiter: str=None, page_size: int=None, prefetch: bool=True) -> Iterable[Union[DataproxyFile, DataproxyDir]]:
+        """Iterate over the objects of the bucket (whose name start with `prefix`).
+
+        With a `delimiter` (e.g. "/"), only the objects right "under" `prefix`
+        are listed, along with :class:`DataproxyDir` pseudo-directories for
+        the common prefixes of the others.
+
+        See :meth:`ls_pages` for `page_size` and `prefetch`.
+        """
+        for page in self.ls_pages(prefix, delimiter=delimiter, page_size=page_size, prefetch=prefetch):
+            for obj in page:
+                yield self._from_listing(obj)
+
+    def inventory(self, prefix: str=None, *, page_size: int=1000, prefetch: bool=True) -> 'ObjectInventory':
+        """List all the objects of the bucket (whose name start with `prefix`)
+        into a compact, columnar :class:`ebrains_drive.inventory.ObjectInventory`."""
+        from ebrains_drive.inventory import ObjectInventory
+
+        inventory = ObjectInventory(self.client, self)
+        for page in self.ls_pages(prefix, page_size=page_size, prefetch=prefetch):
+            for obj in page:
+                inventory.append(obj)
+        return inventory
+
+    def walk(self, prefix: str="", *, delimiter: str="/", page_size: int=None, max_workers: int=DEFAULT_MAX_WORKERS) -> Iterator[Tuple[str, List[DataproxyDir], List[DataproxyFile]]]:
+        """Walk the pseudo-directories of the bucket breadth-first, from `prefix`.
+
+        Yields a `(prefix, dirs, files)` tuple for each pseudo-directory, the
+        listings of the pseudo-directories of the same depth being fetched
+        concurrently by up to `max_workers` threads.
+        """
+        def list_dir(dir_prefix):
+            dirs, files = [], []
+            for entry in self.ls(dir_prefix or None, delimiter=delimiter, page_size=page_size, prefetch=False):
+                (dirs if isinstance(entry, DataproxyDir) else files).append(entry)
+            return dir_prefix, dirs, files
+
+        level = [prefix]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while level:
+                next_level = []
+                for dir_prefix, dirs, files in executor.map(list_dir, level):
+                    yield dir_prefix, dirs, files
+                    next_level.extend(d.name for d in dirs)
+                level = next_level
 
     @on_401_raise_unauthorized("Unauthorized")
     def get_file(self, name: str) -> DataproxyFile:
+        """Get the object `name`, in a single request.
+
+        Raises :exc:`DoesNotExist` if there is no such object.
+        """
         name = name.lstrip("/")
-        for file in self.ls(prefix=name):
-            if file.name == name:
-                return file
-        raise DoesNotExist(f"Cannot find {name}.")
+        # the listing is sorted, so `name` would be the first object starting with `name`
+        objects = self._list_page(name, None, 1)
+        if not objects or objects[0].get("name") != name:
+            raise DoesNotExist(f"Cannot find {name}.")
+        return DataproxyFile.from_json(self.client, self, objects[0])
+
+    def get_files(self, names: Iterable[str], *, max_workers: int=DEFAULT_MAX_WORKERS) -> List[Optional[DataproxyFile]]:
+        """Get the objects `names`, looked up concurrently by up to `max_workers` threads.
+
+        Returns a list of :class:`DataproxyFile`, in the order of `names`, with
+        None for the names of the objects which do not exist.
+        """
+        def get_file(name):
+            try:
+                return self.get_file(name)
+            except DoesNotExist:
+                return None
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(get_file, names))
     
+    def _delete_object(self, name: str):
+        try:
+            resp = self.client.delete(f"/v1/{self.target}/{self.dataproxy_entity_name}/{name}")
+        except ClientHttpError as e:
+            if e.code == 404:
+                # already deleted
+                return
+            raise
+        failures = resp.json().get("failures")
+        if failures:
+            raise UpstreamAPIException(f"Failed to delete {name}: {failures}")
+
     @on_401_raise_unauthorized("Unauthorized")
-    def upload(self, filelike: Union[str, IOBase], filename: str, **kwargs):
-        filename = filename.lstrip("/")
+    def delete_many(self, names: Iterable[str]=None, *, prefix: str=None, page_size: int=1000, max_workers: int=DEFAULT_MAX_WORKERS, delete_segments: bool=False) -> DeleteResult:
+        """Delete the objects `names`, or all the objects whose name starts with `prefix`.
+
+        Objects are deleted in batches of `page_size`, each batch by up to
+        `max_workers` concurrent requests. Objects which do not exist count
+        as deleted. Failures do not stop the deletion of the other objects,
+        they are reported in the returned :class:`DeleteResult`.
+
+        :param:delete_segments If set, the segments of the deleted large objects
+            (see :meth:`upload_segmented`) are deleted too, and reported in the
+            result. This lists the segments of each object, one more request per object.
+        """
+        if (names is None) == (prefix is None):
+            raise InvalidParameter("Bucket.delete_many: exactly one of names and prefix must be given")
+        if names is not None:
+            names = [name.lstrip("/") for name in names]
+            batches = (names[i:i + page_size] for i in range(0, len(names), page_size))
+        else:
+            # objects are listed by marker, so deleting the listed ones does not shift the next pages
+            batches = ([obj["name"] for obj in page] for page in self.ls_pages(prefix, page_size=page_size))
+
+        def delete(name):
+            try:
+                self._delete_object(name)
+            except ClientHttpError as e:
+                if e.code == 401:
+                    raise
+                return name, e
+            except UpstreamAPIException as e:
+                return name, e
+            return name, None
+
+        result = DeleteResult([], {})
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for batch in batches:
+                for name, error in executor.map(delete, batch):
+                    if error is None:
+                        result.deleted.append(name)
+                    else:
+                        result.failed[name] = error
+        if delete_segments:
+            for name in [n for n in result.deleted if not n.startswith(self.SEGMENT_PREFIX + "/")]:
+                segments = self._delete_segments(name, max_workers=max_workers)
+                result.deleted.extend(segments.deleted)
+                result.failed.update(segments.failed)
+        return result
+
+    def _get_upload_url(self, filename: str, **kwargs) -> str:
         resp = self.client.put(f"/v1/{self.target}/{self.dataproxy_entity_name}/{filename}", **kwargs)
         upload_url = resp.json().get("url")
         if upload_url is None:
             raise UpstreamAPIException(f"Bucket.upload did not get upload url.")
+        return upload_url
+
+    @on_401_raise_unauthorized("Unauthorized")
+    def upload(self, filelike: Union[str, IOBase], filename: str, *, segment_size: int=None, multipart_threshold: int=None, max_workers: int=DEFAULT_MAX_WORKERS, resume=False, delete_segments: bool=False, **kwargs):
+        """Upload a local file (path or binary file object) as `filename`.
+
+        Local files (given by path) larger than `multipart_threshold` bytes
+        (default :attr:`MULTIPART_THRESHOLD`) are uploaded in segments, see
+        :meth:`upload_segmented`. Only segmented uploads can be resumed.
+
+        :param:delete_segments If set, the segments of a large object previously
+            stored as `filename` are deleted once a file is uploaded in a single
+            request, which lists them (one more request). Segmented uploads always
+            delete them.
+        """
+        filename = filename.lstrip("/")
+        multipart_threshold = self.MULTIPART_THRESHOLD if multipart_threshold is None else multipart_threshold
+        if not isinstance(filelike, IOBase) and os.path.isfile(filelike) and os.path.getsize(filelike) > multipart_threshold:
+            return self.upload_segmented(filelike, filename, segment_size=segment_size, max_workers=max_workers, resume=resume, **kwargs)
+
+        upload_url = self._get_upload_url(filename, **kwargs)
         filehandle = filelike if isinstance(filelike, IOBase) else open(filelike, "rb")
-        resp = requests.request("PUT", upload_url, data=filehandle, **kwargs)
+        resp = self.client.transfer_session.request("PUT", upload_url, data=filehandle, **kwargs)
         resp.raise_for_status()
+        if delete_segments:
+            self._delete_segments(filename, max_workers=max_workers)
+
+    def _segment_name(self, filename: str, upload_id: str, index: int) -> str:
+        return f"{self.SEGMENT_PREFIX}/{filename}/{upload_id}/{index:08d}"
+
+    def _upload_segment(self, path: str, segment_name: str, offset: int, length: int, max_attempts: int=3, **kwargs) -> Dict[str, Any]:
+        for attempt in range(max_attempts):
+            upload_url = self._get_upload_url(segment_name, **kwargs)
+            with FileSlice(path, offset, length) as data:
+                resp = self.client.transfer_session.request("PUT", upload_url, data=data, **kwargs)
+            if resp.ok:
+                return {
+                    "path": swift_object_path(upload_url),
+                    "etag": resp.headers.get("ETag", "").strip('"') or None,
+                    "size_bytes": length,
+                }
+        resp.raise_for_status()
+
+    def _delete_segments(self, filename: str, *, upload_id: str=None, keep_upload_id: str=None, max_workers: int=DEFAULT_MAX_WORKERS) -> DeleteResult:
+        """Delete the segments of the large object `filename`: those of the upload
+        `upload_id` only, or all but those of the upload `keep_upload_id`."""
+        prefix = f"{self.SEGMENT_PREFIX}/{filename}/" + (f"{upload_id}/" if upload_id else "")
+        names = []
+        for page in self.ls_pages(prefix, page_size=1000, prefetch=False):
+            for obj in page:
+                # not the segments of "<filename>/<other name>"
+                segment_of, segment_upload_id, _ = obj["name"][len(self.SEGMENT_PREFIX) + 1:].rsplit("/", 2)
+                if segment_of == filename and segment_upload_id != keep_upload_id:
+                    names.append(obj["name"])
+        return self.delete_many(names, max_workers=max_workers) if names else DeleteResult([], {})
+
+    def _verified_segments(self, filename: str, upload_id: str, state: TransferState):
+        """Drop from `state` the segments that are missing or differ on the server."""
+        remote = {f.name: f for f in self.ls(prefix=f"{self.SEGMENT_PREFIX}/{filename}/{upload_id}/")}
+        for index, segment in list(state.done.items()):
+            remote_file = remote.get(self._segment_name(filename, upload_id, int(index)))
+            if remote_file is None or remote_file.bytes != segment["size_bytes"] or \
+                    (segment["etag"] is not None and remote_file.hash != segment["etag"]):
+                del state.done[index]
+
+    @on_401_raise_unauthorized("Unauthorized")
+    def upload_segmented(self, path: str, filename: str, *, segment_size: int=None, max_workers: int=DEFAULT_MAX_WORKERS, resume=False, state_path=None, **kwargs):
+        """Upload the local file at `path` as `filename`, in segments uploaded concurrently.
+
+        Each segment of `segment_size` bytes (default :attr:`SEGMENT_SIZE`,
+        increased for files which would need more than :attr:`MAX_SEGMENTS`) is
+        stored as a separate object under :attr:`SEGMENT_PREFIX`, and retried on
+        its own if it fails. The segments are then assembled on the server with
+        a static large object manifest stored as `filename`. Once it is stored,
+        the segments of the previous versions of `filename` are deleted.
+
+        The segment objects are listed by :meth:`ls`, and deleted by
+        :meth:`delete_many` when they match its `prefix`. They are not deleted
+        with the object, unless `delete_segments` is passed to
+        :meth:`ebrains_drive.files.DataproxyFile.delete` or :meth:`delete_many`.
+
+        If `resume` is set, completed segments are checkpointed to a sidecar
+        file (`state_path`, default `path` + :data:`STATE_SUFFIX`). A restarted
+        upload of the same, unmodified file checks the recorded segments against
+        the server and only uploads the missing ones. Otherwise, the segments of
+        a failed upload are deleted.
+        """
+        filename = filename.lstrip("/")
+        stat = os.stat(path)
+        size = stat.st_size
+        segment_size = max(segment_size or self.SEGMENT_SIZE, math.ceil(size / self.MAX_SEGMENTS))
+
+        state = None
+        if resume:
+            identity = {"bucket": self.dataproxy_entity_name, "filename": filename, "bytes": size,
+                        "mtime": stat.st_mtime, "segment_size": segment_size}
+            # deterministic, so that a restarted upload finds its segments again
+            upload_id = hashlib.sha1(json.dumps(identity, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+            state = TransferState.load(state_path or f"{path}{STATE_SUFFIX}", identity)
+            if state.done:
+                self._verified_segments(filename, upload_id, state)
+        else:
+            upload_id = uuid.uuid4().hex
+
+        def upload_segment(index, start, end):
+            if state and state.is_done(index):
+                return state.done[str(index)]
+            segment = self._upload_segment(path, self._segment_name(filename, upload_id, index), start, end - start + 1, **kwargs)
+            if state:
+                state.mark_done(index, segment)
+            return segment
+
+        ranges = split_ranges(size, segment_size)
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(upload_segment, index, start, end) for index, (start, end) in enumerate(ranges)]
+                manifest = [future.result() for future in futures]
+
+            upload_url = self._get_upload_url(filename, **kwargs)
+            resp = self.client.transfer_session.request("PUT", upload_url, params={"multipart-manifest": "put"}, data=json.dumps(manifest), **kwargs)
+            resp.raise_for_status()
+        except Exception:
+            if not resume:
+                # nothing can use the segments of this upload any more
+                try:
+                    self._delete_segments(filename, upload_id=upload_id)
+                except Exception:
+                    pass
+            raise
+        if state:
+            state.remove()
+        self._delete_segments(filename, keep_upload_id=upload_id)
@@ -3,11 +3,28 @@ from ebrains_drive.utils import on_401_raise_unauthorized
 from ebrains_drive.bucket import Bucket
 from time import sleep
 
-class Buckets(object):
+class _BucketsBase(object):
+    """What :class:`Buckets` and :class:`ebrains_drive.aio.AsyncBuckets` share, no request made"""
+
+    # Minimum number of seconds between checks that a requested dataset access has been granted
+    ACCESS_POLL_MIN_INTERVAL = 5
 
     def __init__(self, client):
         self.client = client
 
+    def _raise_unless_access_requested(self, e: ClientHttpError, request_access: bool):
+        """Raise the error `e` of the stat of a dataset, unless it is a lack of access to be requested"""
+        if e.code != 401:
+            raise e
+        if not request_access:
+            raise Unauthorized(f"You do not have access to this dataset. If this is a private dataset, try to set request_access flag to true. We can start the procedure of requesting access for you.")
+
+    def _access_poll_interval(self, attempt_no: int) -> float:
+        return max(self.ACCESS_POLL_MIN_INTERVAL, self.client.retry_policy.backoff(attempt_no))
+
+
+class Buckets(_BucketsBase):
+
     @on_401_raise_unauthorized('401 response. Check you/your token have access right and/or the bucket name has been spelt correctly.')
     def get_bucket(self, bucket_name: str, *, public: bool=False) -> Bucket:
         """Get the specified bucket according name. If forced flag is set to True, will attempt to create the collab, if necessary.
@@ -23,15 +40,11 @@ class Buckets(object):
                 resp = self.client.get(f"/v1/datasets/{dataset_id}/stat")
                 return Bucket.from_json(self.client, resp.json(), public=public, target="datasets", dataset_id=dataset_id)
             except ClientHttpError as e:
-                if e.code != 401:
-                    raise e
-                
-                if not request_access:
-                    raise Unauthorized(f"You do not have access to this dataset. If this is a private dataset, try to set request_access flag to true. We can start the procedure of requesting access for you.")
+                self._raise_unless_access_requested(e, request_access)
                 if not request_sent:
                     self.client.post(f"/v1/datasets/{dataset_id}", expected=(200, 201))
                     request_sent = True
                     print("Request sent. Please check the mail box associated with the token.")
-                sleep(5)
                 attempt_no = attempt_no + 1
+                sleep(self._access_poll_interval(attempt_no))
                 print(f"Checking permission, attempt {attempt_no}")
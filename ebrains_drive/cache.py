@@ -0,0 +1,267 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+DEFAULT_MAX_ENTRIES = 10000
+# Seconds during which cached metadata is used without asking the server
+DEFAULT_TTL = 60
+
+# Bytes stored by a ContentCache before the least recently used contents are evicted
+DEFAULT_CONTENT_CACHE_SIZE = 10 * 1024 ** 3
+# Number of lock files of a ContentCache (keys share them)
+LOCK_STRIPES = 256
+
+CacheEntry = namedtuple('CacheEntry', ['value', 'fresh'])
+
+
+def _ancestors(path):
+    while path not in ('/', ''):
+        path = posixpath.dirname(path)
+        yield path
+
+
+class MetadataCache(object):
+    """Thread-safe LRU cache of Drive metadata, with a time to live.
+
+    Keys are `(kind, repo_id, path)` tuples: `('repo', repo_id, None)` for
+    the details of a repo, `('dir', repo_id, path)` for the `(oid,
+    dirents_json)` listing of a directory, `('file', repo_id, path)` for the
+    details of a file. Entries older than `ttl` seconds are not used as is,
+    but stale directory listings are revalidated against the `oid` of the
+    directory, which changes whenever anything below it does.
+
+    Enable it with the `metadata_cache` parameter of :class:`DriveApiClient`.
+    Mutating operations of the client invalidate the affected entries; changes
+    made by others are seen within `ttl` seconds.
+    """
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, key):
+        """Return a :class:`CacheEntry`, stale or not, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+        value, stored_at = entry
+        return CacheEntry(value, self.clock() - stored_at < self.ttl)
+
+    def get(self, key):
+        """Return the value cached for `key` if it is fresh, else None"""
+        entry = self.lookup(key)
+        return entry.value if entry is not None and entry.fresh else None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, self.clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def invalidate(self, repo_id, path=None):
+        """Drop the entries of the repo `repo_id`, or only those of `path`, of
+        what is below it, and the listings of the directories above it."""
+        with self._lock:
+            self._invalidate(repo_id, path)
+
+    def _invalidate(self, repo_id, path=None):
+        """:meth:`invalidate`, with the lock held by the caller"""
+        if path is None:
+            stale = [key for key in self._entries if key[1] == repo_id]
+        else:
+            subtree = path.rstrip('/') + '/'
+            stale = [key for key in self._entries if key[1] == repo_id and key[0] != 'repo'
+                     and (key[2] == path or key[2].startswith(subtree))]
+            stale.extend(('dir', repo_id, p) for p in _ancestors(path))
+        for key in stale:
+            self._entries.pop(key, None)
+
+    def update_listing(self, repo_id, dir_path, name, dirent_json=None):
+        """Record in the cached listing of `dir_path` (if any) that its child `name`
+        was added or replaced by `dirent_json`, or removed if None, and invalidate
+        the rest of what it affects."""
+        path = posixpath.join(dir_path, name)
+        key = ('dir', repo_id, dir_path)
+        # all in one hold of the lock: concurrent updates of the same listing must not lose each other's changes
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            self._invalidate(repo_id, path)
+            if entry is None:
+                return
+            (oid, dirents_json), stored_at = entry
+            dirents_json = [d for d in dirents_json if d['name'] != name]
+            if dirent_json is not None:
+                dirents_json.append(dirent_json)
+            # the listing keeps its age, and the now outdated oid: once stale, it is fetched again
+            self._entries[key] = ((oid, dirents_json), stored_at)
+
+
+class _FileLock(object):
+    """Exclusive lock on the file `path`, between processes and threads"""
+    def __init__(self, path):
+        self.path = path
+        self._fp = None
+
+    def __enter__(self):
+        self._fp = open(self.path, 'a+b')
+        if fcntl is not None:
+            fcntl.flock(self._fp, fcntl.LOCK_EX)
+        else:
+            self._fp.seek(0)
+            msvcrt.locking(self._fp.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *exc_info):
+        if fcntl is not None:
+            fcntl.flock(self._fp, fcntl.LOCK_UN)
+        else:
+            self._fp.seek(0)
+            msvcrt.locking(self._fp.fileno(), msvcrt.LK_UNLCK, 1)
+        self._fp.close()
+
+
+class ContentCache(object):
+    """Cache of file contents on disk, addressed by content: files are cached
+    under their object id (Drive) or hash (buckets), which change whenever
+    their content does, so a cached content is never outdated.
+
+    When more than `max_size` bytes are stored, the least recently used
+    contents are evicted.
+
+    The same `directory` can be used by several processes at once: contents
+    are written to temporary files and atomically renamed into place, so
+    readers never see partial contents; lock files keep processes from
+    downloading the same content twice, and serialize evictions.
+
+    Enable it with the `content_cache` parameter of the clients.
+    """
+    def __init__(self, directory, max_size=DEFAULT_CONTENT_CACHE_SIZE):
+        self.directory = os.fspath(directory)
+        self.max_size = max_size
+        for subdir in ('objects', 'tmp', 'locks'):
+            os.makedirs(os.path.join(self.directory, subdir), exist_ok=True)
+
+    def _object_path(self, key):
+        # keys may hold any character: files are named after their digest
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, 'objects', digest[:2], digest)
+
+    def _lock_path(self, key):
+        stripe = int(hashlib.sha1(key.encode('utf-8')).hexdigest()[:8], 16) % LOCK_STRIPES
+        return os.path.join(self.directory, 'locks', '%d.lock' % stripe)
+
+    def path(self, key):
+        """Path of the cached content of `key` (marked as recently used), or None"""
+        path = self._object_path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def fetch(self, key, iter_content):
+        """Path of the cached content of `key`, first stored from the chunks
+        yielded by `iter_content()` if it is not cached"""
+        path = self.path(key)
+        if path is not None:
+            return path
+        with _FileLock(self._lock_path(key)):
+            # another process may have stored it while we waited
+            path = self.path(key)
+            if path is None:
+                path = self._store(key, iter_content())
+        self._evict(keep=path)
+        return path
+
+    def open(self, key, iter_content):
+        """Open the cached content of `key` for reading, in binary mode (see :meth:`fetch`)"""
+        try:
+            return open(self.fetch(key, iter_content), 'rb')
+        except FileNotFoundError:
+            # evicted by another process in between
+            return open(self.fetch(key, iter_content), 'rb')
+
+    def read(self, key, iter_content):
+        """The content of `key`, from the cache (see :meth:`fetch`)"""
+        with self.open(key, iter_content) as fp:
+            return fp.read()
+
+    def _store(self, key, chunks):
+        path = self._object_path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.directory, 'tmp'))
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                for chunk in chunks:
+                    fp.write(chunk)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        return path
+
+    def _scan(self):
+        """(mtime, size, path) of the cached contents"""
+        for dirpath, _, filenames in os.walk(os.path.join(self.directory, 'objects')):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def size(self):
+        """Total size of the cached contents"""
+        return sum(size for _, size, _ in self._scan())
+
+    def _evict(self, keep=None):
+        with _FileLock(os.path.join(self.directory, 'evict.lock')):
+            entries = sorted(self._scan())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_size:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.unlink(path)
+                except OSError:
+                    # already evicted, or still open (Windows)
+                    pass
+                total -= size
+
+    def clear(self):
+        with _FileLock(os.path.join(self.directory, 'evict.lock')):
+            for _, _, path in list(self._scan()):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    # already evicted, or still open (Windows)
+                    pass
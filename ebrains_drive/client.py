@@ -1,36 +1,19 @@
 from getpass import getpass
 import requests
 from abc import ABC
-import base64
-import json
-import time
 from ebrains_drive.utils import urljoin, on_401_raise_unauthorized
-from ebrains_drive.exceptions import ClientHttpError, TokenExpired
+from ebrains_drive.exceptions import ClientHttpError
+from ebrains_drive.auth import TokenManager
+from ebrains_drive.cache import ContentCache, MetadataCache
 from ebrains_drive.repos import Repos
 from ebrains_drive.buckets import Buckets
 from ebrains_drive.file import File
+from ebrains_drive.session import DEFAULT_POOL_CONNECTIONS, DEFAULT_POOL_MAXSIZE, SessionManager
+from ebrains_drive.retry import RetryPolicy
 
-class ClientBase(ABC):
-    def __init__(self, username=None, password=None, token=None, env="") -> None:
-
-        self.username = username
-        self.password = password
-        self._token = token
-        self.server = None
-        self.session = requests.Session()
-
-        if token is None:
-            if self.username is None:
-                self.username = input("EBRAINS username: ")
-            if self.password is None:
-                self.password = getpass()
-
-            try:
-                self._get_token()
-            except KeyError:
-                print("Error: Invalid user credentials!")
-                raise
-
+class _Environment(object):
+    """URLs of the services of the EBRAINS environment `env` ('dev', 'int', or
+    '' for production), shared by the blocking and asyncio clients"""
 
     def _set_env(self, env=''):
         self.suffix = ""
@@ -43,18 +26,88 @@ class ClientBase(ABC):
 
         self.iam_host = "iam" + self.suffix + ".ebrains.eu"
         self.iam_url = "https://" + self.iam_host
-        
-    def _get_token(self):
-        response = requests.post(
-            self.iam_url+'/auth/realms/hbp/protocol/openid-connect/token',
-            auth=('ebrains-drive', ''),
-            data={
-                'grant_type':'password',
-                'username':self.username,
-                'password':self.password
-            })
-        self._token = response.json()['access_token']
-    
+        self.iam_token_url = self.iam_url + '/auth/realms/hbp/protocol/openid-connect/token'
+
+
+class _DriveEnvironment(_Environment):
+
+    def _set_env(self, env=''):
+        super()._set_env(env)
+        self.drive_url = "https://drive" + self.suffix + ".ebrains.eu"
+
+
+class ClientBase(_Environment, ABC):
+    """Base of the api clients.
+
+    HTTP connections are pooled, per host, in thread-safe sessions: one for the
+    api, another one for the transfers to/from presigned object store urls
+    (see :class:`ebrains_drive.session.SessionManager` for the pool options).
+    Call :meth:`close` (or use the client as a context manager) to release them.
+
+    Transient failures of all requests are retried according to `retry_policy`
+    (default: :class:`ebrains_drive.retry.RetryPolicy` defaults; pass
+    :data:`ebrains_drive.retry.NO_RETRY` to disable).
+
+    The access token is held by `token_manager`, which renews it before it
+    expires when it can (see :class:`ebrains_drive.auth.TokenManager`). Pass
+    the `token_manager` of another client to share its token.
+
+    File contents are read from (and stored into) `content_cache` if given, a
+    :class:`ebrains_drive.cache.ContentCache` or the path of its directory.
+    """
+    def __init__(self, username=None, password=None, token=None, env="", *, pool_connections=DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize=DEFAULT_POOL_MAXSIZE, pool_block=False, max_retries=0, keep_alive=True,
+                 retry_policy: RetryPolicy=None, token_manager: TokenManager=None, content_cache=None) -> None:
+
+        self.username = username
+        self.password = password
+        self.server = None
+        self.retry_policy = retry_policy or RetryPolicy()
+        pool_options = dict(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block,
+                            max_retries=max_retries, keep_alive=keep_alive, retry_policy=self.retry_policy)
+        self.sessions = SessionManager(**pool_options)
+        self.transfer_sessions = SessionManager(**pool_options)
+        if content_cache is not None and not isinstance(content_cache, ContentCache):
+            content_cache = ContentCache(content_cache)
+        self.content_cache = content_cache
+
+        if token_manager is None:
+            if token is None:
+                if self.username is None:
+                    self.username = input("EBRAINS username: ")
+                if self.password is None:
+                    self.password = getpass()
+            token_manager = TokenManager(token, username=self.username, password=self.password,
+                                         token_url=self.iam_token_url, session=self.sessions)
+        self.token_manager = token_manager
+
+        try:
+            self.token_manager.token
+        except KeyError:
+            print("Error: Invalid user credentials!")
+            raise
+
+    @property
+    def session(self) -> requests.Session:
+        """Session of the calling thread, for api requests"""
+        return self.sessions.session
+
+    @property
+    def transfer_session(self) -> requests.Session:
+        """Session of the calling thread, for unauthenticated requests to presigned urls"""
+        return self.transfer_sessions.session
+
+    def close(self):
+        """Close the pooled connections of this client"""
+        self.sessions.close()
+        self.transfer_sessions.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
     def get(self, *args, **kwargs):
         return self.send_request('GET', *args, **kwargs)
 
@@ -75,12 +128,13 @@ class ClientBase(ABC):
             url = self.server.rstrip('/') + '/' + url.lstrip('/')
 
         headers = kwargs.get('headers', {})
-        headers.setdefault('Authorization', 'Bearer ' + self._token)
+        headers.setdefault('Authorization', 'Bearer ' + self.token_manager.token)
         kwargs['headers'] = headers
 
         expected = kwargs.pop('expected', 200)
         if not hasattr(expected, '__iter__'):
             expected = (expected, )
+        # `idempotent` (optional) tells the retry policy whether the request can be sent again
         resp = self.session.request(method, url, *args, **kwargs)
         if resp.status_code not in expected:
             msg = 'Expected %s, but get %s' % \
@@ -89,13 +143,20 @@ class ClientBase(ABC):
 
         return resp
 
-class DriveApiClient(ClientBase):
+class DriveApiClient(_DriveEnvironment, ClientBase):
     """Wraps seafile web api"""
-    def __init__(self, username=None, password=None, token=None, env=""):
+    def __init__(self, username=None, password=None, token=None, env="", *, metadata_cache=None, **kwargs):
         """Wraps various basic operations to interact with seahub http api.
+
+        :param:metadata_cache :class:`ebrains_drive.cache.MetadataCache` of the
+            repos, dir listings and file details, or True for one with default
+            settings. Disabled by default.
+
+        Other keyword arguments configure the connection pools, see :class:`ClientBase`.
         """
         self._set_env(env)
-        super().__init__(username, password, token, env)
+        super().__init__(username, password, token, env, **kwargs)
+        self.metadata_cache = MetadataCache() if metadata_cache is True else metadata_cache
 
         self.server = self.drive_url
 
@@ -103,10 +164,6 @@ class DriveApiClient(ClientBase):
         self.groups = Groups(self)
         self.file = File(self)
 
-    def _set_env(self, env=''):
-        super()._set_env(env)
-        self.drive_url = "https://drive" + self.suffix + ".ebrains.eu"
-
     def get_drive_url(self):
         return self.drive_url
 
@@ -129,17 +186,21 @@ class DriveApiClient(ClientBase):
 _I_AM_A_PUBLIC_BUCKET = "_I_AM_A_PUBLIC_BUCKET"
 class BucketApiClient(ClientBase):
 
-    def __init__(self, username=None, password=None, token=_I_AM_A_PUBLIC_BUCKET, env="") -> None:
+    def __init__(self, username=None, password=None, token=_I_AM_A_PUBLIC_BUCKET, env="", **kwargs) -> None:
         if env != "":
             raise NotImplementedError("non prod environment for dataproxy access has not yet been implemented.")
         self._set_env(env)
         
-        super().__init__(username, password, token, env)
+        super().__init__(username, password, token, env, **kwargs)
 
         self.server = "https://data-proxy.ebrains.eu/api"
 
         self.buckets = Buckets(self)
 
+    @property
+    def is_public_client(self):
+        return self.token_manager.token == _I_AM_A_PUBLIC_BUCKET
+
     @on_401_raise_unauthorized("Failed. Note: BucketApiClient.create_new needs to have clb.drive:write as a part of scope.")
     def create_new(self, bucket_name: str, title=None, description="Created by ebrains_drive"):
         # attempt to create new collab
@@ -163,18 +224,7 @@ class BucketApiClient(ClientBase):
     
     def send_request(self, method: str, url: str, *args, **kwargs):
 
-        if self._token != _I_AM_A_PUBLIC_BUCKET:
-            hdr, info, sig = self._token.split('.')
-            info_json = base64.b64decode(info + '==').decode('utf-8')
-
-            # https://www.rfc-editor.org/rfc/rfc7519#section-2
-            exp_utc_seconds = json.loads(info_json).get('exp')
-            now_tc_seconds = time.time()
-
-            if now_tc_seconds > exp_utc_seconds:
-                raise TokenExpired
-            
-        if self._token == _I_AM_A_PUBLIC_BUCKET:
+        if self.is_public_client:
             headers = kwargs.get("headers", {})
             headers["Authorization"] = None
             kwargs["headers"] = headers
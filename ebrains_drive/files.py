@@ -1,16 +1,60 @@
+import collections
 import io
+import mmap
 import os
 import posixpath
 import re
+import tempfile
 import time
-from typing import Any, Dict
-import requests
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, quote, urlsplit
+from typing import IO, Any, Dict, Iterator, Union
 from tqdm import tqdm
 from ebrains_drive.utils import querystr, on_401_raise_unauthorized
+from ebrains_drive.exceptions import ClientHttpError, DoesNotExist, OperationError
+from ebrains_drive.transfer import DEFAULT_CHUNK_SIZE, DEFAULT_MAX_WORKERS, DEFAULT_PART_SIZE, EXPIRED_LINK_STATUS, STATE_SUFFIX, \
+    ChunkStream, ExpiringLink, RangeReader, TransferResult, TransferState, download_ranges, is_pathlike, path_selected, preallocate, \
+    split_ranges
 
 # Note: only files and dirs with contents is assigned an ID; else their ID is set to all zeros
 ZERO_OBJ_ID = '0000000000000000000000000000000000000000'
 
+def _open_mmap(content_cache, key, iter_content):
+    """Read-only memory map of a local copy of a content: the cached one if
+    there is a content cache, else an anonymous temporary file."""
+    if content_cache is not None and key is not None:
+        fp = content_cache.open(key, iter_content)
+    else:
+        fp = tempfile.TemporaryFile()
+        for chunk in iter_content():
+            fp.write(chunk)
+        fp.flush()
+    with fp:
+        return _mmap_readonly(fp)
+
+def _mmap_readonly(fp):
+    if os.fstat(fp.fileno()).st_size == 0:
+        # an empty file cannot be mapped
+        return memoryview(b'')
+    # the map keeps the file open (and a temporary file alive) until it is closed
+    return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+def _load_dirent(repo, dir_path, dirent_json, file_class, dir_class):
+    """The `file_class` or `dir_class` object of the entry `dirent_json` of the listing of `dir_path`"""
+    path = posixpath.join(dir_path, dirent_json['name'])
+    if dirent_json['type'] == 'file':
+        return file_class(repo, path, dirent_json['id'], dirent_json['type'], dirent_json['size'])
+    else:
+        return dir_class(repo, path, dirent_json['id'], dirent_json['type'], 0)
+
+def _created_path(resp, path):
+    """The path of the entry created at `path`, from the `Location` of the response
+    `resp`: the server renames it (e.g. "name (1)") if `path` already exists"""
+    location = resp.headers.get('Location')
+    if not location:
+        return path
+    return parse_qs(urlsplit(location).query).get('p', [path])[0]
+
 class _SeafDirentBase(object):
     """Base class for :class:`SeafFile` and :class:`SeafDir`.
 
@@ -39,10 +83,21 @@ class _SeafDirentBase(object):
     def list_revisions(self):
         pass
 
+    @property
+    def _cache(self):
+        """The metadata cache of the client, if enabled"""
+        return self.client.metadata_cache
+
+    def _invalidate(self, path, repo_id=None):
+        if self._cache is not None:
+            self._cache.invalidate(repo_id or self.repo.id, path)
+
     def delete(self):
         suffix = 'dir' if self.isdir else 'file'
         url = '/api2/repos/%s/%s/' % (self.repo.id, suffix) + querystr(p=self.path)
         resp = self.client.delete(url)
+        if self._cache is not None:
+            self._cache.update_listing(self.repo.id, posixpath.dirname(self.path), self.name)
         return resp
 
     def rename(self, newname):
@@ -52,6 +107,7 @@ class _SeafDirentBase(object):
         url = '/api2/repos/%s/%s/' % (self.repo.id, suffix) + querystr(p=self.path, reloaddir='true')
         postdata = {'operation': 'rename', 'newname': newname}
         resp = self.client.post(url, data=postdata)
+        self._invalidate(self.path)
         succeeded = resp.status_code == 200
         if succeeded:
             if self.isdir:
@@ -85,6 +141,7 @@ class _SeafDirentBase(object):
 
         dirent_type = 'dir' if self.isdir else 'file'
         resp = self._copy_move_task('copy', dirent_type, dst_dir, dst_repo_id)
+        self._invalidate(posixpath.join(dst_dir, self.name), dst_repo_id)
         return resp.status_code == 200
 
     def moveTo(self, dst_dir, dst_repo_id=None):
@@ -95,6 +152,8 @@ class _SeafDirentBase(object):
 
         dirent_type = 'dir' if self.isdir else 'file'
         resp = self._copy_move_task('move', dirent_type, dst_dir, dst_repo_id)
+        self._invalidate(self.path)
+        self._invalidate(posixpath.join(dst_dir, self.name), dst_repo_id)
         succeeded = resp.status_code == 200
         if succeeded:
             new_repo = self.client.repos.get_repo(dst_repo_id)
@@ -121,11 +180,42 @@ class _SeafDirentBase(object):
 class SeafDir(_SeafDirentBase):
     isdir = True
 
+    # Chunk size of resumable uploads
+    RESUMABLE_CHUNK_SIZE = 8 * 1024 * 1024
+
     def __init__(self, *args, **kwargs):
         super(SeafDir, self).__init__(*args, **kwargs)
         self.entries = None
         self.entries = kwargs.pop('entries', None)
 
+    @property
+    def entries(self):
+        """The loaded entries of this dir (None if not loaded), see :meth:`ls`"""
+        return self._entries
+
+    @entries.setter
+    def entries(self, entries):
+        self._entries = entries
+        # name -> dirent, and entity type -> dirents, indexes of the entries
+        self._index = None if entries is None else {e.name: e for e in entries}
+        self._by_type = {}
+
+    def _add_entry(self, dirent):
+        """Add (or replace) `dirent` to the loaded entries, if any"""
+        if self._entries is None:
+            return
+        if dirent.name in self._index:
+            self._remove_entries([dirent.name])
+        self._entries.append(dirent)
+        self._index[dirent.name] = dirent
+        self._by_type.pop(dirent.type, None)
+
+    def _remove_entries(self, names):
+        """Remove the entries `names` from the loaded entries, if any"""
+        names = {name for name in names if self._index is not None and name in self._index}
+        if names:
+            self.entries = [e for e in self._entries if e.name not in names]
+
     def ls(self, entity_type=None, force_refresh=True):
         """List the entries in this dir.
 
@@ -137,7 +227,9 @@ class SeafDir(_SeafDirentBase):
             self.load_entries()
 
         if entity_type:
-            return [x for x in self.entries if x.type == entity_type]
+            if entity_type not in self._by_type:
+                self._by_type[entity_type] = [x for x in self.entries if x.type == entity_type]
+            return self._by_type[entity_type]
         else:
             return self.entries
 
@@ -153,77 +245,288 @@ class SeafDir(_SeafDirentBase):
 
     def create_empty_file(self, name):
         """Create a new empty file in this dir.
-        Return a :class:`SeafFile` object of the newly created file.
+        Return a :class:`SeafFile` object of the newly created file, see
+        :meth:`mkdir` for its name.
         """
         # TODO: file name validation
         path = posixpath.join(self.path, name)
-        url = '/api2/repos/%s/file/' % self.repo.id + querystr(p=path, reloaddir='true')
+        url = '/api2/repos/%s/file/' % self.repo.id + querystr(p=path)
         postdata = {'operation': 'create'}
-        resp = self.client.post(url, data=postdata)
-        self.id = resp.headers['oid']
-        self.load_entries(resp.json())
-        return SeafFile(self.repo, path, ZERO_OBJ_ID, "file", 0)
-
-    def check_exists(self, name, entity_type=None):
+        resp = self.client.post(url, data=postdata, expected=(200, 201))
+        return self._created(SeafFile(self.repo, _created_path(resp, path), ZERO_OBJ_ID, "file", 0))
+
+    def _created(self, dirent):
+        """Record the newly created child `dirent` in the loaded entries, and the cache"""
+        if self._cache is not None:
+            self._cache.update_listing(self.repo.id, self.path, dirent.name, {
+                'type': dirent.type, 'name': dirent.name, 'id': dirent.id, 'size': dirent.size})
+        self._add_entry(dirent)
+        return dirent
+
+    def check_exists(self, name, entity_type=None, force_refresh=True):
         """Check if an entity with specified name exists in current directory
         Note: seafile doesn't allow even a sub-directory and file,
               within the same directory, to have the same name
+
+        :param:force_refresh If False, the loaded entries (if any) are used
+            instead of listing the dir again
+
+        Return the entity, or False.
+        """
+        return self.check_exists_many([name], entity_type, force_refresh)[name]
+
+    def check_exists_many(self, names, entity_type=None, force_refresh=True):
+        """Check, from a single listing, which of `names` exist in current directory.
+
+        Return a dict of the entities (or False for those which do not exist), by name.
         """
-        entity_list = self.ls(entity_type=entity_type, force_refresh=True)
-        for e in entity_list:
-            if e.name == name:
-                return e
-        return False
+        self.ls(force_refresh=force_refresh)
+        found = {}
+        for name in names:
+            e = self._index.get(name)
+            found[name] = e if e is not None and (entity_type is None or e.type == entity_type) else False
+        return found
+
+    def _check_exists_before_create(self, name):
+        """:meth:`check_exists` from the loaded entries, if any. An entry found
+        there is confirmed by listing the dir again: it may have been deleted
+        since, e.g. with its own :meth:`delete`, which leaves the entries of
+        this dir as they are."""
+        loaded = self.entries is not None
+        entity_obj = self.check_exists(name, force_refresh=not loaded)
+        if entity_obj and loaded:
+            entity_obj = self.check_exists(name)
+        return entity_obj
 
     def mkdir(self, name):
         """Create a new sub folder right under this dir.
 
-        Return a :class:`SeafDir` object of the newly created sub folder.
+        Return a :class:`SeafDir` object of the newly created sub folder. If
+        `name` was created by someone else in the meantime, the server names
+        the new folder differently (e.g. "name (1)"), as does the returned object.
         """
         # check if entity with same name already exists
-        if self.check_exists(name):
+        if self._check_exists_before_create(name):
             raise FileExistsError("File/directory with name = `{}` already exists in current directory!".format(name))
 
         path = posixpath.join(self.path, name)
-        url = '/api2/repos/%s/dir/' % self.repo.id + querystr(p=path, reloaddir='true')
+        url = '/api2/repos/%s/dir/' % self.repo.id + querystr(p=path)
         postdata = {'operation': 'mkdir'}
-        resp = self.client.post(url, data=postdata)
-        self.id = resp.headers['oid']
-        self.load_entries(resp.json())
-
-        # fetch and return created directory object
-        return SeafDir(self.repo, path, ZERO_OBJ_ID, "dir")
+        resp = self.client.post(url, data=postdata, expected=(200, 201))
+        return self._created(SeafDir(self.repo, _created_path(resp, path), ZERO_OBJ_ID, "dir"))
     
+    # Bounds (in seconds) of the interval between polls of the zip progress
+    ZIP_POLL_INTERVAL = (0.2, 5)
+
     def download(self, name=None):
         """Download the entire contents of a directory as a zip file
 
         :param:name The name of the downloaded zip file. 
             If None, the name of the directory (or repo name in case of root directory) would be used.
         
+        The zip is built on the server, and streamed to disk once ready. For
+        large directories, see :meth:`download_tree`.
+
         Returns a dict in following format:
         {'zipped': NUM, 'total': NUM, 'failed': NUM, 'failed_reason': '', 'canceled': NUM}
         """
         download_token = self._get_download_token()
         url = '/api/v2.1/query-zip-progress/?token=%s' % (download_token)
-        wait = True
-        while wait:
+        interval, max_interval = self.ZIP_POLL_INTERVAL
+        while True:
             resp = self.client.get(url).json()
             if resp["total"] == resp["zipped"] + resp["failed"] + resp["canceled"]:
-                wait = False
-            else:
-                time.sleep(1)
+                break
+            time.sleep(interval)
+            interval = min(interval * 2, max_interval)
         if resp["total"] != resp["zipped"]:
             raise Exception(resp["failed_reason"]) 
         url = '%s/seafhttp/zip/%s' % (self.client.server, download_token)
-        zip_data = self.client.get(url).content
         if name:
             name = name if name.endswith(".zip") else name + ".zip"
         else:
             name = '%s.zip' % (self.repo.name) if (self.path == "/") else '%s.zip' % (self.path.split("/")[-1])
-        with open(name, 'wb') as f:
-            f.write(zip_data)
+        with self.client.get(url, stream=True) as zip_resp, open(name, 'wb') as f:
+            for chunk in zip_resp.iter_content(DEFAULT_CHUNK_SIZE):
+                f.write(chunk)
         return resp
 
+    # Bounds (in seconds) of the interval between polls of the progress of copy/move tasks
+    TASK_POLL_INTERVAL = (0.2, 5)
+
+    def copy_items(self, items, dst_dir, dst_repo_id=None):
+        """Copy several children of this dir to the dir `dst_dir` (also of a
+        different repo) in a single task.
+
+        :param:items Names or :class:`SeafFile`/:class:`SeafDir` objects of children of this dir
+
+        Return the list of the copies. Note that the server renames the copies
+        which conflict with an existing name, which is not reflected here.
+        """
+        dirents, dst_repo = self._copy_move_items('copy', items, dst_dir, dst_repo_id)
+        for d in dirents:
+            self._invalidate(posixpath.join(dst_dir, d.name), dst_repo.id)
+        return [type(d)(dst_repo, posixpath.join(dst_dir, d.name), d.id, d.type, d.size) for d in dirents]
+
+    def move_items(self, items, dst_dir, dst_repo_id=None):
+        """Move several children of this dir to the dir `dst_dir` (also of a
+        different repo) in a single task.
+
+        :param:items Names or :class:`SeafFile`/:class:`SeafDir` objects of children of this dir
+
+        Return the list of the moved objects, which are updated in place
+        (the objects passed in `items` included) without requesting them again.
+        The entries of the moved dirs are unloaded.
+        """
+        dirents, dst_repo = self._copy_move_items('move', items, dst_dir, dst_repo_id)
+        for dirent in dirents:
+            self._invalidate(dirent.path)
+            self._invalidate(posixpath.join(dst_dir, dirent.name), dst_repo.id)
+            dirent.repo = dst_repo
+            dirent.path = posixpath.join(dst_dir, dirent.name)
+            if dirent.isdir:
+                dirent.entries = None
+        self._remove_entries([d.name for d in dirents])
+        return dirents
+
+    def _children(self, items):
+        dirents = []
+        for item in items:
+            if isinstance(item, _SeafDirentBase):
+                if posixpath.dirname(item.path) != self.path:
+                    raise ValueError("{} is not in {}".format(item.path, self.path))
+                dirents.append(item)
+                continue
+            if self.entries is None:
+                self.load_entries()
+            if item not in self._index:
+                raise DoesNotExist("{} does not exist in {}".format(item, self.path))
+            dirents.append(self._index[item])
+        return dirents
+
+    def _copy_move_items(self, operation, items, dst_dir, dst_repo_id=None):
+        dirents = self._children(items)
+        if dst_repo_id is None:
+            dst_repo_id = self.repo.id
+        if not dirents:
+            return dirents, self.repo
+        postdata = {
+            'src_repo_id': self.repo.id,
+            'src_parent_dir': self.path,
+            'src_dirents': [d.name for d in dirents],
+            'dst_repo_id': dst_repo_id,
+            'dst_parent_dir': dst_dir,
+        }
+        if dst_repo_id == self.repo.id:
+            self.client.post('/api/v2.1/repos/sync-batch-%s-item/' % operation, json=postdata)
+            return dirents, self.repo
+
+        # across repos, the items are copied by a background task
+        dst_repo = self.client.repos.get_repo(dst_repo_id)
+        resp = self.client.post('/api/v2.1/repos/async-batch-%s-item/' % operation, json=postdata)
+        self._wait_copy_move_task(resp.json()['task_id'])
+        return dirents, dst_repo
+
+    def _wait_copy_move_task(self, task_id):
+        url = '/api/v2.1/query-copy-move-progress/' + querystr(task_id=task_id)
+        interval, max_interval = self.TASK_POLL_INTERVAL
+        while True:
+            progress = self.client.get(url).json()
+            if progress.get('done') or progress.get('failed') or progress.get('canceled'):
+                break
+            time.sleep(interval)
+            interval = min(interval * 2, max_interval)
+        if progress.get('failed') or progress.get('canceled') or progress.get('successful') is False:
+            raise OperationError(progress.get('failed_reason') or 'copy/move task {} did not complete'.format(task_id))
+
+    def walk(self, max_depth=None, prune=None, onerror=None, max_workers=DEFAULT_MAX_WORKERS):
+        """Walk the tree below this directory, like :func:`os.walk` (top-down).
+
+        Yields a `(dirpath, dirs, files)` tuple for each directory, `dirs` and
+        `files` being lists of :class:`SeafDir` and :class:`SeafFile`. As with
+        :func:`os.walk`, removing directories from `dirs` before resuming the
+        iteration keeps them from being walked.
+
+        The directories are listed concurrently, by up to `max_workers` threads,
+        ahead of their being yielded.
+
+        :param:max_depth Depth below which directories are not listed (0: this directory only)
+        :param:prune Function called with each :class:`SeafDir` found; if it returns True, the directory is
+            neither yielded in `dirs` nor walked
+        :param:onerror Function called with the exception raised by the listing of a directory, which is
+            then skipped; by default the exception is raised
+        :param:max_workers Number of concurrent requests
+        """
+        def list_dir(seafdir):
+            seafdir.load_entries()
+            return seafdir
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        pending = collections.deque([(executor.submit(list_dir, self), 0)])
+        try:
+            while pending:
+                future, depth = pending.popleft()
+                try:
+                    seafdir = future.result()
+                except Exception as e:
+                    if onerror is None:
+                        raise
+                    onerror(e)
+                    continue
+                dirs = [e for e in seafdir.entries if e.isdir and not (prune and prune(e))]
+                files = [e for e in seafdir.entries if not e.isdir]
+                yield seafdir.path, dirs, files
+                if max_depth is None or depth < max_depth:
+                    pending.extend((executor.submit(list_dir, d), depth + 1) for d in dirs)
+        finally:
+            # the walk may be left early: drop the listings not started yet
+            for future, _ in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    # Number of concurrent listings of download_tree, alongside its downloads
+    TREE_LISTING_WORKERS = 4
+
+    def download_tree(self, local_dir, include=None, exclude=None, max_workers=DEFAULT_MAX_WORKERS):
+        """Download the contents of this directory into the local directory `local_dir`, recursively.
+
+        Sub directories are listed (by up to :attr:`TREE_LISTING_WORKERS`
+        threads), while the files already found are streamed to disk
+        concurrently (no zip is built on the server).
+
+        :param:include glob patterns; if given, only matching files are downloaded
+        :param:exclude glob patterns of files and directories to skip
+        :param:max_workers Number of concurrent downloads
+
+        Return a list of :class:`TransferResult`, one per selected remote file.
+        """
+        def local_path(dirent):
+            relpath = posixpath.relpath(dirent.path, self.path)
+            return os.path.join(local_dir, *relpath.split('/'))
+
+        def download_file(dirent):
+            path = local_path(dirent)
+            try:
+                dirent.download_to(path)
+                return TransferResult(path, dirent.path, dirent, None)
+            except Exception as e:
+                return TransferResult(path, dirent.path, dirent, e)
+
+        def excluded(seafdir):
+            return not path_selected(posixpath.relpath(seafdir.path, self.path), exclude=exclude)
+
+        os.makedirs(local_dir, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            downloads = []
+            # the walk lists the sub directories in a pool of its own, while the files found are downloaded
+            for _, dirs, files in self.walk(prune=excluded, max_workers=min(max_workers, self.TREE_LISTING_WORKERS)):
+                for seafdir in dirs:
+                    os.makedirs(local_path(seafdir), exist_ok=True)
+                for dirent in files:
+                    if path_selected(posixpath.relpath(dirent.path, self.path), include, exclude):
+                        downloads.append(executor.submit(download_file, dirent))
+            return [future.result() for future in downloads]
+
     def _get_download_token(self):
         if self.path == "/":
             parent_dir = "/"
@@ -254,30 +557,183 @@ class SeafDir(_SeafDirentBase):
             'file': (filename, fileobj),
             'parent_dir': self.path,
         }
-        self.client.post(upload_url, files=files)
-        return self.repo.get_file(posixpath.join(self.path, filename))
-
-    def upload_local_file(self, filepath, name=None, overwrite=False):
+        resp = self.client.post(upload_url + '?ret-json=1', files=files)
+        return self._uploaded_file(self.path, resp.json()[0])
+
+    def _uploaded_file(self, dir_path, file_json):
+        """The :class:`SeafFile` uploaded to `dir_path`, from the `ret-json` response of the upload"""
+        if self._cache is not None:
+            self._cache.update_listing(self.repo.id, dir_path, file_json['name'], {
+                'type': 'file', 'name': file_json['name'], 'id': file_json['id'], 'size': file_json['size']})
+        dirent = SeafFile(self.repo, posixpath.join(dir_path, file_json['name']), file_json['id'], "file", file_json['size'])
+        if dir_path == self.path:
+            self._add_entry(dirent)
+        return dirent
+
+    def upload_local_file(self, filepath, name=None, overwrite=False, resume=False, state_path=None):
         """Upload a file to this folder.
 
         :param:filepath The path to the local file
         :param:name The name of this new file. If None, the name of the local file would be used.
+        :param:resume If True, the file is sent in chunks of :attr:`RESUMABLE_CHUNK_SIZE`,
+            and a restarted upload of the same, unmodified file continues from the bytes
+            the server has already received. Progress is checkpointed to a sidecar file
+            (`state_path`, default `filepath` + :data:`STATE_SUFFIX`).
 
         Return a :class:`SeafFile` object of the newly uploaded file.
         """
         name = name or os.path.basename(filepath)
 
         # check if entity with same name already exists
-        entity_obj = self.check_exists(name)
+        entity_obj = self._check_exists_before_create(name)
         if entity_obj:
             if overwrite:
-                a = entity_obj.delete()
+                entity_obj.delete()
+                self._remove_entries([name])
             else:
                 raise FileExistsError("File/directory with name = `{}` already exists in current directory!".format(name))
 
+        if resume and os.path.getsize(filepath) > self.RESUMABLE_CHUNK_SIZE:
+            return self._upload_resumable(filepath, name, state_path or filepath + STATE_SUFFIX)
+
         with open(filepath, 'rb') as fp:
             return self.upload(fp, name)
 
+    def _get_uploaded_bytes(self, name):
+        """Number of bytes of an interrupted chunked upload of `name` already received by the server"""
+        url = '/api/v2.1/repos/%s/file-uploaded-bytes/' % self.repo.id + querystr(parent_dir=self.path, file_name=name)
+        return self.client.get(url).json().get('uploadedBytes', 0)
+
+    def _upload_resumable(self, filepath, name, state_path):
+        stat = os.stat(filepath)
+        size = stat.st_size
+        path = posixpath.join(self.path, name)
+        state = TransferState.load(state_path, {'repo_id': self.repo.id, 'path': path, 'bytes': size, 'mtime': stat.st_mtime})
+        # the server is the reference for what has been received, the sidecar only tells
+        # whether a previous attempt was uploading this same local file
+        offset = self._get_uploaded_bytes(name) if state.done else 0
+
+        link = ExpiringLink(self._get_upload_link)
+        with open(filepath, 'rb') as fp:
+            fp.seek(offset)
+            while offset < size:
+                chunk = fp.read(self.RESUMABLE_CHUNK_SIZE)
+                end = offset + len(chunk) - 1
+                headers = {
+                    'Content-Range': 'bytes %d-%d/%d' % (offset, end, size),
+                    'Content-Disposition': 'attachment; filename="%s"' % quote(name),
+                }
+                files = {
+                    'file': (name, chunk),
+                    'parent_dir': self.path,
+                }
+                url = link.get()
+                try:
+                    self.client.post(url + '?ret-json=1', files=files, headers=headers)
+                except ClientHttpError as e:
+                    # the link expired during the upload
+                    if e.code not in EXPIRED_LINK_STATUS:
+                        raise
+                    self.client.post(link.renew(url) + '?ret-json=1', files=files, headers=headers)
+                offset = end + 1
+                state.mark_done('offset', offset)
+        state.remove()
+        self._invalidate(path)
+        return self.repo.get_file(path)
+
+    def _mkdirs(self, path):
+        """Create the dir `path` of this repo, and its missing parents"""
+        url = '/api2/repos/%s/dir/' % self.repo.id + querystr(p=path)
+        self.client.post(url, data={'operation': 'mkdir', 'create_parents': 'true'}, expected=(200, 201))
+        self._invalidate(path)
+
+    def _upload_to(self, link, fileobj, filename, relative_path='', replace=False):
+        """Upload `fileobj` as `filename` into the sub folder `relative_path` of
+        this folder (created if missing) with the upload link held by `link`.
+
+        Return a :class:`SeafFile` object of the newly uploaded file.
+        """
+        files = {
+            'file': (filename, fileobj),
+            'parent_dir': self.path,
+        }
+        if relative_path:
+            files['relative_path'] = relative_path
+        if replace:
+            files['replace'] = '1'
+        url = link.get()
+        try:
+            resp = self.client.post(url + '?ret-json=1', files=files)
+        except ClientHttpError as e:
+            if e.code not in EXPIRED_LINK_STATUS:
+                raise
+            fileobj.seek(0)
+            resp = self.client.post(link.renew(url) + '?ret-json=1', files=files)
+        return self._uploaded_file(posixpath.join(self.path, relative_path).rstrip('/') or '/', resp.json()[0])
+
+    def upload_tree(self, local_dir, include=None, exclude=None, overwrite=False, max_workers=DEFAULT_MAX_WORKERS):
+        """Upload the contents of the local directory `local_dir` into this folder, recursively.
+
+        :param:include glob patterns; if given, only matching files are uploaded
+        :param:exclude glob patterns of files and directories to skip
+        :param:overwrite If False, files already existing remotely are not uploaded
+            and reported with a :exc:`FileExistsError`.
+        :param:max_workers Number of files uploaded concurrently
+
+        A single upload link is used for the whole tree, and remote sub folders
+        are created along with the files uploaded into them.
+
+        Return a list of :class:`TransferResult`, one per selected local file.
+        """
+        files = []
+        empty_dirs = []
+        for root, dirnames, filenames in os.walk(local_dir):
+            rel_root = os.path.relpath(root, local_dir).replace(os.sep, '/')
+            rel_root = '' if rel_root == '.' else rel_root
+            dirnames[:] = [d for d in dirnames if path_selected(posixpath.join(rel_root, d), exclude=exclude)]
+            if rel_root and not dirnames and not filenames:
+                empty_dirs.append(rel_root)
+            files.extend((rel_root, f) for f in filenames if path_selected(posixpath.join(rel_root, f), include, exclude))
+
+        def remote_dir(rel_root):
+            return posixpath.join(self.path, rel_root) if rel_root else self.path
+
+        def list_names(rel_root):
+            try:
+                return rel_root, {e.name for e in self.repo.get_dir(remote_dir(rel_root)).entries}
+            except DoesNotExist:
+                return rel_root, set()
+
+        def create_dir(rel_root):
+            try:
+                self.repo.get_dir(remote_dir(rel_root))
+            except DoesNotExist:
+                self._mkdirs(remote_dir(rel_root))
+
+        link = ExpiringLink(self._get_upload_link)
+
+        def upload_file(rel_root, filename):
+            local_path = os.path.join(local_dir, *rel_root.split('/'), filename)
+            remote_path = posixpath.join(remote_dir(rel_root), filename)
+            try:
+                if not overwrite and filename in existing[rel_root]:
+                    raise FileExistsError("File/directory with name = `{}` already exists in current directory!".format(remote_path))
+                with open(local_path, 'rb') as fp:
+                    dirent = self._upload_to(link, fp, filename, rel_root, replace=overwrite)
+                return TransferResult(local_path, remote_path, dirent, None)
+            except Exception as e:
+                return TransferResult(local_path, remote_path, None, e)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            existing = {}
+            if not overwrite:
+                existing = dict(executor.map(list_names, sorted({rel_root for rel_root, _ in files})))
+            list(executor.map(create_dir, empty_dirs))
+            results = list(executor.map(lambda f: upload_file(*f), files))
+
+        self.entries = None
+        return results
+
     def _get_upload_link(self):
         url = '/api2/repos/%s/upload-link/?p=%s' % (self.repo.id, self.path)
         resp = self.client.get(url)
@@ -292,17 +748,34 @@ class SeafDir(_SeafDirentBase):
 
     def load_entries(self, dirents_json=None):
         if dirents_json is None:
-            url = '/api2/repos/%s/dir/' % self.repo.id + querystr(p=self.path)
-            dirents_json = self.client.get(url).json()
+            dirents_json = self._list_entries()
 
         self.entries = [self._load_dirent(entry_json) for entry_json in dirents_json]
 
-    def _load_dirent(self, dirent_json):
-        path = posixpath.join(self.path, dirent_json['name'])
-        if dirent_json['type'] == 'file':
-            return SeafFile(self.repo, path, dirent_json['id'], dirent_json['type'], dirent_json['size'])
+    def _list_entries(self):
+        url = '/api2/repos/%s/dir/' % self.repo.id
+        if self._cache is None:
+            return self.client.get(url + querystr(p=self.path)).json()
+
+        key = ('dir', self.repo.id, self.path)
+        cached = self._cache.lookup(key)
+        if cached is not None and cached.fresh:
+            self.id, dirents_json = cached.value
+            return dirents_json
+        if cached is None:
+            resp = self.client.get(url + querystr(p=self.path))
         else:
-            return SeafDir(self.repo, path, dirent_json['id'], dirent_json['type'], 0)
+            # the server answers "uptodate" if the dir has not changed since it was cached
+            resp = self.client.get(url + querystr(p=self.path, oid=cached.value[0]))
+        dirents_json = resp.json()
+        if dirents_json == "uptodate":
+            dirents_json = cached.value[1]
+        self.id = resp.headers['oid']
+        self._cache.set(key, (self.id, dirents_json))
+        return dirents_json
+
+    def _load_dirent(self, dirent_json):
+        return _load_dirent(self.repo, self.path, dirent_json, SeafFile, SeafDir)
 
     @property
     def num_entries(self):
@@ -338,12 +811,70 @@ class SeafFile(_SeafDirentBase):
         return re.match(r'"(.*)"', resp.text).group(1)
 
     def get_content(self):
-        """Get the content of the file"""
+        """Get the content of the file.
+
+        With the `content_cache` of the client, the content of this version of
+        the file (its object id) is read from disk once cached.
+        """
+        if self.client.content_cache is not None:
+            return self.client.content_cache.read(self._content_key(), self.iter_content)
         url = self._get_download_link()
         return self.client.get(url).content
 
-class DataproxyFile:
-    session = requests.Session()
+    def _content_key(self):
+        return 'seafile-' + self.id
+
+    def open_mmap(self, *, chunk_size: int=DEFAULT_CHUNK_SIZE):
+        """Map the content of the file in memory, read-only, see :meth:`DataproxyFile.open_mmap`"""
+        return _open_mmap(self.client.content_cache, self._content_key(), lambda: self.iter_content(chunk_size))
+
+    def iter_content(self, chunk_size: int=DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+        """Iterate over the content of the file, `chunk_size` bytes at a time"""
+        url = self._get_download_link()
+        with self.client.get(url, stream=True) as resp:
+            yield from resp.iter_content(chunk_size)
+
+    def download_to(self, path_or_fileobj: Union[str, os.PathLike, IO[bytes]], *, chunk_size: int=DEFAULT_CHUNK_SIZE) -> int:
+        """Stream the content of the file to a local path, or to a writable binary file object.
+
+        Returns the number of bytes written.
+        """
+        if is_pathlike(path_or_fileobj):
+            with open(path_or_fileobj, "wb") as fp:
+                return self.download_to(fp, chunk_size=chunk_size)
+
+        written = 0
+        for chunk in self.iter_content(chunk_size):
+            path_or_fileobj.write(chunk)
+            written += len(chunk)
+        return written
+
+class DataproxyDir(object):
+    """A pseudo-directory of a bucket: the common prefix `name` (ending with
+    the delimiter) of some of its objects"""
+
+    def __init__(self, client, bucket, name: str) -> None:
+        self.client = client
+        self.bucket = bucket
+        self.name = name
+
+    def __str__(self):
+        return 'DataproxyDir[bucket=%s, path=%s]' % (self.bucket.name, self.name)
+
+    __repr__ = __str__
+
+    def ls(self, **kwargs):
+        """List the objects and pseudo-directories right under this one,
+        see :meth:`ebrains_drive.bucket.Bucket.ls`"""
+        kwargs.setdefault("delimiter", self.name[-1:])
+        return self.bucket.ls(prefix=self.name, **kwargs)
+
+class _DataproxyFileBase(object):
+    """Fields of an object of a bucket, shared by :class:`DataproxyFile` and
+    :class:`ebrains_drive.aio.AsyncDataproxyFile`"""
+
+    # no per instance __dict__: listings of big buckets hold many of them
+    __slots__ = ('client', 'bucket', 'hash', 'last_modified', 'bytes', 'name', 'content_type')
 
     def __init__(self, client, bucket, hash: str, last_modified: str, bytes: int, name: str, content_type: str) -> None:
         self.client = client
@@ -356,11 +887,23 @@ class DataproxyFile:
         self.content_type = content_type
 
     def __str__(self):
-        return 'DataproxyFile[bucket=%s, path=%s, size=%s]' % \
-            (self.bucket.name, self.name, self.bytes)
+        return '%s[bucket=%s, path=%s, size=%s]' % \
+            (type(self).__name__, self.bucket.name, self.name, self.bytes)
 
     __repr__ = __str__
 
+    @classmethod
+    def from_json(cls, client, bucket, file_json: Dict[str, Any]):
+        return cls(client, bucket, **file_json)
+
+class DataproxyFile(_DataproxyFileBase):
+    __slots__ = ()
+
+    @property
+    def session(self):
+        """Session for the presigned download links, which must not get the client auth header"""
+        return self.client.transfer_session
+
     def get_download_link(self):
         """n.b. this download link expires in the order of seconds
         """
@@ -370,30 +913,162 @@ class DataproxyFile:
         return resp.json().get("url")
     
     def get_content(self, *, progress=False):
+        """Get the content of the file as bytes.
+
+        n.b. the whole object is held in memory. For large objects, prefer
+        :meth:`iter_content`, :meth:`download_to` or :meth:`get_stream`.
+
+        With the `content_cache` of the client, the content of this version of
+        the object (its hash) is read from disk once cached.
+        """
+        if self.client.content_cache is not None and self.hash:
+            return self.client.content_cache.read(self._content_key(), lambda: self.iter_content(progress=progress))
+        if not progress:
+            url = self.get_download_link()
+            # Auth header must **NOT** be attached to the download link obtained, or we will get 401
+            return self.session.get(url).content
+
+        # the chunks are written as they come, not all kept until joined
+        buffer = io.BytesIO()
+        self.download_to(buffer, progress=progress)
+        return buffer.getvalue()
+
+    def _content_key(self):
+        return 'dataproxy-%s-%s' % (self.hash, self.bytes) if self.hash else None
+
+    def open_mmap(self, *, chunk_size: int=DEFAULT_CHUNK_SIZE, progress=False):
+        """Map the content of the file in memory, read-only.
+
+        The content is streamed to a local copy first: into the `content_cache`
+        of the client if any (where other processes can map it too), else into
+        a temporary file, removed once the map is closed.
+
+        Returns a :class:`mmap.mmap` (an empty :class:`memoryview` for an
+        empty file), e.g. for `numpy.frombuffer`.
+        """
+        return _open_mmap(self.client.content_cache, self._content_key(),
+                          lambda: self.iter_content(chunk_size, progress=progress))
+
+    def _open_download(self):
         url = self.get_download_link()
         # Auth header must **NOT** be attached to the download link obtained, or we will get 401
+        resp = self.session.get(url, stream=True)
+        resp.raise_for_status()
+        return resp
 
-        if not progress:
-            return DataproxyFile.session.get(url).content
-        
-        content = bytearray()
-        resp = DataproxyFile.session.get(url, stream=True)
-        with tqdm(total=int(resp.headers.get("content-length")), leave=True) as progress:
-            for c in resp.iter_content(4096):
-                content.extend(c)
-                progress.update(4096)
-        return bytes(content)
+    def iter_content(self, chunk_size: int=DEFAULT_CHUNK_SIZE, *, progress=False) -> Iterator[bytes]:
+        """Iterate over the content of the file, `chunk_size` bytes at a time.
 
-    @classmethod
-    def from_json(cls, client, bucket, file_json: Dict[str, Any]):
-        return cls(client, bucket, **file_json)
+        Only one chunk is held in memory at any time.
+        """
+        with self._open_download() as resp:
+            if not progress:
+                yield from resp.iter_content(chunk_size)
+                return
+            total = resp.headers.get("content-length")
+            with tqdm(total=int(total) if total else None, unit="B", unit_scale=True, leave=True) as pbar:
+                for chunk in resp.iter_content(chunk_size):
+                    pbar.update(len(chunk))
+                    yield chunk
+
+    def download_to(self, path_or_fileobj: Union[str, os.PathLike, IO[bytes]], *, chunk_size: int=DEFAULT_CHUNK_SIZE, progress=False) -> int:
+        """Stream the content of the file to a local path, or to a writable binary file object.
+
+        Returns the number of bytes written.
+        """
+        if is_pathlike(path_or_fileobj):
+            with open(path_or_fileobj, "wb") as fp:
+                return self.download_to(fp, chunk_size=chunk_size, progress=progress)
+
+        written = 0
+        for chunk in self.iter_content(chunk_size, progress=progress):
+            path_or_fileobj.write(chunk)
+            written += len(chunk)
+        return written
+
+    def download_multipart(self, path: Union[str, os.PathLike], *, part_size: int=DEFAULT_PART_SIZE, max_workers: int=DEFAULT_MAX_WORKERS, chunk_size: int=DEFAULT_CHUNK_SIZE, progress=False, resume=False, state_path=None) -> int:
+        """Download the file to a local path with concurrent HTTP Range requests.
+
+        The local file is preallocated to the object size, and each part of
+        `part_size` bytes is written in place as it arrives. When the signed
+        download link expires, a fresh one is fetched and only the affected
+        part is retried.
+
+        If `resume` is set, completed parts are checkpointed to a sidecar
+        file (`state_path`, default `path` + :data:`STATE_SUFFIX`), and a
+        restarted download of the same object (same hash and size) only
+        fetches the missing parts. The sidecar is removed on completion.
+
+        Returns the number of bytes written.
+        """
+        size = self.bytes
+        state = None
+        if resume:
+            state_path = state_path or f"{os.fspath(path)}{STATE_SUFFIX}"
+            state = TransferState.load(state_path, {"hash": self.hash, "bytes": size, "part_size": part_size})
+            if not (os.path.isfile(path) and os.path.getsize(path) == size):
+                state.done = {}
+        if not state or not state.done:
+            preallocate(path, size)
+        if size == 0:
+            return 0
+
+        ranges = split_ranges(size, part_size)
+        on_range_done = None
+        if state:
+            ranges = [(start, end) for start, end in ranges if not state.is_done(start)]
+            on_range_done = lambda byte_range: state.mark_done(byte_range[0])
+
+        link = ExpiringLink(self.get_download_link)
+        with tqdm(total=size, initial=size - sum(end - start + 1 for start, end in ranges), unit="B", unit_scale=True, leave=True, disable=not progress) as pbar:
+            download_ranges(self.session, link, path, ranges, max_workers=max_workers,
+                            chunk_size=chunk_size, on_chunk=pbar.update, on_range_done=on_range_done)
+        if state:
+            state.remove()
+        return size
+
+    def get_stream(self, chunk_size: int=DEFAULT_CHUNK_SIZE) -> io.BufferedReader:
+        """Get a read-only, non-seekable binary file object over the content of the file.
+
+        The underlying connection is released when the file object is closed,
+        so use it as a context manager.
+        """
+        resp = self._open_download()
+        raw = ChunkStream(resp.iter_content(chunk_size), on_close=resp.close)
+        return io.BufferedReader(raw, buffer_size=chunk_size)
+
+    def open(self, **kwargs) -> IO[bytes]:
+        """Open the file for random access: a read-only, seekable binary file
+        object which only downloads the parts of the object that are read,
+        with HTTP Range requests (see :class:`ebrains_drive.transfer.RangeReader`
+        for the block cache and readahead options).
 
+        A file in the `content_cache` of the client is opened from the disk.
+        """
+        if self.client.content_cache is not None and self._content_key() is not None:
+            path = self.client.content_cache.path(self._content_key())
+            if path is not None:
+                try:
+                    return open(path, "rb")
+                except FileNotFoundError:
+                    # evicted in between
+                    pass
+        return RangeReader(self.session, ExpiringLink(self.get_download_link), self.bytes, **kwargs)
 
     @on_401_raise_unauthorized("Unauthorized")
-    def delete(self):
+    def delete(self, *, delete_segments: bool=False):
+        """Delete the object.
+
+        :param:delete_segments If set, the segments of the object, if it is a
+            large object (see :meth:`ebrains_drive.bucket.Bucket.upload_segmented`),
+            are deleted too, which lists them (one more request). Returns the
+            :class:`ebrains_drive.bucket.DeleteResult` of the segments.
+        """
         resp = self.client.delete(f"/v1/{self.bucket.target}/{self.bucket.dataproxy_entity_name}/{self.name}")
         json_resp = resp.json()
         if "failures" in json_resp:
             assert len(json_resp.get("failures")) == 0
         else:
             assert "has been removed" in json_resp["detail"]
+        if delete_segments:
+            return self.bucket._delete_segments(self.name)
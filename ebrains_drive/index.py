@@ -0,0 +1,204 @@
+import os
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from ebrains_drive.files import ZERO_OBJ_ID, SeafDir, SeafFile
+from ebrains_drive.transfer import DEFAULT_MAX_WORKERS
+from ebrains_drive.utils import querystr
+
+DEFAULT_INDEX_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'ebrains_drive')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    id TEXT,
+    size INTEGER,
+    type TEXT
+);
+CREATE INDEX IF NOT EXISTS entries_parent ON entries (parent);
+'''
+
+
+def glob_to_regex(pattern):
+    """Regular expression matching the relative paths matched by the glob `pattern`.
+
+    `*`, `?` and `[...]` do not match across a '/', while `**` matches any
+    number of path components: '**/*.nii.gz' matches 'a.nii.gz' and 'a/b/c.nii.gz'.
+    """
+    i, n = 0, len(pattern)
+    parts = []
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            parts.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('**', i):
+            parts.append('.*')
+            i += 2
+        elif c == '*':
+            parts.append('[^/]*')
+            i += 1
+        elif c == '?':
+            parts.append('[^/]')
+            i += 1
+        elif c == '[':
+            j = i + 1
+            if j < n and pattern[j] == '!':
+                j += 1
+            if j < n and pattern[j] == ']':
+                j += 1
+            j = pattern.find(']', j)
+            if j < 0:
+                parts.append(re.escape(c))
+                i += 1
+                continue
+            chars = pattern[i + 1:j].replace('\\', '\\\\')
+            if chars[0] == '!':
+                chars = '^/' + chars[1:]
+            elif chars[0] in '^[':
+                chars = '\\' + chars
+            parts.append('[%s]' % chars)
+            i = j + 1
+        else:
+            parts.append(re.escape(c))
+            i += 1
+    return ''.join(parts)
+
+
+def _subtree_bounds(path):
+    """Bounds of the paths strictly below `path` ('0' sorts right after '/')"""
+    path = path.rstrip('/')
+    return path + '/', path + '0'
+
+
+class PathIndex(object):
+    """Local, persistent index of the entries of a repo: the path, object id,
+    size and type of each of them, in an SQLite database.
+
+    :meth:`refresh` brings it up to date incrementally: the object id of a
+    directory changes whenever anything below it does, so a single request
+    tells whether the repo changed at all, and only the directories whose id
+    changed are listed again (concurrently, by up to `max_workers` threads).
+    Queries are then answered locally.
+
+    :param:db_path The database file, by default one per repo in :data:`DEFAULT_INDEX_DIR`
+    """
+    def __init__(self, repo, db_path=None, max_workers=DEFAULT_MAX_WORKERS):
+        self.repo = repo
+        self.max_workers = max_workers
+        if db_path is None:
+            os.makedirs(DEFAULT_INDEX_DIR, exist_ok=True)
+            db_path = os.path.join(DEFAULT_INDEX_DIR, 'paths-%s.sqlite' % repo.id)
+        self.db_path = db_path
+        self._db = sqlite3.connect(db_path)
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._db.execute("SELECT count(*) FROM entries WHERE path != '/'").fetchone()[0]
+
+    def refresh(self):
+        """Update the index with the changes of the repo since the last refresh.
+
+        Return the number of directories listed (0 if nothing changed).
+        """
+        row = self._db.execute("SELECT id FROM entries WHERE path = '/'").fetchone()
+        url = '/api2/repos/%s/dir/' % self.repo.id
+        # the server answers "uptodate" if the root dir has not changed
+        resp = self.repo.client.get(url + (querystr(p='/', oid=row[0]) if row else querystr(p='/')))
+        dirents_json = resp.json()
+        if dirents_json == "uptodate":
+            return 0
+        root = SeafDir(self.repo, '/', resp.headers['oid'], 'dir')
+        root.load_entries(dirents_json)
+
+        def list_dir(seafdir):
+            # not through the metadata cache: the listing must match the id recorded for the dir
+            seafdir.load_entries(self.repo.client.get(url + querystr(p=seafdir.path)).json())
+            return seafdir
+
+        listed = 1
+        # a single transaction: an interrupted refresh leaves the index as it was
+        with self._db, ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            self._db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)', ('/', None, root.id, 0, 'dir'))
+            level = [root]
+            while level:
+                to_list = []
+                for seafdir in level:
+                    to_list.extend(self._update_dir(seafdir))
+                listed += len(to_list)
+                level = list(executor.map(list_dir, to_list))
+        return listed
+
+    def _update_dir(self, seafdir):
+        """Record the loaded entries of `seafdir`; return its sub directories which must be listed"""
+        stored = {path: (obj_id, obj_type) for path, obj_id, obj_type in
+                  self._db.execute('SELECT path, id, type FROM entries WHERE parent = ?', (seafdir.path,))}
+        to_list = []
+        for dirent in seafdir.entries:
+            old = stored.pop(dirent.path, None)
+            if old == (dirent.id, dirent.type):
+                # unchanged, and so is the subtree of a dir
+                continue
+            if old is not None and old[1] == 'dir' and (not dirent.isdir or dirent.id == ZERO_OBJ_ID):
+                self._delete_subtree(dirent.path)
+            if dirent.isdir and dirent.id != ZERO_OBJ_ID:
+                to_list.append(dirent)
+        self._db.executemany('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+                             [(e.path, seafdir.path, e.id, e.size, e.type) for e in seafdir.entries])
+        for path, (_, obj_type) in stored.items():
+            self._db.execute('DELETE FROM entries WHERE path = ?', (path,))
+            if obj_type == 'dir':
+                self._delete_subtree(path)
+        return to_list
+
+    def _delete_subtree(self, path):
+        self._db.execute('DELETE FROM entries WHERE path >= ? AND path < ?', _subtree_bounds(path))
+
+    def _dirent(self, path, obj_id, size, obj_type):
+        if obj_type == 'dir':
+            return SeafDir(self.repo, path, obj_id, 'dir')
+        return SeafFile(self.repo, path, obj_id, 'file', size)
+
+    def glob(self, pattern, refresh=True):
+        """Return the entries (:class:`SeafFile` or :class:`SeafDir`) whose path
+        matches the glob `pattern`, relative to the root of the repo (see
+        :func:`glob_to_regex`), sorted by path.
+
+        :param:refresh Update the index first (a single request if the repo did not change)
+        """
+        if refresh:
+            self.refresh()
+        pattern = pattern.lstrip('/')
+        regex = re.compile(glob_to_regex(pattern))
+        # only the paths below the fixed leading directories of the pattern are read
+        literal = re.match(r'[^*?[]*', pattern).group(0)
+        literal = literal[:literal.rfind('/') + 1]
+        if literal:
+            rows = self._db.execute('SELECT * FROM entries WHERE path >= ? AND path < ? ORDER BY path',
+                                    _subtree_bounds('/' + literal))
+        else:
+            rows = self._db.execute("SELECT * FROM entries WHERE path != '/' ORDER BY path")
+        return [self._dirent(path, obj_id, size, obj_type) for path, parent, obj_id, size, obj_type in rows
+                if regex.fullmatch(path[1:])]
+
+    def find(self, predicate, refresh=True):
+        """Return the entries (:class:`SeafFile` or :class:`SeafDir`) for which
+        `predicate` returns True, sorted by path.
+
+        :param:refresh Update the index first (a single request if the repo did not change)
+        """
+        if refresh:
+            self.refresh()
+        rows = self._db.execute("SELECT * FROM entries WHERE path != '/' ORDER BY path")
+        dirents = (self._dirent(path, obj_id, size, obj_type) for path, parent, obj_id, size, obj_type in rows)
+        return [dirent for dirent in dirents if predicate(dirent)]
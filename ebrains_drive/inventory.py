@@ -0,0 +1,129 @@
+import re
+from array import array
+from typing import Any, Dict, Iterator, Optional
+from ebrains_drive.files import DataproxyFile
+
+_MD5_HEX = re.compile(r'^[0-9a-f]{32}$')
+
+
+class _StringColumn(object):
+    """Strings stored back to back, utf-8 encoded, in a single buffer"""
+    def __init__(self):
+        self._data = bytearray()
+        self._offsets = array('Q', [0])
+
+    def append(self, value: str):
+        self._data += value.encode('utf-8')
+        self._offsets.append(len(self._data))
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self._data[self._offsets[i]:self._offsets[i + 1]].decode('utf-8')
+
+
+class _HashColumn(object):
+    """md5 hex digests stored as 16 raw bytes each, other values kept aside"""
+    def __init__(self):
+        self._data = bytearray()
+        self._others = {}
+
+    def append(self, value: str):
+        if value is None or not _MD5_HEX.match(value):
+            self._others[len(self._data) // 16] = value
+            self._data += bytes(16)
+        else:
+            self._data += bytes.fromhex(value)
+
+    def __getitem__(self, i: int) -> str:
+        if i in self._others:
+            return self._others[i]
+        return self._data[i * 16:(i + 1) * 16].hex()
+
+
+class ObjectInventory(object):
+    """Columnar listing of the objects of a bucket.
+
+    The attributes of the objects are held in a few compact columns (names
+    and dates in shared utf-8 buffers, sizes in an array, md5 hashes as raw
+    bytes, content types as codes) instead of one :class:`DataproxyFile` per
+    object; a :class:`DataproxyFile` is only built when an item is accessed.
+
+    Build it with :meth:`ebrains_drive.bucket.Bucket.inventory`.
+    """
+    def __init__(self, client, bucket) -> None:
+        self.client = client
+        self.bucket = bucket
+        self._names = _StringColumn()
+        self._last_modified = _StringColumn()
+        self._hashes = _HashColumn()
+        self.sizes = array('q')
+        self._content_types = []
+        self._content_type_codes = {}
+        self._content_type_column = array('I')
+
+    def append(self, obj: Dict[str, Any]):
+        """Add an object, given as the json of a bucket listing"""
+        self._names.append(obj['name'])
+        self._last_modified.append(obj['last_modified'])
+        self._hashes.append(obj['hash'])
+        self.sizes.append(obj['bytes'])
+        content_type = obj['content_type']
+        code = self._content_type_codes.get(content_type)
+        if code is None:
+            code = self._content_type_codes[content_type] = len(self._content_types)
+            self._content_types.append(content_type)
+        self._content_type_column.append(code)
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def __getitem__(self, i: int) -> DataproxyFile:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('ObjectInventory index out of range')
+        return DataproxyFile(self.client, self.bucket, hash=self._hashes[i], last_modified=self._last_modified[i],
+                             bytes=self.sizes[i], name=self._names[i],
+                             content_type=self._content_types[self._content_type_column[i]])
+
+    def __iter__(self) -> Iterator[DataproxyFile]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def __str__(self):
+        return 'ObjectInventory[bucket=%s, objects=%s]' % (self.bucket.name, len(self))
+
+    __repr__ = __str__
+
+    def names(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self._names[i]
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(self.sizes)
+
+    def index(self, name: str) -> int:
+        """Position of the object `name` (binary search, the listing being sorted).
+
+        Raises :exc:`ValueError` if there is no such object.
+        """
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._names[mid] < name:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == len(self) or self._names[lo] != name:
+            raise ValueError('%s is not in the inventory' % name)
+        return lo
+
+    def get(self, name: str) -> Optional[DataproxyFile]:
+        """The object `name`, or None"""
+        try:
+            return self[self.index(name)]
+        except ValueError:
+            return None
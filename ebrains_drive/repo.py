@@ -1,7 +1,12 @@
+import posixpath
 from urllib.parse import urlencode
 from ebrains_drive.files import SeafDir, SeafFile
+from ebrains_drive.index import PathIndex
 from ebrains_drive.utils import raise_does_not_exist
 
+# The attributes set from the repo json
+ALLOWED_KEYS = ['encrypted', 'group_name', 'groupid', 'head_commit_id', 'id', 'modifier_contact_email', 'modifier_email', 'modifier_name', 'mtime', 'mtime_relative', 'name', 'owner', 'owner_contact_email', 'owner_name', 'permission', 'root', 'share_from', 'share_from_contact_email', 'share_from_name', 'share_type', 'size', 'size_formatted', 'type', 'version', 'virtual']
+
 class Repo(object):
     """
     A seafile library
@@ -9,12 +14,11 @@ class Repo(object):
     def __init__(self, client, **kwargs):
         self.client = client
 
-        allowed_keys = ['encrypted', 'group_name', 'groupid', 'head_commit_id', 'id', 'modifier_contact_email', 'modifier_email', 'modifier_name', 'mtime', 'mtime_relative', 'name', 'owner', 'owner_contact_email', 'owner_name', 'permission', 'root', 'share_from', 'share_from_contact_email', 'share_from_name', 'share_type', 'size', 'size_formatted', 'type', 'version', 'virtual']
         # Update __dict__ but only for keys that have been predefined 
         # (silently ignore others)
-        self.__dict__.update((key, value) for key, value in kwargs.items() if key in allowed_keys)
+        self.__dict__.update((key, value) for key, value in kwargs.items() if key in ALLOWED_KEYS)
         # To NOT silently ignore rejected keys
-        # rejected_keys = set(kwargs.keys()) - set(allowed_keys)
+        # rejected_keys = set(kwargs.keys()) - set(ALLOWED_KEYS)
         # if rejected_keys:
         #     raise ValueError("Invalid arguments in constructor:{}".format(rejected_keys))
 
@@ -38,12 +42,29 @@ class Repo(object):
         Return a :class:`SeafFile` object
         """
         assert path.startswith('/')
-        url = '/api2/repos/%s/file/detail/' % self.id
-        query = '?' + urlencode(dict(p=path))
-        file_json = self.client.get(url + query).json()
+        cache = self.client.metadata_cache
+        file_json = self._cached_file_json(path) if cache is not None else None
+        if file_json is None:
+            url = '/api2/repos/%s/file/detail/' % self.id
+            query = '?' + urlencode(dict(p=path))
+            file_json = self.client.get(url + query).json()
+            if cache is not None:
+                cache.set(('file', self.id, path), file_json)
 
         return SeafFile(self, path, file_json['id'], "file", file_json['size'])
 
+    def _cached_file_json(self, path):
+        cache = self.client.metadata_cache
+        file_json = cache.get(('file', self.id, path))
+        if file_json is None:
+            # the details listed in the parent dir are enough
+            listing = cache.get(('dir', self.id, posixpath.dirname(path)))
+            name = posixpath.basename(path)
+            for dirent_json in (listing[1] if listing else []):
+                if dirent_json['name'] == name and dirent_json['type'] == 'file':
+                    return dirent_json
+        return file_json
+
     @raise_does_not_exist('The requested dir does not exist')
     def get_dir(self, path):
         """Get the dir object located in `path` in this repo.
@@ -51,6 +72,11 @@ class Repo(object):
         Return a :class:`SeafDir` object
         """
         assert path.startswith('/')
+        if self.client.metadata_cache is not None:
+            # the listing, and the dir id, come from (or go to) the cache
+            dir = SeafDir(self, path, None, "dir")
+            dir.load_entries()
+            return dir
         url = '/api2/repos/%s/dir/' % self.id
         query = '?' + urlencode(dict(p=path))
         resp = self.client.get(url + query)
@@ -60,9 +86,34 @@ class Repo(object):
         dir.load_entries(dir_json)
         return dir
 
+    def walk(self, path='/', **kwargs):
+        """Walk the tree of this repo below `path`, see :meth:`ebrains_drive.files.SeafDir.walk`"""
+        assert path.startswith('/')
+        return SeafDir(self, path, None, "dir").walk(**kwargs)
+
+    def glob(self, pattern, refresh=True, db_path=None):
+        """Return the entries of this repo whose path matches the glob `pattern`
+        (e.g. '**/*.nii.gz'), looked up in a local index of the repo.
+
+        See :class:`ebrains_drive.index.PathIndex`.
+        """
+        with PathIndex(self, db_path) as index:
+            return index.glob(pattern, refresh)
+
+    def find(self, predicate, refresh=True, db_path=None):
+        """Return the entries of this repo for which `predicate` returns True,
+        looked up in a local index of the repo.
+
+        See :class:`ebrains_drive.index.PathIndex`.
+        """
+        with PathIndex(self, db_path) as index:
+            return index.find(predicate, refresh)
+
     def delete(self):
         """Remove this repo. Only the repo owner can do this"""
         self.client.delete('/api2/repos/' + self.id)
+        if self.client.metadata_cache is not None:
+            self.client.metadata_cache.invalidate(self.id)
 
     def list_history(self):
         """List the history of this repo
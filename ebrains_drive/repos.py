@@ -5,6 +5,17 @@ from ebrains_drive.repo import Repo
 from ebrains_drive.utils import raise_does_not_exist
 
 
+def _remove_duplicate_repos(repos):
+    unique_repos = []
+    for repo in repos:
+        if repo.id not in [r.id for r in unique_repos]:
+            unique_repos.append(repo)
+        else:
+            if repo.owner != "Organization":
+                unique_repos = [repo if r.id == repo.id else r for r in unique_repos]
+    return unique_repos
+
+
 class Repos(object):
     def __init__(self, client):
         self.client = client
@@ -22,23 +33,18 @@ class Repos(object):
 
         Raises :exc:`DoesNotExist` if no such repo exists.
         """
-        repo_json = self.client.get('/api2/repos/' + repo_id).json()
+        cache = self.client.metadata_cache
+        repo_json = cache.get(('repo', repo_id, None)) if cache is not None else None
+        if repo_json is None:
+            repo_json = self.client.get('/api2/repos/' + repo_id).json()
+            if cache is not None:
+                cache.set(('repo', repo_id, None), repo_json)
         return Repo.from_json(self.client, repo_json)
 
-    def _remove_duplicate_repos(self, repos):
-        unique_repos = []
-        for repo in repos:
-            if repo.id not in [r.id for r in unique_repos]:
-                unique_repos.append(repo)
-            else:
-                if repo.owner != "Organization":
-                    unique_repos = [repo if r.id == repo.id else r for r in unique_repos]
-        return unique_repos
-
     def list_repos(self):
         repos_json = self.client.get('/api2/repos/').json()
         repos = [Repo.from_json(self.client, j) for j in repos_json]
-        return self._remove_duplicate_repos(repos)
+        return _remove_duplicate_repos(repos)
 
     def get_repos_by_filter(self, filter_name, filter_value):
         """Get all repos which have `filter_name` = `filter_value`.
@@ -49,7 +55,7 @@ class Repos(object):
         for j in repos_json:
             if filter_name in j.keys() and j[filter_name] == filter_value:
                 match_repos.append(Repo.from_json(self.client, j))
-        return self._remove_duplicate_repos(match_repos)
+        return _remove_duplicate_repos(match_repos)
 
     def get_repos_by_name(self, repo_name):
         """Get all repos which have the name `repo_name`.
@@ -0,0 +1,96 @@
+import random
+import time
+from email.utils import parsedate_to_datetime
+from requests.exceptions import ChunkedEncodingError, ConnectionError, ConnectTimeout, ReadTimeout
+
+# Statuses signalling a transient failure
+RETRYABLE_STATUSES = frozenset([429, 502, 503, 504])
+RETRYABLE_EXCEPTIONS = (ConnectionError, ReadTimeout, ChunkedEncodingError)
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+
+
+class RetryPolicy(object):
+    """When and how long to wait before retrying a failed http request.
+
+    Requests failing with one of `statuses`, or raising one of `exceptions`,
+    are retried up to `max_attempts` attempts in total, with an exponential
+    backoff (`backoff_factor` * 2 ** (attempt - 1), capped at `max_backoff`
+    seconds) and full jitter. A `Retry-After` header takes precedence over
+    the backoff if `respect_retry_after` is set.
+
+    Requests with a method not in `idempotent_methods` (e.g. POST) may have
+    been processed by the server even though they failed, so they are only
+    retried when it is known they were not: on a connection timeout, or on a
+    429 (Too Many Requests) response. Callers can override this per request
+    with the `idempotent` parameter.
+    """
+    def __init__(self, max_attempts=5, backoff_factor=0.5, max_backoff=30.0, statuses=RETRYABLE_STATUSES,
+                 exceptions=RETRYABLE_EXCEPTIONS, idempotent_methods=IDEMPOTENT_METHODS, respect_retry_after=True):
+        self.max_attempts = max_attempts
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.statuses = frozenset(statuses)
+        self.exceptions = exceptions
+        self.idempotent_methods = frozenset(m.upper() for m in idempotent_methods)
+        self.respect_retry_after = respect_retry_after
+
+    def backoff(self, attempt: int) -> float:
+        """Seconds to wait after the failed attempt number `attempt` (starting at 1)"""
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** (attempt - 1)))
+
+    def retry_after(self, resp):
+        """Seconds to wait according to the `Retry-After` header of `resp`, or None"""
+        value = resp.headers.get('Retry-After') if resp.headers else None
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def _is_retryable_exception(self, exc, idempotent):
+        if idempotent:
+            return isinstance(exc, self.exceptions)
+        return isinstance(exc, ConnectTimeout)
+
+    def _is_retryable_response(self, resp, idempotent):
+        return resp.status_code in self.statuses and (idempotent or resp.status_code == 429)
+
+    def call(self, method: str, send, idempotent=None, rewind=None, sleep=time.sleep):
+        """Call `send()` (which sends the request and returns its response) until it succeeds,
+        fails in a non retryable way, or `max_attempts` is reached.
+
+        :param:idempotent Whether the request can safely be sent again; by default,
+            according to its `method`
+        :param:rewind callable preparing the request body to be sent again, returning
+            False if it cannot be
+        """
+        if idempotent is None:
+            idempotent = method.upper() in self.idempotent_methods
+        attempt = 1
+        while True:
+            try:
+                resp = send()
+            except Exception as e:
+                if attempt >= self.max_attempts or not self._is_retryable_exception(e, idempotent) \
+                        or (rewind is not None and not rewind()):
+                    raise
+                sleep(self.backoff(attempt))
+                attempt += 1
+                continue
+
+            if attempt >= self.max_attempts or not self._is_retryable_response(resp, idempotent) \
+                    or (rewind is not None and not rewind()):
+                return resp
+            delay = self.retry_after(resp) if self.respect_retry_after else None
+            resp.close()
+            sleep(self.backoff(attempt) if delay is None else delay)
+            attempt += 1
+
+
+# A policy that never retries
+NO_RETRY = RetryPolicy(max_attempts=1)
@@ -0,0 +1,130 @@
+import threading
+import weakref
+import requests
+from requests.adapters import HTTPAdapter
+from ebrains_drive.retry import RetryPolicy
+
+# requests defaults to 10 pooled connections per host, which multi-part transfers exceed
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 32
+
+
+class SessionManager(object):
+    """Thread-local :class:`requests.Session` objects sharing one pooled adapter.
+
+    Each thread gets its own session (sessions are not thread-safe), while
+    connections are pooled and kept alive across all of them. A session is
+    dropped when its thread ends: the connections it used stay in the pool.
+
+    :param:pool_connections Number of hosts for which connections are pooled
+    :param:pool_maxsize Maximum number of connections kept alive per host
+    :param:pool_block Block, rather than open throw-away connections, when all
+        `pool_maxsize` connections to a host are in use
+    :param:max_retries Passed to :class:`requests.adapters.HTTPAdapter`: a number
+        of retries on connection errors, or a :class:`urllib3.util.Retry`
+    :param:keep_alive If False, connections are closed after each request
+    :param:headers Default headers of the sessions
+    :param:retry_policy :class:`ebrains_drive.retry.RetryPolicy` applied to the
+        requests of the sessions, None to not retry them
+    """
+    def __init__(self, pool_connections=DEFAULT_POOL_CONNECTIONS, pool_maxsize=DEFAULT_POOL_MAXSIZE, pool_block=False,
+                 max_retries=0, keep_alive=True, headers=None, retry_policy: RetryPolicy=None):
+        self.adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                   pool_block=pool_block, max_retries=max_retries)
+        self.headers = dict(headers or {})
+        self.retry_policy = retry_policy
+        if not keep_alive:
+            self.headers['Connection'] = 'close'
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # the live sessions, for close(); each one is only held by the thread-local of its thread
+        self._sessions = weakref.WeakSet()
+        self.closed = False
+
+    @property
+    def session(self) -> requests.Session:
+        """The session of the calling thread"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            if self.closed:
+                raise RuntimeError("SessionManager has been closed")
+            session = RetryingSession(self.retry_policy)
+            session.mount('https://', self.adapter)
+            session.mount('http://', self.adapter)
+            session.headers.update(self.headers)
+            with self._lock:
+                self._sessions.add(session)
+            self._local.session = session
+        return session
+
+    def request(self, method, url, **kwargs):
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def close(self):
+        """Close all sessions, and the pooled connections"""
+        with self._lock:
+            sessions, self._sessions = list(self._sessions), weakref.WeakSet()
+            self.closed = True
+        for session in sessions:
+            session.close()
+        self.adapter.close()
+
+
+def body_rewinder(kwargs):
+    """Return a callable rewinding the file objects in the `data` / `files` of a request,
+    so that it can be sent again. The callable returns False if the body cannot be rewound."""
+    data = kwargs.get('data')
+    files = kwargs.get('files') or {}
+    fileobjs = [data] if hasattr(data, 'read') else []
+    if data is not None and not fileobjs and not isinstance(data, (bytes, str, dict, list, tuple)):
+        # generators and other one-shot iterables
+        return lambda: False
+    for value in (files.values() if isinstance(files, dict) else files):
+        value = value[1] if isinstance(value, tuple) else value
+        if hasattr(value, 'read'):
+            fileobjs.append(value)
+
+    positions = []
+    for fileobj in fileobjs:
+        try:
+            positions.append(fileobj.tell())
+        except (AttributeError, OSError):
+            return lambda: False
+
+    def rewind():
+        try:
+            for fileobj, position in zip(fileobjs, positions):
+                fileobj.seek(position)
+        except (AttributeError, OSError):
+            return False
+        return True
+    return rewind
+
+
+class RetryingSession(requests.Session):
+    """:class:`requests.Session` retrying failed requests according to a :class:`RetryPolicy`.
+
+    :meth:`request` takes an extra `idempotent` parameter to override whether
+    the request can safely be sent again.
+    """
+    def __init__(self, retry_policy: RetryPolicy=None):
+        super().__init__()
+        self.retry_policy = retry_policy
+
+    def request(self, method, url, *args, idempotent=None, **kwargs):
+        send = lambda: super(RetryingSession, self).request(method, url, *args, **kwargs)
+        if self.retry_policy is None:
+            return send()
+        return self.retry_policy.call(method, send, idempotent=idempotent, rewind=body_rewinder(kwargs))
@@ -0,0 +1,515 @@
+import hashlib
+import json
+import os
+import posixpath
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from ebrains_drive.files import SeafDir, SeafFile
+from ebrains_drive.transfer import DEFAULT_CHUNK_SIZE, DEFAULT_MAX_WORKERS, DEFAULT_PART_SIZE, ExpiringLink, path_selected
+
+# Name of the manifest recording the state of the last sync, in the root of the local directory
+MANIFEST_NAME = '.ebrains-sync.json'
+
+DIRECTIONS = ('both', 'upload', 'download')
+CONFLICT_POLICIES = ('skip', 'local', 'remote')
+COMPARE_MODES = ('mtime', 'hash')
+
+
+class SyncAction(namedtuple('SyncAction', ['op', 'path', 'reason'])):
+    """One step of a sync plan.
+
+    `op` is one of 'upload', 'download', 'delete_remote', 'delete_local',
+    'mkdir_remote', 'mkdir_local' or 'conflict' (reported, never executed).
+    `path` is relative to the synced directories.
+    """
+    __slots__ = ()
+
+
+class SyncResult(namedtuple('SyncResult', ['action', 'error'])):
+    """Outcome of an executed :class:`SyncAction`"""
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def file_hash(path, algorithm='sha1', chunk_size=DEFAULT_CHUNK_SIZE):
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _join(rel_dir, name):
+    return posixpath.join(rel_dir, name) if rel_dir else name
+
+
+def _in_subtree(relpath, rel_dir):
+    return relpath.startswith(rel_dir + '/')
+
+
+class _SyncBase(object):
+    """Manifest handling and local scanning shared by :class:`DriveSync` and :class:`BucketSync`"""
+
+    # hash algorithm of local files when compare='hash'
+    HASH_ALGORITHM = 'sha1'
+
+    def __init__(self, local_dir, compare='mtime', include=None, exclude=None, max_workers=DEFAULT_MAX_WORKERS, manifest_path=None):
+        if compare not in COMPARE_MODES:
+            raise ValueError("Invalid value for parameter `compare`; must be one of %s!" % ', '.join(COMPARE_MODES))
+        self.local_dir = local_dir
+        self.compare = compare
+        self.include = include
+        self.exclude = exclude
+        self.max_workers = max_workers
+        self.manifest_path = manifest_path or os.path.join(local_dir, MANIFEST_NAME)
+
+    def _identity(self):
+        """JSON-serialisable description of what is synced; a manifest of another identity is ignored"""
+        raise NotImplementedError
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path) as fp:
+                manifest = json.load(fp)
+        except (OSError, ValueError):
+            return {}
+        if manifest.get('identity') != json.loads(json.dumps(self._identity())):
+            return {}
+        return manifest
+
+    def _save_manifest(self, **sections):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump(dict(sections, identity=self._identity()), fp)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _local_path(self, relpath):
+        return os.path.join(self.local_dir, *relpath.split('/'))
+
+    def _local_record(self, relpath, base=None):
+        stat = os.stat(self._local_path(relpath))
+        record = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+        if self.compare == 'hash':
+            base_local = (base or {}).get('local') or {}
+            if base_local.get('size') == stat.st_size and base_local.get('mtime') == stat.st_mtime_ns:
+                record['hash'] = base_local.get('hash')
+            else:
+                record['hash'] = file_hash(self._local_path(relpath), self.HASH_ALGORITHM)
+        return record
+
+    def _local_changed(self, local, base_local):
+        keys = ('size', 'hash') if self.compare == 'hash' else ('size', 'mtime')
+        return any(local.get(k) != base_local.get(k) for k in keys)
+
+    def _scan_local(self, base_files):
+        files, dirs = {}, set()
+        manifest_names = {os.path.abspath(self.manifest_path), os.path.abspath(self.manifest_path + '.tmp')}
+        for root, dirnames, filenames in os.walk(self.local_dir):
+            rel_root = os.path.relpath(root, self.local_dir).replace(os.sep, '/')
+            rel_root = '' if rel_root == '.' else rel_root
+            dirnames[:] = [d for d in dirnames if path_selected(_join(rel_root, d), exclude=self.exclude)]
+            dirs.update(_join(rel_root, d) for d in dirnames)
+            for filename in filenames:
+                relpath = _join(rel_root, filename)
+                if os.path.abspath(os.path.join(root, filename)) in manifest_names:
+                    continue
+                if path_selected(relpath, self.include, self.exclude):
+                    files[relpath] = self._local_record(relpath, base_files.get(relpath))
+        return files, dirs
+
+    def plan(self):
+        raise NotImplementedError
+
+    def execute(self, actions):
+        raise NotImplementedError
+
+    def run(self, dry_run=False):
+        """Plan and execute the sync.
+
+        If `dry_run` is set, only return the plan (a list of :class:`SyncAction`),
+        else return the list of :class:`SyncResult` of the executed actions.
+        """
+        actions = self.plan()
+        if dry_run:
+            return actions
+        return self.execute(actions)
+
+
+class DriveSync(_SyncBase):
+    """Incremental sync between the local directory `local_dir` and the Drive directory `seafdir`.
+
+    The state of both sides after each run is recorded in a manifest (by
+    default :data:`MANIFEST_NAME` in `local_dir`): the object id and size of
+    each remote file, the size, mtime (and optionally hash) of the local file
+    it was synced with, and the object id of each remote directory. On the
+    next run, only what changed since is transferred, and remote sub
+    directories whose object id did not change are not listed at all.
+
+    :param:direction 'both', 'upload' (make remote mirror local) or
+        'download' (make local mirror remote)
+    :param:conflict What to do with files changed on both sides since the last
+        sync: 'skip' (report only), 'local' (local wins) or 'remote' (remote wins)
+    :param:delete Propagate deletions. If False, a file deleted on one side
+        is restored from the other one.
+    :param:compare How local changes are detected: 'mtime' (size and mtime)
+        or 'hash' (size and SHA-1 of the content)
+    :param:include, exclude glob patterns of the paths to sync / to skip
+
+    Directory deletions are not propagated.
+    """
+    def __init__(self, local_dir, seafdir: SeafDir, direction='both', conflict='skip', delete=False, compare='mtime',
+                 include=None, exclude=None, max_workers=DEFAULT_MAX_WORKERS, manifest_path=None):
+        super().__init__(local_dir, compare, include, exclude, max_workers, manifest_path)
+        if direction not in DIRECTIONS:
+            raise ValueError("Invalid value for parameter `direction`; must be one of %s!" % ', '.join(DIRECTIONS))
+        if conflict not in CONFLICT_POLICIES:
+            raise ValueError("Invalid value for parameter `conflict`; must be one of %s!" % ', '.join(CONFLICT_POLICIES))
+        self.seafdir = seafdir
+        self.direction = direction
+        self.conflict = conflict
+        self.delete = delete
+
+        self._base = None
+        self._local = None
+        self._local_dirs = None
+        self._remote = None
+        self._remote_dirs = None
+        # paths on both sides, and in sync, when planned
+        self._in_sync = None
+
+    def _identity(self):
+        return {'repo_id': self.seafdir.repo.id, 'path': self.seafdir.path,
+                'include': self.include, 'exclude': self.exclude}
+
+    def _remote_path(self, relpath):
+        return posixpath.join(self.seafdir.path, relpath)
+
+    def _scan_remote(self, base_files, base_dirs):
+        """List the remote tree, reusing the manifest for sub directories whose object id did not change"""
+        files, dirs = {}, {}
+        root = self.seafdir.repo.get_dir(self.seafdir.path)
+        dirs[''] = root.id
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            level = [('', root.entries)]
+            while level:
+                to_list = []
+                for rel_dir, entries in level:
+                    for dirent in entries:
+                        relpath = _join(rel_dir, dirent.name)
+                        if dirent.isdir:
+                            if not path_selected(relpath, exclude=self.exclude):
+                                continue
+                            dirs[relpath] = dirent.id
+                            if base_dirs.get(relpath) == dirent.id:
+                                # unchanged subtree: its content is known from the last sync
+                                dirs.update((p, oid) for p, oid in base_dirs.items() if _in_subtree(p, relpath))
+                                files.update((p, {'id': f['id'], 'size': f['size']}) for p, f in base_files.items()
+                                             if _in_subtree(p, relpath) and f.get('id'))
+                            else:
+                                to_list.append((relpath, dirent))
+                        elif path_selected(relpath, self.include, self.exclude):
+                            files[relpath] = {'id': dirent.id, 'size': dirent.size}
+                listed = executor.map(lambda item: item[1].ls(force_refresh=True), to_list)
+                level = [(relpath, entries) for (relpath, _), entries in zip(to_list, listed)]
+        return files, dirs
+
+    def _plan_file(self, relpath, local, remote, base):
+        """Return the action syncing `relpath` (or None), given its local and remote
+        records and its record from the last sync, if both sides were in sync then."""
+        upload = SyncAction('upload', relpath, '')
+        if base is not None:
+            local_changed = local is not None and self._local_changed(local, base['local'])
+            remote_changed = remote is not None and remote['id'] != base['id']
+        if local is not None and remote is not None:
+            if base is None:
+                # never synced: nothing tells whether both hold the same content
+                # (the remote object id is not a hash of it), each side may have changed
+                local_changed = remote_changed = True
+            if not local_changed and not remote_changed:
+                return None
+            if self.direction == 'upload' or (self.direction == 'both' and not remote_changed):
+                return upload._replace(reason='local changed' if local_changed else 'remote changed')
+            if self.direction == 'download' or (self.direction == 'both' and not local_changed):
+                return SyncAction('download', relpath, 'remote changed' if remote_changed else 'local changed')
+            if self.conflict == 'local':
+                return upload._replace(reason='conflict, local wins')
+            if self.conflict == 'remote':
+                return SyncAction('download', relpath, 'conflict, remote wins')
+            return SyncAction('conflict', relpath, 'changed on both sides' if base is not None else 'on both sides, never synced')
+        if local is not None:
+            if self.direction == 'download' or (self.direction == 'both' and base is not None and not local_changed):
+                if self.delete:
+                    return SyncAction('delete_local', relpath, 'deleted remotely')
+                if self.direction == 'download':
+                    return None
+            return upload._replace(reason='missing remotely')
+        if remote is not None:
+            if self.direction == 'upload' or (self.direction == 'both' and base is not None and not remote_changed):
+                if self.delete:
+                    return SyncAction('delete_remote', relpath, 'deleted locally')
+                if self.direction == 'upload':
+                    return None
+            return SyncAction('download', relpath, 'missing locally')
+        return None
+
+    def plan(self):
+        """Compare both sides, and return the list of :class:`SyncAction` needed to sync them"""
+        manifest = self._load_manifest()
+        base_files, base_dirs = manifest.get('files', {}), manifest.get('dirs', {})
+        self._local, self._local_dirs = self._scan_local(base_files)
+        self._remote, self._remote_dirs = self._scan_remote(base_files, base_dirs)
+        self._base = {p: f for p, f in base_files.items() if f.get('id') and f.get('local')}
+
+        actions = []
+        self._in_sync = set()
+        for relpath in sorted(set(self._local) | set(self._remote)):
+            action = self._plan_file(relpath, self._local.get(relpath), self._remote.get(relpath), self._base.get(relpath))
+            if action is not None:
+                actions.append(action)
+            elif relpath in self._local and relpath in self._remote:
+                self._in_sync.add(relpath)
+
+        uploaded = [a.path for a in actions if a.op == 'upload']
+        if self.direction in ('both', 'download'):
+            actions.extend(SyncAction('mkdir_local', d, 'missing locally')
+                           for d in sorted(set(self._remote_dirs) - self._local_dirs - {''}))
+        if self.direction in ('both', 'upload'):
+            # uploads create their parent directories, only create the other (leaf) ones
+            missing = sorted(self._local_dirs - set(self._remote_dirs))
+            actions.extend(SyncAction('mkdir_remote', d, 'missing remotely') for d in missing
+                           if not any(_in_subtree(p, d) for p in uploaded + missing))
+        return actions
+
+    def _execute(self, action, link):
+        """Execute `action`, and return the new remote record of its path (None if it no longer exists)"""
+        relpath = action.path
+        if action.op == 'upload':
+            rel_dir, filename = posixpath.split(relpath)
+            with open(self._local_path(relpath), 'rb') as fp:
+                seaffile = self.seafdir._upload_to(link, fp, filename, rel_dir, replace=True)
+            return {'id': seaffile.id, 'size': seaffile.size}
+        remote = self._remote.get(relpath)
+        if action.op == 'download':
+            local_path = self._local_path(relpath)
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            SeafFile(self.seafdir.repo, self._remote_path(relpath), remote['id'], 'file', remote['size']).download_to(local_path)
+            return remote
+        if action.op == 'delete_remote':
+            SeafFile(self.seafdir.repo, self._remote_path(relpath), remote['id'], 'file', remote['size']).delete()
+            return None
+        if action.op == 'delete_local':
+            os.remove(self._local_path(relpath))
+            return None
+        if action.op == 'mkdir_local':
+            os.makedirs(self._local_path(relpath), exist_ok=True)
+        elif action.op == 'mkdir_remote':
+            self.seafdir._mkdirs(self._remote_path(relpath))
+        return None
+
+    def execute(self, actions):
+        """Execute a plan returned by :meth:`plan`, and record the new state in the manifest.
+
+        Return a list of :class:`SyncResult`, one per executed action.
+        """
+        if self._remote is None:
+            raise RuntimeError("DriveSync.execute must be called with a plan returned by DriveSync.plan")
+        link = ExpiringLink(self.seafdir._get_upload_link)
+
+        def execute(action):
+            try:
+                return action, self._execute(action, link), None
+            except Exception as e:
+                return action, None, e
+
+        mkdirs = [a for a in actions if a.op in ('mkdir_local', 'mkdir_remote')]
+        transfers = [a for a in actions if a.op not in ('mkdir_local', 'mkdir_remote', 'conflict')]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            outcomes = list(executor.map(execute, mkdirs))
+            outcomes += list(executor.map(execute, transfers))
+
+        # new manifest: files in sync get both their remote and local records,
+        # remote files not (yet) in sync only their remote one
+        files = {p: dict(r, local=self._local[p] if p in self._in_sync else None) for p, r in self._remote.items()}
+        for action, remote, error in outcomes:
+            p = action.path
+            if action.op in ('mkdir_local', 'mkdir_remote'):
+                continue
+            if error is not None:
+                if p in files:
+                    files[p]['local'] = None
+            elif remote is None:
+                files.pop(p, None)
+            else:
+                files[p] = dict(remote, local=self._local_record(p, self._base.get(p)))
+        self._save_manifest(files=files, dirs=self._remote_dirs)
+        return [SyncResult(action, error) for action, _, error in outcomes]
+
+
+class BucketSync(_SyncBase):
+    """Incremental, one-way sync between the local directory `local_dir` and the
+    objects of `bucket` whose name starts with `prefix`.
+
+    A manifest (by default :data:`MANIFEST_NAME` in `local_dir`) records the
+    hash, size and last modification of each object, and the size and mtime
+    (and optionally MD5) of the local file it was synced with. On the next
+    run, only the objects that differ are transferred, over a pool of
+    `max_workers` workers.
+
+    :param:direction 'download' (bucket to local) or 'upload' (local to bucket)
+    :param:delete Delete the local files (resp. objects) missing from the source
+    :param:compare How local changes are detected: 'mtime' (size and mtime) or
+        'hash' (size and MD5). A local file and an object never synced are only
+        taken as the same if the MD5 of the file matches the object hash.
+    :param:include, exclude glob patterns of the paths (relative to `prefix`) to sync / to skip
+    """
+
+    HASH_ALGORITHM = 'md5'
+
+    def __init__(self, local_dir, bucket, direction='download', prefix='', delete=False, compare='mtime',
+                 include=None, exclude=None, max_workers=DEFAULT_MAX_WORKERS, manifest_path=None):
+        super().__init__(local_dir, compare, include, exclude, max_workers, manifest_path)
+        if direction not in ('download', 'upload'):
+            raise ValueError("Invalid value for parameter `direction`; must be 'download' or 'upload'!")
+        self.bucket = bucket
+        self.direction = direction
+        self.prefix = prefix
+        self.delete = delete
+
+        self._base = None
+        self._local = None
+        self._remote = None
+        # paths on both sides, and in sync, when planned
+        self._in_sync = None
+
+    def _identity(self):
+        return {'bucket': self.bucket.dataproxy_entity_name, 'target': self.bucket.target, 'prefix': self.prefix,
+                'include': self.include, 'exclude': self.exclude}
+
+    def _is_segment(self, relpath):
+        """Whether `relpath` is a segment of a large object (see :meth:`Bucket.upload_segmented`),
+        synced as part of the object it assembles"""
+        return (self.prefix + relpath).startswith(self.bucket.SEGMENT_PREFIX + '/')
+
+    def _scan_remote(self):
+        objects = {}
+        for dataproxy_file in self.bucket.ls(prefix=self.prefix or None):
+            relpath = dataproxy_file.name[len(self.prefix):]
+            if relpath and not relpath.endswith('/') and not self._is_segment(relpath) \
+                    and path_selected(relpath, self.include, self.exclude):
+                objects[relpath] = dataproxy_file
+        return objects
+
+    @staticmethod
+    def _remote_record(dataproxy_file):
+        return {'hash': dataproxy_file.hash, 'bytes': dataproxy_file.bytes, 'last_modified': dataproxy_file.last_modified}
+
+    @staticmethod
+    def _remote_changed(remote, entry):
+        # after an upload, the hash and last_modified the server assigned are not known yet
+        record = BucketSync._remote_record(remote)
+        return any(entry[k] is not None and entry[k] != v for k, v in record.items())
+
+    def _same_content(self, relpath, local, remote):
+        """Whether a local file and an object never synced hold the same content: only if
+        their hashes match (the local one is computed for files of the object size)"""
+        if local['size'] != remote.bytes:
+            return False
+        local_hash = local.get('hash') or file_hash(self._local_path(relpath), self.HASH_ALGORITHM)
+        return local_hash == remote.hash
+
+    def _plan_object(self, relpath, local, remote, entry):
+        source, target = (remote, local) if self.direction == 'download' else (local, remote)
+        transfer = 'download' if self.direction == 'download' else 'upload'
+        if source is None:
+            if target is not None and self.delete:
+                return SyncAction('delete_local' if self.direction == 'download' else 'delete_remote', relpath, 'missing from source')
+            return None
+        if target is None:
+            return SyncAction(transfer, relpath, 'missing from target')
+        if entry is None or entry.get('local') is None:
+            if self._same_content(relpath, local, remote):
+                return None
+            return SyncAction(transfer, relpath, 'differs')
+        if self._remote_changed(remote, entry):
+            return SyncAction(transfer, relpath, 'remote changed')
+        if self._local_changed(local, entry['local']):
+            return SyncAction(transfer, relpath, 'local changed')
+        return None
+
+    def plan(self):
+        """Compare both sides, and return the list of :class:`SyncAction` needed to sync them"""
+        self._base = self._load_manifest().get('objects', {})
+        self._local, _ = self._scan_local(self._base)
+        self._local = {relpath: local for relpath, local in self._local.items() if not self._is_segment(relpath)}
+        self._remote = self._scan_remote()
+
+        actions = []
+        self._in_sync = set()
+        for relpath in sorted(set(self._local) | set(self._remote)):
+            action = self._plan_object(relpath, self._local.get(relpath), self._remote.get(relpath), self._base.get(relpath))
+            if action is not None:
+                actions.append(action)
+            elif relpath in self._local and relpath in self._remote:
+                self._in_sync.add(relpath)
+        return actions
+
+    def _execute(self, action):
+        """Execute `action`, and return the new remote record of its path (None if it no longer exists)"""
+        relpath = action.path
+        if action.op == 'download':
+            remote = self._remote[relpath]
+            local_path = self._local_path(relpath)
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            if remote.bytes > DEFAULT_PART_SIZE:
+                remote.download_multipart(local_path)
+            else:
+                remote.download_to(local_path)
+            return self._remote_record(remote)
+        if action.op == 'upload':
+            self.bucket.upload(self._local_path(relpath), self.prefix + relpath)
+            return {'hash': None, 'bytes': self._local[relpath]['size'], 'last_modified': None}
+        if action.op == 'delete_remote':
+            self._remote[relpath].delete()
+        elif action.op == 'delete_local':
+            os.remove(self._local_path(relpath))
+        return None
+
+    def execute(self, actions):
+        """Execute a plan returned by :meth:`plan`, and record the new state in the manifest.
+
+        Return a list of :class:`SyncResult`, one per executed action.
+        """
+        if self._remote is None:
+            raise RuntimeError("BucketSync.execute must be called with a plan returned by BucketSync.plan")
+
+        def execute(action):
+            try:
+                return action, self._execute(action), None
+            except Exception as e:
+                return action, None, e
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            outcomes = list(executor.map(execute, actions))
+
+        objects = {}
+        for relpath, remote in self._remote.items():
+            entry = self._base.get(relpath) or {}
+            record = self._remote_record(remote)
+            if entry and not self._remote_changed(remote, entry):
+                # keep what we know, and learn the hash of the objects we uploaded
+                record = {k: entry[k] if entry[k] is not None else v for k, v in record.items()}
+            objects[relpath] = dict(record, local=self._local[relpath] if relpath in self._in_sync else None)
+        for action, remote, error in outcomes:
+            relpath = action.path
+            if error is not None:
+                if relpath in objects:
+                    objects[relpath]['local'] = None
+            elif remote is None:
+                objects.pop(relpath, None)
+            else:
+                objects[relpath] = dict(remote, local=self._local_record(relpath, self._base.get(relpath)))
+        self._save_manifest(objects=objects)
+        return [SyncResult(action, error) for action, _, error in outcomes]
@@ -0,0 +1,421 @@
+import io
+import json
+import os
+import posixpath
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from fnmatch import fnmatch
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+from urllib.parse import unquote, urlparse
+from ebrains_drive.exceptions import ClientHttpError, UpstreamAPIException
+
+# Default size of the chunks read from / written to the network by the streaming APIs
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+def is_pathlike(obj):
+    return isinstance(obj, (str, bytes, os.PathLike))
+
+
+class ChunkStream(io.RawIOBase):
+    """Read-only, non-seekable file-like object over an iterator of byte chunks.
+
+    Only the chunk currently being consumed is kept in memory.
+    """
+    def __init__(self, chunks: Iterator[bytes], on_close=None):
+        super().__init__()
+        self._chunks = chunks
+        self._on_close = on_close
+        self._buf = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while len(self._buf) == 0:
+            try:
+                self._buf = memoryview(next(self._chunks))
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._buf = memoryview(b"")
+            if self._on_close is not None:
+                self._on_close()
+        super().close()
+
+
+# Default part size and concurrency of multi-part transfers
+DEFAULT_PART_SIZE = 64 * 1024 * 1024
+DEFAULT_MAX_WORKERS = 8
+
+# Object store responses signalling that a signed link has expired
+EXPIRED_LINK_STATUS = (401, 403)
+
+
+class ExpiringLink(object):
+    """Thread-safe holder of a short-lived signed url.
+
+    :param:fetch callable returning a fresh url
+    """
+    def __init__(self, fetch: Callable[[], str]):
+        self._fetch = fetch
+        self._lock = threading.Lock()
+        self._url = None
+
+    def get(self) -> str:
+        with self._lock:
+            if self._url is None:
+                self._url = self._fetch()
+            return self._url
+
+    def renew(self, stale_url: str) -> str:
+        """Renew the link, unless another thread already replaced `stale_url`."""
+        with self._lock:
+            if self._url is None or self._url == stale_url:
+                self._url = self._fetch()
+            return self._url
+
+
+def split_ranges(size: int, part_size: int) -> List[Tuple[int, int]]:
+    """Split `size` bytes into inclusive (start, end) byte ranges of at most `part_size` bytes."""
+    if part_size <= 0:
+        raise ValueError("part_size must be positive")
+    return [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+
+
+def preallocate(path, size: int):
+    """Create (or truncate) `path` and extend it to `size` bytes."""
+    with open(path, "wb") as fp:
+        fp.truncate(size)
+
+
+def download_range(session, link: ExpiringLink, path, start: int, end: int, *, chunk_size: int=DEFAULT_CHUNK_SIZE, max_renewals: int=3, on_chunk=None) -> int:
+    """Download the inclusive byte range [`start`, `end`] of the object behind `link`
+    into the same offsets of the (preallocated) local file at `path`.
+
+    If the signed link has expired, it is renewed and only this range is retried.
+
+    Returns the number of bytes written.
+    """
+    url = link.get()
+    for _ in range(max_renewals + 1):
+        with session.get(url, headers={"Range": f"bytes={start}-{end}"}, stream=True) as resp:
+            if resp.status_code in EXPIRED_LINK_STATUS:
+                url = link.renew(url)
+                continue
+            if resp.status_code != 206:
+                raise ClientHttpError(resp.status_code, f"Expected 206 for range {start}-{end}, but get {resp.status_code}")
+            written = 0
+            with open(path, "r+b") as fp:
+                fp.seek(start)
+                for chunk in resp.iter_content(chunk_size):
+                    fp.write(chunk)
+                    written += len(chunk)
+                    if on_chunk is not None:
+                        on_chunk(len(chunk))
+            if written != end - start + 1:
+                raise UpstreamAPIException(f"Range {start}-{end}: expected {end - start + 1} bytes, but get {written}")
+            return written
+    raise ClientHttpError(resp.status_code, f"Signed link still rejected after {max_renewals} renewals")
+
+
+def download_ranges(session, link: ExpiringLink, path, ranges: List[Tuple[int, int]], *, max_workers: int=DEFAULT_MAX_WORKERS, chunk_size: int=DEFAULT_CHUNK_SIZE, on_chunk=None, on_range_done=None):
+    """Download `ranges` concurrently, with at most `max_workers` requests in flight.
+
+    `on_range_done((start, end))` is called, from the calling thread, as each range completes.
+    The first failing range cancels the pending ones and its exception is re-raised.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(download_range, session, link, path, start, end, chunk_size=chunk_size, on_chunk=on_chunk): (start, end)
+            for start, end in ranges
+        }
+        try:
+            for future in as_completed(futures):
+                future.result()
+                if on_range_done is not None:
+                    on_range_done(futures[future])
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+
+class FileSlice(io.RawIOBase):
+    """Read-only, seekable view over `length` bytes of the local file at `path`, starting at `offset`.
+
+    It defines `__len__`, so that requests streams it as a request body with a Content-Length.
+    """
+    def __init__(self, path, offset: int, length: int):
+        super().__init__()
+        self._fp = open(path, "rb")
+        self._offset = offset
+        self._length = length
+        self._pos = 0
+        self._fp.seek(offset)
+
+    def __len__(self):
+        return self._length
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            pos += self._pos
+        elif whence == io.SEEK_END:
+            pos += self._length
+        self._pos = min(max(pos, 0), self._length)
+        self._fp.seek(self._offset + self._pos)
+        return self._pos
+
+    def readinto(self, b):
+        n = min(len(b), self._length - self._pos)
+        if n <= 0:
+            return 0
+        n = self._fp.readinto(memoryview(b)[:n])
+        self._pos += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._fp.close()
+        super().close()
+
+
+# Defaults of RangeReader: size of the blocks fetched and cached, number of
+# blocks cached, and maximum number of blocks read ahead of sequential reads
+DEFAULT_BLOCK_SIZE = 256 * 1024
+DEFAULT_CACHE_BLOCKS = 64
+DEFAULT_MAX_READAHEAD = 8
+
+
+class RangeReader(io.RawIOBase):
+    """Read-only, seekable file-like object over the `size` bytes of the object
+    behind `link`, read with HTTP Range requests.
+
+    The object is read by blocks of `block_size` bytes, the last `cache_blocks`
+    of which are cached. The missing blocks of a read are fetched together,
+    one request per run of adjacent blocks, and sequential reads fetch up to
+    `max_readahead` more blocks ahead (the window doubling with each
+    sequential miss). An expired signed link is renewed transparently.
+
+    `requests` and `bytes_fetched` count what was transferred.
+    """
+    def __init__(self, session, link: ExpiringLink, size: int, *, block_size: int=DEFAULT_BLOCK_SIZE,
+                 cache_blocks: int=DEFAULT_CACHE_BLOCKS, max_readahead: int=DEFAULT_MAX_READAHEAD, max_renewals: int=3):
+        super().__init__()
+        if block_size <= 0:
+            raise ValueError("block_size must be positive")
+        self._session = session
+        self._link = link
+        self.size = size
+        self.block_size = block_size
+        self.cache_blocks = cache_blocks
+        self.max_readahead = max_readahead
+        self.max_renewals = max_renewals
+        self._blocks = OrderedDict()
+        self._pos = 0
+        # end of the last read, to tell sequential reads
+        self._read_end = None
+        self._readahead = 0
+        self.requests = 0
+        self.bytes_fetched = 0
+
+    def __len__(self):
+        return self.size
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            pos += self._pos
+        elif whence == io.SEEK_END:
+            pos += self.size
+        if pos < 0:
+            raise ValueError("negative seek position %d" % pos)
+        self._pos = pos
+        return self._pos
+
+    def readinto(self, b):
+        n = min(len(b), self.size - self._pos)
+        if n <= 0:
+            return 0
+        first, last = self._pos // self.block_size, (self._pos + n - 1) // self.block_size
+        blocks = self._get_blocks(first, last, sequential=self._pos == self._read_end)
+        view = memoryview(b).cast('B')
+        copied = 0
+        offset = self._pos - first * self.block_size
+        for index in range(first, last + 1):
+            block = blocks[index][offset:offset + n - copied]
+            view[copied:copied + len(block)] = block
+            copied += len(block)
+            offset = 0
+        self._pos += copied
+        self._read_end = self._pos
+        return copied
+
+    def _get_blocks(self, first, last, sequential=False):
+        """The blocks `first` to `last`, from the cache or fetched"""
+        blocks = {}
+        missing = []
+        for index in range(first, last + 1):
+            block = self._blocks.get(index)
+            if block is None:
+                missing.append(index)
+            else:
+                self._blocks.move_to_end(index)
+                blocks[index] = block
+        if missing:
+            # read ahead of sequential reads only
+            self._readahead = min(max(2 * self._readahead, 1), self.max_readahead) if sequential else 0
+            last_block = (self.size - 1) // self.block_size
+            missing.extend(index for index in range(last + 1, min(last + self._readahead, last_block) + 1)
+                           if index not in self._blocks)
+
+        # one request per run of adjacent missing blocks
+        runs = []
+        for index in missing:
+            if runs and runs[-1][1] == index - 1:
+                runs[-1][1] = index
+            else:
+                runs.append([index, index])
+        for run_first, run_last in runs:
+            start = run_first * self.block_size
+            data = self._get_range(start, min((run_last + 1) * self.block_size, self.size) - 1)
+            for index in range(run_first, run_last + 1):
+                offset = (index - run_first) * self.block_size
+                block = data[offset:offset + self.block_size]
+                if index <= last:
+                    blocks[index] = block
+                self._blocks[index] = block
+        while len(self._blocks) > self.cache_blocks:
+            self._blocks.popitem(last=False)
+        return blocks
+
+    def _get_range(self, start, end):
+        url = self._link.get()
+        for _ in range(self.max_renewals + 1):
+            with self._session.get(url, headers={"Range": f"bytes={start}-{end}"}, stream=True) as resp:
+                if resp.status_code in EXPIRED_LINK_STATUS:
+                    url = self._link.renew(url)
+                    continue
+                # a whole object is sent with a 200
+                if resp.status_code != 206 and not (resp.status_code == 200 and start == 0 and end == self.size - 1):
+                    raise ClientHttpError(resp.status_code, f"Expected 206 for range {start}-{end}, but get {resp.status_code}")
+                data = resp.content
+            if len(data) != end - start + 1:
+                raise UpstreamAPIException(f"Range {start}-{end}: expected {end - start + 1} bytes, but get {len(data)}")
+            self.requests += 1
+            self.bytes_fetched += len(data)
+            return data
+        raise ClientHttpError(resp.status_code, f"Signed link still rejected after {self.max_renewals} renewals")
+
+    def close(self):
+        if not self.closed:
+            self._blocks.clear()
+        super().close()
+
+
+def swift_object_path(url: str) -> str:
+    """Get the "/container/object" path of a Swift object from its (signed) url,
+    as expected by static large object manifests."""
+    # e.g. https://host/v1/AUTH_account/container/object?temp_url_sig=...
+    parts = unquote(urlparse(url).path).split("/")
+    account_idx = next((i for i, part in enumerate(parts) if part.startswith("AUTH_")), 2)
+    return "/" + "/".join(parts[account_idx + 1:])
+
+
+# Suffix of the sidecar files recording the progress of resumable transfers
+STATE_SUFFIX = ".ebrains-transfer"
+
+
+class TransferState(object):
+    """Progress of a resumable transfer, checkpointed to a small JSON sidecar file.
+
+    :param:path path of the sidecar file
+    :param:identity JSON-serialisable dict describing the transfer (e.g. object hash
+        and size). Progress saved for a different identity is discarded on load.
+    """
+    def __init__(self, path, identity: Dict[str, Any]):
+        self.path = path
+        self.identity = identity
+        self.done = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path, identity: Dict[str, Any]) -> 'TransferState':
+        state = cls(path, identity)
+        try:
+            with open(path) as fp:
+                saved = json.load(fp)
+        except (OSError, ValueError):
+            return state
+        if saved.get("identity") == json.loads(json.dumps(identity)):
+            state.done = saved.get("done", {})
+        return state
+
+    def is_done(self, key) -> bool:
+        return str(key) in self.done
+
+    def mark_done(self, key, value=True):
+        """Record `key` as done (with an optional JSON-serialisable `value`) and checkpoint to disk."""
+        with self._lock:
+            self.done[str(key)] = value
+            self.save()
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as fp:
+            json.dump({"identity": self.identity, "done": self.done}, fp)
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class TransferResult(namedtuple('TransferResult', ['local_path', 'remote_path', 'dirent', 'error'])):
+    """Outcome of the transfer of one file in a bulk operation.
+
+    `dirent` is the remote file object (if known), `error` the exception raised, if any.
+    """
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def path_selected(relpath: str, include=None, exclude=None) -> bool:
+    """Whether `relpath` matches one of the `include` glob patterns (if any) and none of the `exclude` ones.
+
+    Patterns are matched against both the relative path and the base name.
+    """
+    def matches(patterns):
+        return any(fnmatch(relpath, p) or fnmatch(posixpath.basename(relpath), p) for p in patterns)
+    if exclude and matches(exclude):
+        return False
+    return not include or matches(include)
@@ -40,6 +40,31 @@ def _raise_on(http_code: int, Ex: Type[Exception]):
                             raise e
                 return wrapped
 
+            elif inspect.isasyncgenfunction(func):
+                @wraps(func)
+                async def wrapped(*args, **kwargs):
+                    try:
+                        async for item in func(*args, **kwargs):
+                            yield item
+                    except ClientHttpError as e:
+                        if e.code == http_code:
+                            raise Ex(msg)
+                        else:
+                            raise e
+                return wrapped
+
+            elif inspect.iscoroutinefunction(func):
+                @wraps(func)
+                async def wrapped(*args, **kwargs):
+                    try:
+                        return await func(*args, **kwargs)
+                    except ClientHttpError as e:
+                        if e.code == http_code:
+                            raise Ex(msg)
+                        else:
+                            raise e
+                return wrapped
+
             else:
                 @wraps(func)
                 def wrapped(*args, **kwargs):
@@ -56,21 +81,12 @@ def _raise_on(http_code: int, Ex: Type[Exception]):
 
 on_401_raise_unauthorized = _raise_on(401, Unauthorized)
 
+on_404_raise_does_not_exist = _raise_on(404, DoesNotExist)
+
 def raise_does_not_exist(msg):
     """Decorator to turn a function that get a http 404 response to a
     :exc:`DoesNotExist` exception."""
-    def decorator(func):
-        @wraps(func)
-        def wrapped(*args, **kwargs):
-            try:
-                return func(*args, **kwargs)
-            except ClientHttpError as e:
-                if e.code == 404:
-                    raise DoesNotExist(msg)
-                else:
-                    raise
-        return wrapped
-    return decorator
+    return on_404_raise_does_not_exist(msg)
 
 def to_utf8(obj):
     if isinstance(obj, str):
@@ -14,6 +14,7 @@ setup(name='ebrains-drive',
       platforms=['Any'],
       packages=find_packages(),
       install_requires=['requests', 'tqdm'],
+      extras_require={'async': ['httpx']},
       classifiers=['Development Status :: 4 - Beta',
                    'License :: OSI Approved :: BSD License',
                    'Operating System :: OS Independent',
@@ -0,0 +1,161 @@
+import asyncio
+import base64
+import io
+import json
+import pytest
+
+httpx = pytest.importorskip('httpx')
+
+from ebrains_drive.aio import AsyncBucket, AsyncBucketApiClient, AsyncDriveApiClient, AsyncDataproxyFile, AsyncSeafDir, AsyncSeafFile
+from ebrains_drive.exceptions import ClientHttpError, DoesNotExist
+from ebrains_drive.retry import RetryPolicy
+
+bucket_json = {
+    'name': 'foo',
+    'objects_count': 2,
+    'bytes': 20,
+    'last_modified': 'foo-bar',
+    'is_public': False,
+    'role': 'admin',
+}
+
+def file_json(name):
+    return {'name': name, 'hash': 'hash-' + name, 'last_modified': 'last-modified', 'bytes': 10, 'content_type': 'json'}
+
+# a JWT expiring in 2100
+TOKEN = 'hdr.' + base64.b64encode(json.dumps({'exp': 4102444800}).encode()).decode().rstrip('=') + '.sig'
+
+def no_wait_policy():
+    return RetryPolicy(backoff_factor=0)
+
+
+def test_drive_client(tmp_path):
+    requests = []
+    def handler(request):
+        requests.append(request)
+        path = request.url.path
+        if path == '/api2/repos/repo-id':
+            return httpx.Response(200, json={'id': 'repo-id', 'name': 'repo'})
+        if path == '/api2/repos/repo-id/dir/':
+            return httpx.Response(200, headers={'oid': 'dir-id'}, json=[
+                {'name': 'a.txt', 'type': 'file', 'id': 'a-id', 'size': 3},
+                {'name': 'sub', 'type': 'dir', 'id': 'sub-id'},
+            ])
+        if path == '/api2/repos/repo-id/file/':
+            return httpx.Response(200, text='"https://drive/files/a.txt"')
+        if path == '/files/a.txt':
+            return httpx.Response(200, content=b'abc')
+        return httpx.Response(404)
+
+    async def main():
+        async with AsyncDriveApiClient(token='token', transport=httpx.MockTransport(handler)) as client:
+            repo = await client.repos.get_repo('repo-id')
+            seafdir = await repo.get_dir('/')
+            entries = await seafdir.ls()
+            with pytest.raises(DoesNotExist):
+                await client.repos.get_repo('missing')
+            content = await entries[0].get_content()
+            written = await entries[0].download_to(str(tmp_path / 'a.txt'), chunk_size=2)
+            with await entries[0].open_mmap() as mapped:
+                assert mapped[:] == b'abc'
+            return seafdir, entries, content, written
+
+    seafdir, entries, content, written = asyncio.run(main())
+    assert isinstance(seafdir, AsyncSeafDir) and seafdir.id == 'dir-id'
+    assert [type(e) for e in entries] == [AsyncSeafFile, AsyncSeafDir]
+    assert entries[0].path == '/a.txt'
+    assert content == b'abc'
+    assert written == 3 and (tmp_path / 'a.txt').read_bytes() == b'abc'
+    assert requests[0].headers['Authorization'] == 'Bearer token'
+
+
+def test_bucket_client_concurrent_and_retried():
+    attempts = {}
+    def handler(request):
+        path = request.url.path
+        if path == '/api/v1/buckets/foo/stat':
+            return httpx.Response(200, json=bucket_json)
+        if path == '/api/v1/buckets/foo':
+            if request.url.params.get('marker'):
+                return httpx.Response(200, json={'objects': []})
+            return httpx.Response(200, json={'objects': [file_json('a'), file_json('b')]})
+        name = path.rsplit('/', 1)[1]
+        if request.url.host == 'object-store':
+            # a transient failure of each first download
+            attempts[name] = attempts.get(name, 0) + 1
+            if attempts[name] == 1:
+                return httpx.Response(503)
+            return httpx.Response(200, content=name.encode() * 3)
+        assert request.url.params['redirect'] == 'false'
+        return httpx.Response(200, json={'url': 'https://object-store/' + name})
+
+    async def main():
+        async with AsyncBucketApiClient(transport=httpx.MockTransport(handler), retry_policy=no_wait_policy()) as client:
+            bucket = await client.buckets.get_bucket('foo')
+            files = [f async for f in bucket.ls()]
+            contents = await asyncio.gather(*(f.get_content() for f in files))
+            chunks = [chunk async for chunk in files[0].iter_content(chunk_size=2)]
+            return files, contents, chunks
+
+    files, contents, chunks = asyncio.run(main())
+    assert all(isinstance(f, AsyncDataproxyFile) for f in files)
+    assert contents == [b'aaa', b'bbb']
+    assert b''.join(chunks) == b'aaa'
+    assert attempts == {'a': 3, 'b': 2}
+
+
+def test_bucket_upload():
+    uploaded = []
+    requests = []
+    def handler(request):
+        requests.append(request)
+        if request.url.host == 'object-store':
+            uploaded.append((request.headers.get('Authorization'), request.read()))
+            return httpx.Response(201)
+        assert request.method == 'PUT'
+        return httpx.Response(200, json={'url': 'https://object-store/upload'})
+
+    async def main():
+        async with AsyncBucketApiClient(token=TOKEN, transport=httpx.MockTransport(handler)) as client:
+            bucket = AsyncBucket.from_json(client, bucket_json)
+            await bucket.upload(io.BytesIO(b'0123456789'), '/dest', chunk_size=4)
+
+    asyncio.run(main())
+    assert uploaded == [(None, b'0123456789')]
+    assert requests[0].headers['Authorization'] == 'Bearer ' + TOKEN
+
+
+def test_objects_only_expose_async_operations():
+    client = AsyncBucketApiClient(token=TOKEN)
+    bucket = AsyncBucket.from_json(client, bucket_json)
+    f = bucket._from_listing(file_json('a'))
+    assert isinstance(f, AsyncDataproxyFile) and str(f) == 'AsyncDataproxyFile[bucket=foo, path=a, size=10]'
+    for name in ('walk', 'delete_many', 'inventory', 'upload_segmented'):
+        assert not hasattr(bucket, name)
+    for name in ('open', 'download_multipart', 'get_stream'):
+        assert not hasattr(f, name)
+
+    repo = AsyncDriveApiClient(token=TOKEN).repos
+    seafdir = AsyncSeafDir(type('Repo', (), {'client': repo.client, 'id': 'repo-id'})(), '/d', 'dir-id', 'dir')
+    for name in ('walk', 'copy_items', 'move_items', 'rename', 'moveTo', 'upload_tree', 'download_tree', 'check_exists_many'):
+        assert not hasattr(seafdir, name)
+
+
+def test_transfer_errors():
+    def handler(request):
+        if request.url.host == 'object-store':
+            return httpx.Response(403)
+        if request.method == 'PUT':
+            return httpx.Response(200, json={'url': 'https://object-store/upload'})
+        return httpx.Response(200, json={'url': 'https://object-store/a'})
+
+    async def main():
+        async with AsyncBucketApiClient(token=TOKEN, transport=httpx.MockTransport(handler), retry_policy=no_wait_policy()) as client:
+            bucket = AsyncBucket.from_json(client, bucket_json)
+            f = AsyncDataproxyFile.from_json(client, bucket, file_json('a'))
+            for call in (lambda: bucket.upload(b'data', 'a'), f.get_content, lambda: f.download_to(io.BytesIO())):
+                with pytest.raises(ClientHttpError) as exc_info:
+                    await call()
+                assert exc_info.value.code == 403
+
+    asyncio.run(main())
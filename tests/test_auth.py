@@ -0,0 +1,88 @@
+import base64
+import json
+import time
+import pytest
+import requests
+from unittest.mock import MagicMock, patch
+from ebrains_drive.auth import TokenManager, token_expiry
+from ebrains_drive.client import BucketApiClient, DriveApiClient
+from ebrains_drive.exceptions import TokenExpired
+from ebrains_drive.session import SessionManager
+
+def jwt(exp):
+    info = base64.urlsafe_b64encode(json.dumps({'exp': exp}).encode()).decode().rstrip('=')
+    return 'hdr.%s.sig' % info
+
+def token_session(*responses):
+    session = MagicMock()
+    session.post.return_value.json.side_effect = list(responses)
+    return session
+
+
+def test_token_expiry():
+    assert token_expiry(jwt(1234)) == 1234
+    assert token_expiry('not-a-jwt') is None
+    assert token_expiry('a.b.c') is None
+
+def test_valid_token_not_refreshed():
+    session = token_session()
+    manager = TokenManager(jwt(time.time() + 3600), username='u', password='p', token_url='https://iam/token', session=session)
+    assert manager.token == manager._token
+    session.post.assert_not_called()
+
+def test_refresh_before_expiry():
+    new_token = jwt(time.time() + 3600)
+    session = token_session({'access_token': new_token, 'refresh_token': 'refresh'})
+    manager = TokenManager(jwt(time.time() + 10), username='u', password='p', token_url='https://iam/token', session=session)
+    assert manager.token == new_token
+    assert session.post.call_args.kwargs['data']['grant_type'] == 'password'
+    assert manager.refresh_token == 'refresh'
+
+def test_refresh_token_preferred():
+    new_token = jwt(time.time() + 3600)
+    session = token_session({'access_token': new_token})
+    manager = TokenManager(jwt(time.time() - 10), refresh_token='refresh', token_url='https://iam/token', session=session)
+    assert manager.token == new_token
+    assert session.post.call_args.kwargs['data'] == {'grant_type': 'refresh_token', 'refresh_token': 'refresh'}
+
+def test_failed_refresh_before_expiry():
+    session = MagicMock()
+    session.post.side_effect = requests.ConnectionError
+    token = jwt(time.time() + 10)
+    manager = TokenManager(token, username='u', password='p', token_url='https://iam/token', session=session)
+    # still valid: used while IAM is unreachable
+    assert manager.token == token
+    manager.expires_at = time.time() - 1
+    with pytest.raises(requests.ConnectionError):
+        manager.token
+
+def test_expired_without_credentials():
+    manager = TokenManager(jwt(time.time() - 10), token_url='https://iam/token', session=token_session())
+    with pytest.raises(TokenExpired):
+        manager.token
+
+def test_shared_between_clients():
+    drive_client = DriveApiClient(token=jwt(time.time() + 3600))
+    bucket_client = BucketApiClient(token_manager=drive_client.token_manager)
+    assert bucket_client.token_manager is drive_client.token_manager
+    assert not bucket_client.is_public_client
+
+def test_login_through_session_manager():
+    token = jwt(time.time() + 3600)
+    resp = MagicMock(status_code=200)
+    resp.json.return_value = {'access_token': token, 'refresh_token': 'refresh'}
+    with patch.object(requests.Session, 'request', return_value=resp) as request:
+        client = DriveApiClient(username='u', password='p')
+    assert client.token_manager.token == token
+    method, url = request.call_args.args[:2]
+    assert method == 'POST' and url == client.iam_token_url
+    assert request.call_args.kwargs['data']['grant_type'] == 'password'
+
+def test_refresh_through_session_manager():
+    new_token = jwt(time.time() + 3600)
+    resp = MagicMock(status_code=200)
+    resp.json.return_value = {'access_token': new_token}
+    manager = TokenManager(jwt(time.time() - 10), refresh_token='refresh', token_url='https://iam/token',
+                           session=SessionManager())
+    with patch.object(requests.Session, 'request', return_value=resp):
+        assert manager.token == new_token
@@ -1,8 +1,9 @@
+import json
 import pytest
 from unittest.mock import patch, mock_open
 from unittest.mock import MagicMock
 from ebrains_drive.bucket import Bucket
-from ebrains_drive.exceptions import ClientHttpError, Unauthorized
+from ebrains_drive.exceptions import ClientHttpError, DoesNotExist, InvalidParameter, Unauthorized
 from io import StringIO, IOBase
 from itertools import product
 
@@ -87,12 +88,9 @@ def test_ls_when_repeats():
 
 
 @pytest.fixture
-def mocked_request():
-    try:
-        with patch('requests.request') as patched_obj:
-            yield patched_obj
-    finally:
-        ...
+def mocked_request(mock_client):
+    mock_client.transfer_session = MagicMock()
+    return mock_client.transfer_session.request
 
 @pytest.fixture
 def mock_open_fixture():
@@ -126,3 +124,217 @@ def test_upload(filelike, kwargs, mocked_request, mock_open_fixture, mock_client
     else:
         raise RuntimeError(f" should be either str or IOBase")
     mocked_request.assert_called_with("PUT", "http://foo-bar.co/", data=data, **kwargs )
+    # no listing of segments
+    mock_client.get.assert_not_called()
+
+
+def test_upload_segmented(mocked_request, mock_client: MockClient, tmp_path):
+    path = tmp_path / "big"
+    path.write_bytes(b"0123456789")
+
+    bucket = Bucket.from_json(mock_client, bucket_json)
+    mock_client.put.side_effect = lambda url, **kwargs: MockHttpResp({
+        'url': 'https://object-store/v1/AUTH_acc/foo/' + url.split('/v1/buckets/foo/')[1]
+    })
+    bodies = []
+    def request(method, url, data, **kwargs):
+        bodies.append(data if isinstance(data, str) else data.read())
+        resp = MagicMock()
+        resp.ok = True
+        resp.headers = {'ETag': '"etag"'}
+        return resp
+    mocked_request.side_effect = request
+
+    bucket.upload(str(path), 'filename', multipart_threshold=4, segment_size=4, max_workers=2)
+
+    # three segments, then the manifest
+    assert sorted(bodies[:3]) == [b"0123", b"4567", b"89"]
+    manifest_call = mocked_request.call_args
+    assert manifest_call.kwargs['params'] == {'multipart-manifest': 'put'}
+    manifest = json.loads(bodies[3])
+    assert [seg['size_bytes'] for seg in manifest] == [4, 4, 2]
+    assert all(seg['path'].startswith('/foo/.segments/filename/') for seg in manifest)
+    assert manifest[0]['path'].endswith('/00000000')
+
+def segmented_bucket(mock_client, listing, fail_manifest=False):
+    """A bucket whose upload urls are object store urls, `listing` holding the object names"""
+    bucket = Bucket.from_json(mock_client, bucket_json)
+    mock_client.put.side_effect = lambda url, **kwargs: MockHttpResp({
+        'url': 'https://object-store/v1/AUTH_acc/foo/' + url.split('/v1/buckets/foo/')[1]
+    })
+    def get(url, params):
+        names = [n for n in sorted(listing) if n.startswith(params['prefix'] or '') and (params['marker'] is None or n > params['marker'])]
+        return MockHttpResp({'objects': [{**file_json1, 'name': n} for n in names]})
+    mock_client.get.side_effect = get
+    def request(method, url, data, params=None, **kwargs):
+        resp = MagicMock()
+        resp.ok = True
+        resp.headers = {'ETag': '"etag"'}
+        if params and fail_manifest:
+            resp.raise_for_status.side_effect = ClientHttpError(500, 'failed')
+        else:
+            listing.add(url.split('/AUTH_acc/foo/')[1])
+        return resp
+    mock_client.transfer_session = MagicMock()
+    mock_client.transfer_session.request.side_effect = request
+    deleted = []
+    def delete(name):
+        deleted.append(name)
+        listing.discard(name)
+    bucket._delete_object = delete
+    return bucket, deleted
+
+def test_upload_segmented_cleans_up(mock_client, tmp_path):
+    path = tmp_path / "big"
+    path.write_bytes(b"0123456789")
+    listing = {'filename', '.segments/filename/old-id/00000000', '.segments/filename/sub/new-id/00000000'}
+    bucket, deleted = segmented_bucket(mock_client, listing)
+
+    bucket.upload_segmented(str(path), 'filename', segment_size=4)
+    # the segments of the previous version are deleted, not those of 'filename/sub'
+    assert deleted == ['.segments/filename/old-id/00000000']
+    segments = sorted(n for n in listing if n.startswith('.segments/filename/') and '/sub/' not in n)
+    assert len(segments) == 3
+
+    # overwritten by a small object: the segments are only listed on request
+    listed = mock_client.get.call_count
+    bucket.upload(str(path), 'filename')
+    assert mock_client.get.call_count == listed and len(deleted) == 1
+    bucket.upload(str(path), 'filename', delete_segments=True)
+    assert not [n for n in listing if n.startswith('.segments/filename/') and '/sub/' not in n]
+
+def test_delete_many_segments(mock_client):
+    listing = {'big', 'small', '.segments/big/id/00000000', '.segments/big/id/00000001'}
+    bucket, deleted = segmented_bucket(mock_client, listing)
+    assert bucket.delete_many(['small']).deleted == ['small']
+    mock_client.get.assert_not_called()
+    result = bucket.delete_many(['big'], delete_segments=True)
+    assert result.ok and result.deleted == ['big', '.segments/big/id/00000000', '.segments/big/id/00000001']
+    assert listing == set()
+
+def test_upload_segmented_failure_cleans_up(mock_client, tmp_path):
+    path = tmp_path / "big"
+    path.write_bytes(b"0123456789")
+    listing = set()
+    bucket, deleted = segmented_bucket(mock_client, listing, fail_manifest=True)
+    with pytest.raises(ClientHttpError):
+        bucket.upload_segmented(str(path), 'filename', segment_size=4)
+    assert len(deleted) == 3 and listing == set()
+
+def test_segment_size_within_manifest_limit(mock_client, tmp_path):
+    path = tmp_path / "big"
+    path.write_bytes(b"x" * 95)
+    bucket, _ = segmented_bucket(mock_client, set())
+    bucket.MAX_SEGMENTS = 10
+    bucket.upload_segmented(str(path), 'filename', segment_size=4)
+    manifest = json.loads(mock_client.transfer_session.request.call_args.kwargs['data'])
+    assert [seg['size_bytes'] for seg in manifest] == [10] * 9 + [5]
+
+def test_ls_pages():
+    client = MockClient()
+    pages = {None: [file_json1, {**file_json1, 'name': 'foo2'}], 'foo2': [{**file_json1, 'name': 'foo3'}], 'foo3': []}
+    client.get = MagicMock(side_effect=lambda url, params: MockHttpResp({'objects': pages[params['marker']]}))
+    bucket = Bucket.from_json(client, bucket_json)
+
+    for prefetch in (True, False):
+        assert [len(page) for page in bucket.ls_pages(page_size=2, prefetch=prefetch)] == [2, 1]
+        assert [f.name for f in bucket.ls(page_size=2, prefetch=prefetch)] == ['foo', 'foo2', 'foo3']
+    assert all(call.kwargs['params']['limit'] == 2 for call in client.get.call_args_list)
+
+def test_ls_when_repeats_across_pages():
+    client = MockClient()
+    client.get = MagicMock(side_effect=lambda url, params: MockHttpResp({'objects': [file_json1]}))
+    bucket = Bucket.from_json(client, bucket_json)
+
+    with pytest.raises(RuntimeError):
+        list(bucket.ls(prefetch=False))
+
+def test_ls_delimiter_and_walk():
+    listings = {
+        None: [{'subdir': 'a/'}, {'subdir': 'b/'}, file_json1],
+        'a/': [{**file_json1, 'name': 'a/x'}, {'subdir': 'a/c/'}],
+        'a/c/': [{**file_json1, 'name': 'a/c/y'}],
+        'b/': [],
+    }
+    def get(url, params):
+        assert params['delimiter'] == '/'
+        return MockHttpResp({'objects': listings[params['prefix']] if params['marker'] is None else []})
+    client = MockClient()
+    client.get = MagicMock(side_effect=get)
+    bucket = Bucket.from_json(client, bucket_json)
+
+    top = list(bucket.ls(delimiter='/'))
+    assert [(type(e).__name__, e.name) for e in top] == [('DataproxyDir', 'a/'), ('DataproxyDir', 'b/'), ('DataproxyFile', 'foo')]
+    assert [f.name for f in top[0].ls()] == ['a/x', 'a/c/']
+
+    walked = [(prefix, [d.name for d in dirs], [f.name for f in files]) for prefix, dirs, files in bucket.walk(max_workers=2)]
+    assert walked == [
+        ('', ['a/', 'b/'], ['foo']),
+        ('a/', ['a/c/'], ['a/x']),
+        ('b/', [], []),
+        ('a/c/', [], ['a/c/y']),
+    ]
+
+def test_get_file_exact_match():
+    objects = {'run1': {**file_json1, 'name': 'run1'}, 'run10': {**file_json1, 'name': 'run10'}}
+    def get(url, params):
+        assert params['limit'] == 1
+        matches = sorted(name for name in objects if name.startswith(params['prefix']))
+        return MockHttpResp({'objects': [objects[name] for name in matches[:1]]})
+    client = MockClient()
+    client.get = MagicMock(side_effect=get)
+    bucket = Bucket.from_json(client, bucket_json)
+
+    assert bucket.get_file('/run1').name == 'run1'
+    assert client.get.call_count == 1
+    with pytest.raises(DoesNotExist):
+        bucket.get_file('run')
+    assert [f and f.name for f in bucket.get_files(['run10', 'run', 'run1'])] == ['run10', None, 'run1']
+
+def test_delete_many():
+    client = MockClient()
+    def delete(url):
+        name = url.rsplit('/', 1)[1]
+        if name == 'missing':
+            raise ClientHttpError(404, 'not found')
+        if name == 'locked':
+            raise ClientHttpError(403, 'forbidden')
+        return MockHttpResp({'detail': f'{name} has been removed'})
+    client.delete = MagicMock(side_effect=delete)
+    bucket = Bucket.from_json(client, bucket_json)
+
+    result = bucket.delete_many(['a', '/b', 'missing', 'locked'], page_size=3, max_workers=2)
+    assert sorted(result.deleted) == ['a', 'b', 'missing']
+    assert list(result.failed) == ['locked'] and result.failed['locked'].code == 403
+    assert not result.ok
+
+def test_delete_many_prefix():
+    client = MockClient()
+    pages = {None: [{**file_json1, 'name': 'tmp/a'}, {**file_json1, 'name': 'tmp/b'}], 'tmp/b': []}
+    client.get = MagicMock(side_effect=lambda url, params: MockHttpResp({'objects': pages[params['marker']]}))
+    client.delete = MagicMock(return_value=MockHttpResp({'detail': 'has been removed'}))
+    bucket = Bucket.from_json(client, bucket_json)
+
+    result = bucket.delete_many(prefix='tmp/')
+    assert result.ok and result.deleted == ['tmp/a', 'tmp/b']
+    with pytest.raises(InvalidParameter):
+        bucket.delete_many()
+
+def test_inventory():
+    objects = [
+        {**file_json1, 'name': 'a', 'hash': '0123456789abcdef0123456789abcdef', 'bytes': 1},
+        {**file_json1, 'name': 'b/é', 'hash': 'slo-etag', 'bytes': 2},
+        {**file_json1, 'name': 'c', 'hash': 'fedcba9876543210fedcba9876543210', 'bytes': 3, 'content_type': 'text/plain'},
+    ]
+    client = MockClient()
+    client.get = MagicMock(side_effect=lambda url, params: MockHttpResp({'objects': objects if params['marker'] is None else []}))
+    bucket = Bucket.from_json(client, bucket_json)
+
+    inventory = bucket.inventory()
+    assert len(inventory) == 3 and inventory.total_bytes == 6
+    assert list(inventory.names()) == ['a', 'b/é', 'c']
+    assert [(f.name, f.hash, f.bytes, f.content_type, f.last_modified) for f in inventory] == \
+        [(o['name'], o['hash'], o['bytes'], o['content_type'], o['last_modified']) for o in objects]
+    assert inventory[-1].name == 'c' and inventory[-1].bucket is bucket
+    assert inventory.index('b/é') == 1
+    assert inventory.get('b') is None
@@ -0,0 +1,162 @@
+import os
+import time
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+from ebrains_drive.cache import ContentCache, MetadataCache
+from ebrains_drive.files import SeafDir, SeafFile
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+    def __call__(self):
+        return self.now
+
+class MockHttpResp:
+    def __init__(self, resp=None, text='', headers=None):
+        self.resp = resp
+        self.text = text
+        self.headers = headers or {}
+    def json(self):
+        return self.resp
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+def test_ttl_and_lru(clock):
+    cache = MetadataCache(max_entries=2, ttl=10, clock=clock)
+    cache.set(('file', 'r', '/a'), 1)
+    cache.set(('file', 'r', '/b'), 2)
+    assert cache.get(('file', 'r', '/a')) == 1
+    cache.set(('file', 'r', '/c'), 3)
+    # /b was the least recently used
+    assert cache.lookup(('file', 'r', '/b')) is None
+    clock.now = 10
+    assert cache.get(('file', 'r', '/a')) is None
+    assert cache.lookup(('file', 'r', '/a')) == (1, False)
+
+def test_invalidate(clock):
+    cache = MetadataCache(clock=clock)
+    for key in [('repo', 'r', None), ('dir', 'r', '/'), ('dir', 'r', '/a'), ('dir', 'r', '/a/b'),
+                ('file', 'r', '/a/b/c'), ('dir', 'r', '/ab'), ('dir', 'other', '/a')]:
+        cache.set(key, 'value')
+    cache.invalidate('r', '/a/b')
+    assert sorted(cache._entries) == [('dir', 'other', '/a'), ('dir', 'r', '/ab'), ('repo', 'r', None)]
+    cache.invalidate('r')
+    assert list(cache._entries) == [('dir', 'other', '/a')]
+
+def test_update_listing(clock):
+    cache = MetadataCache(clock=clock)
+    cache.set(('dir', 'r', '/'), ('root-id', []))
+    cache.set(('dir', 'r', '/a'), ('a-id', [{'name': 'x', 'type': 'file', 'id': 'x-id', 'size': 1}]))
+    cache.update_listing('r', '/a', 'y', {'name': 'y', 'type': 'file', 'id': 'y-id', 'size': 2})
+    assert [d['name'] for d in cache.get(('dir', 'r', '/a'))[1]] == ['x', 'y']
+    assert cache.lookup(('dir', 'r', '/')) is None
+    cache.update_listing('r', '/a', 'x')
+    assert [d['name'] for d in cache.get(('dir', 'r', '/a'))[1]] == ['y']
+
+def test_concurrent_update_listing(clock):
+    class SlowCache(MetadataCache):
+        # widens the window for lost updates
+        def invalidate(self, *args):
+            time.sleep(0.001)
+            super().invalidate(*args)
+
+        def _invalidate(self, *args):
+            time.sleep(0.001)
+            super()._invalidate(*args)
+
+    cache = SlowCache(clock=clock)
+    cache.set(('dir', 'r', '/a'), ('a-id', []))
+    names = ['f%d' % i for i in range(32)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda name: cache.update_listing('r', '/a', name, {'name': name, 'type': 'file'}), names))
+    assert sorted(d['name'] for d in cache.get(('dir', 'r', '/a'))[1]) == sorted(names)
+
+
+@pytest.fixture
+def repo(clock):
+    repo = MagicMock()
+    repo.id = 'repo-id'
+    repo.client = MagicMock()
+    repo.client.metadata_cache = MetadataCache(ttl=10, clock=clock)
+    return repo
+
+def test_check_then_upload(repo):
+    listing = [{'name': 'a.txt', 'type': 'file', 'id': 'a-id', 'size': 1}]
+    def get(url, **kwargs):
+        if 'upload-link' in url:
+            return MockHttpResp(text='"https://drive/upload"')
+        return MockHttpResp(listing, headers={'oid': 'dir-id'})
+    repo.client.get.side_effect = get
+    repo.client.post.side_effect = lambda url, files, **kwargs: MockHttpResp(
+        [{'name': files['file'][0], 'id': 'new-id', 'size': 3}])
+    seafdir = SeafDir(repo, '/d', 'dir-id', 'dir')
+
+    for name in ['b.txt', 'c.txt', 'd.txt']:
+        assert not seafdir.check_exists(name)
+        seafdir.upload(b'new', name)
+
+    listings = [c for c in repo.client.get.call_args_list if '/dir/' in c.args[0]]
+    assert len(listings) == 1
+    assert [e.name for e in seafdir.ls()] == ['a.txt', 'b.txt', 'c.txt', 'd.txt']
+
+def test_stale_listing_revalidated(repo, clock):
+    listing = [{'name': 'a.txt', 'type': 'file', 'id': 'a-id', 'size': 1}]
+    repo.client.get.return_value = MockHttpResp(listing, headers={'oid': 'dir-id'})
+    seafdir = SeafDir(repo, '/d', 'dir-id', 'dir')
+    seafdir.ls()
+
+    clock.now = 10
+    repo.client.get.return_value = MockHttpResp("uptodate", headers={'oid': 'dir-id'})
+    assert [e.name for e in seafdir.ls()] == ['a.txt']
+    assert 'oid=dir-id' in repo.client.get.call_args.args[0]
+
+
+def test_content_cache_lru(tmp_path):
+    cache = ContentCache(tmp_path, max_size=10)
+    for key in ['a', 'b']:
+        assert cache.fetch(key, lambda: iter([key.encode() * 4])) is not None
+    # b is least recently used once a is read again
+    past = time.time() - 60
+    for key in ['a', 'b']:
+        os.utime(cache.path(key), (past, past))
+    assert cache.read('a', None) == b'aaaa'
+    cache.fetch('c', lambda: iter([b'cccc']))
+    assert cache.path('b') is None
+    assert cache.read('a', None) == b'aaaa' and cache.read('c', None) == b'cccc'
+    assert cache.size() == 8
+    assert os.listdir(tmp_path / 'tmp') == []
+
+def test_content_cache_fetched_once(tmp_path):
+    calls = []
+    def iter_content():
+        calls.append(1)
+        time.sleep(0.05)
+        yield b'content'
+    caches = [ContentCache(tmp_path) for _ in range(4)]
+    with ThreadPoolExecutor(4) as executor:
+        contents = list(executor.map(lambda cache: cache.read('key', iter_content), caches))
+    assert contents == [b'content'] * 4
+    assert len(calls) == 1
+
+def test_content_cache_failed_download(tmp_path):
+    cache = ContentCache(tmp_path)
+    def iter_content():
+        yield b'part'
+        raise IOError
+    with pytest.raises(IOError):
+        cache.read('key', iter_content)
+    assert cache.path('key') is None
+    assert os.listdir(tmp_path / 'tmp') == []
+
+def test_seaffile_content_cached(tmp_path):
+    repo = MagicMock(id='repo-id')
+    repo.client.content_cache = ContentCache(tmp_path)
+    seaffile = SeafFile(repo, '/a.txt', 'file-id', 'file', 3)
+    seaffile.iter_content = MagicMock(return_value=iter([b'abc']))
+    assert seaffile.get_content() == b'abc'
+    assert SeafFile(repo, '/copy.txt', 'file-id', 'file', 3).get_content() == b'abc'
+    assert seaffile.iter_content.call_count == 1
+    repo.client.get.assert_not_called()
@@ -0,0 +1,216 @@
+import io
+import os
+import pytest
+from unittest.mock import patch, MagicMock
+from ebrains_drive.bucket import Bucket
+from ebrains_drive.cache import ContentCache
+from ebrains_drive.files import DataproxyFile
+from ebrains_drive.transfer import STATE_SUFFIX, TransferState
+
+bucket_json={
+    'name': 'foo',
+    'objects_count': 12,
+    'bytes': 112233,
+    'last_modified': 'foo-bar',
+    'is_public': False,
+    'role': 'admin',
+}
+
+file_json={
+    'name': 'foo',
+    'hash': 'hash-foo',
+    'last_modified': 'last-modified',
+    'bytes': 10,
+    'content_type': 'json'
+}
+
+CONTENT = b"0123456789"
+
+class MockStreamResp:
+    def __init__(self, content):
+        self.content = content
+        self.headers = {"content-length": str(len(content))}
+        self.closed = False
+    def raise_for_status(self):
+        ...
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+    def close(self):
+        self.closed = True
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        self.close()
+
+@pytest.fixture
+def dataproxy_file():
+    client = MagicMock(content_cache=None)
+    client.get.return_value.json.return_value = {"url": "https://object-store/foo"}
+    bucket = Bucket.from_json(client, bucket_json)
+    return DataproxyFile.from_json(client, bucket, file_json)
+
+@pytest.fixture
+def mock_session():
+    with patch.object(DataproxyFile, 'session') as session:
+        session.get.side_effect = lambda url, **kwargs: MockStreamResp(CONTENT)
+        yield session
+
+
+def test_iter_content(dataproxy_file, mock_session):
+    chunks = list(dataproxy_file.iter_content(chunk_size=4))
+    assert chunks == [b"0123", b"4567", b"89"]
+
+def test_get_content_progress(dataproxy_file, mock_session):
+    assert dataproxy_file.get_content(progress=True) == CONTENT
+
+def test_get_content_cached(dataproxy_file, mock_session, tmp_path):
+    dataproxy_file.client.content_cache = ContentCache(tmp_path / "cache")
+    assert dataproxy_file.get_content() == CONTENT
+    assert dataproxy_file.get_content() == CONTENT
+    assert mock_session.get.call_count == 1
+    # another version of the object
+    dataproxy_file.hash = "other-hash"
+    assert dataproxy_file.get_content() == CONTENT
+    assert mock_session.get.call_count == 2
+    with dataproxy_file.open() as fp:
+        assert fp.read() == CONTENT
+    assert mock_session.get.call_count == 2
+
+def test_open_mmap(dataproxy_file, mock_session, tmp_path):
+    with dataproxy_file.open_mmap(chunk_size=3) as mapped:
+        assert mapped[:] == CONTENT
+    dataproxy_file.client.content_cache = ContentCache(tmp_path / "cache")
+    first, second = dataproxy_file.open_mmap(), dataproxy_file.open_mmap()
+    assert first[2:5] == second[2:5] == CONTENT[2:5]
+    assert mock_session.get.call_count == 2
+    with pytest.raises(TypeError):
+        first[0] = 0
+    first.close()
+    second.close()
+
+def test_open_mmap_empty(dataproxy_file):
+    with patch.object(DataproxyFile, 'session') as session:
+        session.get.side_effect = lambda url, **kwargs: MockStreamResp(b"")
+        assert len(dataproxy_file.open_mmap()) == 0
+
+def test_download_to_fileobj(dataproxy_file, mock_session):
+    fp = io.BytesIO()
+    assert dataproxy_file.download_to(fp, chunk_size=3) == len(CONTENT)
+    assert fp.getvalue() == CONTENT
+
+def test_download_to_path(dataproxy_file, mock_session, tmp_path):
+    path = tmp_path / "foo"
+    dataproxy_file.download_to(str(path))
+    assert path.read_bytes() == CONTENT
+
+def test_get_stream(dataproxy_file, mock_session):
+    with dataproxy_file.get_stream(chunk_size=4) as stream:
+        assert stream.read(5) == b"01234"
+        assert stream.read() == b"56789"
+
+
+class MockRangeResp(MockStreamResp):
+    def __init__(self, content, status_code=206):
+        super().__init__(content)
+        self.status_code = status_code
+
+def test_download_multipart(dataproxy_file, tmp_path):
+    links = iter(["https://object-store/expired", "https://object-store/fresh"])
+    get_download_link = MagicMock(side_effect=lambda: next(links))
+    requested = []
+
+    def get(url, headers, **kwargs):
+        start, end = map(int, headers["Range"][len("bytes="):].split("-"))
+        requested.append((url, start))
+        if url.endswith("expired") and start == 4:
+            return MockRangeResp(b"", 403)
+        return MockRangeResp(CONTENT[start:end + 1], 206)
+
+    path = tmp_path / "foo"
+    with patch.object(DataproxyFile, 'session') as session, patch.object(DataproxyFile, 'get_download_link', get_download_link):
+        session.get.side_effect = get
+        assert dataproxy_file.download_multipart(path, part_size=4, max_workers=1) == len(CONTENT)
+
+    assert path.read_bytes() == CONTENT
+    assert get_download_link.call_count == 2
+    # only the part rejected with an expired link is retried
+    assert [start for url, start in requested].count(4) == 2
+    assert [start for url, start in requested].count(0) == 1
+
+def test_download_multipart_resume(dataproxy_file, tmp_path):
+    path = tmp_path / "foo"
+    path.write_bytes(b"0123" + b"\0" * 6)
+    state = TransferState(f"{path}{STATE_SUFFIX}", {"hash": "hash-foo", "bytes": 10, "part_size": 4})
+    state.mark_done(0)
+
+    requested = []
+    def get(url, headers, **kwargs):
+        start, end = map(int, headers["Range"][len("bytes="):].split("-"))
+        requested.append(start)
+        return MockRangeResp(CONTENT[start:end + 1], 206)
+
+    with patch.object(DataproxyFile, 'session') as session, \
+            patch.object(DataproxyFile, 'get_download_link', MagicMock(return_value="https://object-store/foo")):
+        session.get.side_effect = get
+        dataproxy_file.download_multipart(path, part_size=4, resume=True)
+
+    assert sorted(requested) == [4, 8]
+    assert path.read_bytes() == CONTENT
+    assert not os.path.exists(state.path)
+
+def test_transfer_state_discards_other_identity(tmp_path):
+    path = str(tmp_path / "state")
+    state = TransferState(path, {"hash": "a"})
+    state.mark_done(0, {"etag": "x"})
+    assert TransferState.load(path, {"hash": "a"}).done == {"0": {"etag": "x"}}
+    assert TransferState.load(path, {"hash": "b"}).done == {}
+
+def test_open_range_reads(dataproxy_file):
+    content = bytes(range(256)) * 40
+    dataproxy_file.bytes = len(content)
+    links = iter(["https://object-store/expired", "https://object-store/foo"])
+    requested = []
+    def get(url, headers, **kwargs):
+        if url.endswith("expired"):
+            return MockRangeResp(b"", 403)
+        start, end = map(int, headers["Range"][len("bytes="):].split("-"))
+        requested.append((start, end))
+        return MockRangeResp(content[start:end + 1])
+
+    with patch.object(DataproxyFile, 'session') as session, \
+            patch.object(DataproxyFile, 'get_download_link', MagicMock(side_effect=lambda: next(links))):
+        session.get.side_effect = get
+        with dataproxy_file.open(block_size=100, cache_blocks=20, max_readahead=4) as fp:
+            assert fp.seekable()
+            # a read spanning 3 blocks is a single request, the link being renewed
+            fp.seek(5000)
+            assert fp.read(250) == content[5000:5250]
+            assert requested == [(5000, 5299)]
+            # sequential reads are read ahead
+            assert fp.read(100) == content[5250:5350]
+            assert requested[-1] == (5300, 5499)
+            assert fp.read(200) == content[5350:5550]
+            assert requested[-1] == (5500, 5799)
+            # cached blocks are not fetched again
+            fp.seek(5100)
+            assert fp.read(50) == content[5100:5150]
+            assert fp.tell() == 5150 and len(requested) == 3
+            fp.seek(-10, io.SEEK_END)
+            assert fp.read() == content[-10:]
+            assert fp.read(10) == b""
+            assert fp.bytes_fetched == 300 + 200 + 300 + 40
+
+
+def test_delete(dataproxy_file):
+    client = dataproxy_file.client
+    client.delete.return_value.json.return_value = {'detail': 'foo has been removed'}
+    dataproxy_file.delete()
+    client.delete.assert_called_once_with('/v1/buckets/foo/foo')
+    client.get.assert_not_called()
+
+    pages = [{'objects': [{**file_json, 'name': '.segments/foo/id/00000000'}]}, {'objects': []}]
+    client.get.return_value.json.side_effect = lambda: pages.pop(0)
+    with patch.object(Bucket, 'delete_many') as delete_many:
+        dataproxy_file.delete(delete_segments=True)
+    assert delete_many.call_args.args[0] == ['.segments/foo/id/00000000']
@@ -0,0 +1,84 @@
+import re
+from unittest.mock import MagicMock
+from urllib.parse import parse_qs, urlparse
+from ebrains_drive.files import ZERO_OBJ_ID, SeafDir, SeafFile
+from ebrains_drive.index import PathIndex, glob_to_regex
+from ebrains_drive.repo import Repo
+
+class MockHttpResp:
+    def __init__(self, resp, headers=None):
+        self.resp = resp
+        self.headers = headers or {}
+    def json(self):
+        return self.resp
+
+
+def dir_json(name, oid):
+    return {'name': name, 'type': 'dir', 'id': oid}
+
+def file_json(name, oid, size=1):
+    return {'name': name, 'type': 'file', 'id': oid, 'size': size}
+
+
+class MockDrive:
+    def __init__(self, root_id, listings):
+        self.root_id = root_id
+        self.listings = listings
+        self.listed = []
+    def get(self, url):
+        query = parse_qs(urlparse(url).query)
+        path = query['p'][0]
+        if query.get('oid') == [self.root_id]:
+            return MockHttpResp("uptodate")
+        self.listed.append(path)
+        return MockHttpResp(self.listings[path], {'oid': self.root_id})
+
+
+def test_glob_to_regex():
+    def matches(pattern, path):
+        return re.fullmatch(glob_to_regex(pattern), path) is not None
+    assert matches('**/*.nii.gz', 'a.nii.gz') and matches('**/*.nii.gz', 'a/b/c.nii.gz')
+    assert not matches('*.nii.gz', 'a/b.nii.gz')
+    assert matches('a/**', 'a/b/c') and not matches('a/*', 'a/b/c')
+    assert matches('data[0-9]/?.txt', 'data1/x.txt') and not matches('data[!0-9]/?.txt', 'data1/x.txt')
+    assert matches('a+b(1).txt', 'a+b(1).txt')
+
+
+def test_path_index(tmp_path):
+    drive = MockDrive('root-1', {
+        '/': [dir_json('a', 'a-1'), dir_json('b', 'b-1'), dir_json('empty', ZERO_OBJ_ID), file_json('top.nii.gz', 't-1')],
+        '/a': [dir_json('sub', 'sub-1'), file_json('x.nii.gz', 'x-1', 10)],
+        '/a/sub': [file_json('deep.nii.gz', 'd-1', 20), file_json('notes.txt', 'n-1')],
+        '/b': [file_json('y.txt', 'y-1')],
+    })
+    client = MagicMock(metadata_cache=None)
+    client.get.side_effect = drive.get
+    repo = Repo(client, id='repo-id')
+    db_path = str(tmp_path / 'index.sqlite')
+
+    with PathIndex(repo, db_path) as index:
+        assert index.refresh() == 4
+        assert drive.listed == ['/', '/a', '/b', '/a/sub']
+        assert len(index) == 9
+
+    found = repo.glob('**/*.nii.gz', db_path=db_path)
+    assert [f.path for f in found] == ['/a/sub/deep.nii.gz', '/a/x.nii.gz', '/top.nii.gz']
+    assert all(isinstance(f, SeafFile) for f in found) and found[0].size == 20
+    assert [d.path for d in repo.glob('a/*', db_path=db_path)] == ['/a/sub', '/a/x.nii.gz']
+    assert isinstance(repo.glob('/a/*', db_path=db_path)[0], SeafDir)
+    # nothing listed when the repo did not change
+    assert drive.listed == ['/', '/a', '/b', '/a/sub']
+
+    # /a/sub changed (and so did its parents), /b was removed
+    drive.root_id = 'root-2'
+    drive.listings.update({
+        '/': [dir_json('a', 'a-2'), dir_json('empty', ZERO_OBJ_ID), file_json('top.nii.gz', 't-1')],
+        '/a': [dir_json('sub', 'sub-2'), file_json('x.nii.gz', 'x-1', 10)],
+        '/a/sub': [file_json('deep.nii.gz', 'd-2', 30)],
+    })
+    drive.listed.clear()
+    big = repo.find(lambda d: d.size >= 20, db_path=db_path)
+    assert drive.listed == ['/', '/a', '/a/sub']
+    assert [(f.path, f.id, f.size) for f in big] == [('/a/sub/deep.nii.gz', 'd-2', 30)]
+    assert [d.path for d in repo.find(lambda d: True, refresh=False, db_path=db_path)] == \
+        ['/a', '/a/sub', '/a/sub/deep.nii.gz', '/a/x.nii.gz', '/empty', '/top.nii.gz']
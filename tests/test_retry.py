@@ -0,0 +1,66 @@
+import io
+import pytest
+from unittest.mock import MagicMock
+from requests.exceptions import ConnectionError, ConnectTimeout
+from ebrains_drive.retry import RetryPolicy
+from ebrains_drive.session import body_rewinder
+
+class MockHttpResp:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+    def close(self):
+        ...
+
+def responses(*items):
+    items = list(items)
+    def send():
+        item = items.pop(0)
+        if isinstance(item, Exception):
+            raise item
+        return item
+    return send
+
+
+def test_retries_transient_statuses_with_backoff():
+    sleep = MagicMock()
+    policy = RetryPolicy(max_attempts=3, backoff_factor=1, max_backoff=1.5)
+    resp = policy.call('GET', responses(MockHttpResp(503), MockHttpResp(502), MockHttpResp(200)), sleep=sleep)
+    assert resp.status_code == 200
+    assert sleep.call_count == 2
+    assert all(0 <= c.args[0] <= 1.5 for c in sleep.call_args_list)
+
+def test_gives_up_after_max_attempts():
+    policy = RetryPolicy(max_attempts=2)
+    resp = policy.call('GET', responses(MockHttpResp(503), MockHttpResp(504)), sleep=MagicMock())
+    assert resp.status_code == 504
+
+def test_respects_retry_after():
+    sleep = MagicMock()
+    RetryPolicy().call('GET', responses(MockHttpResp(429, {'Retry-After': '7'}), MockHttpResp(200)), sleep=sleep)
+    sleep.assert_called_once_with(7.0)
+
+def test_post_not_retried_unless_safe():
+    policy = RetryPolicy()
+    assert policy.call('POST', responses(MockHttpResp(503), MockHttpResp(200)), sleep=MagicMock()).status_code == 503
+    with pytest.raises(ConnectionError):
+        policy.call('POST', responses(ConnectionError(), MockHttpResp(200)), sleep=MagicMock())
+    # the request was never sent, or explicitly rejected before processing
+    assert policy.call('POST', responses(ConnectTimeout(), MockHttpResp(200)), sleep=MagicMock()).status_code == 200
+    assert policy.call('POST', responses(MockHttpResp(429), MockHttpResp(200)), sleep=MagicMock()).status_code == 200
+    # unless the caller says it is idempotent
+    assert policy.call('POST', responses(MockHttpResp(503), MockHttpResp(200)), idempotent=True, sleep=MagicMock()).status_code == 200
+
+def test_retries_connection_errors_and_rewinds_body():
+    body = io.BytesIO(b'content')
+    body.read(3)
+    rewind = body_rewinder({'data': body})
+    body.read()
+    resp = RetryPolicy().call('PUT', responses(ConnectionError(), MockHttpResp(200)), rewind=rewind, sleep=MagicMock())
+    assert resp.status_code == 200
+    assert body.read() == b'tent'
+
+def test_one_shot_body_not_retried():
+    rewind = body_rewinder({'data': (chunk for chunk in [b'a'])})
+    resp = RetryPolicy().call('PUT', responses(MockHttpResp(503), MockHttpResp(200)), rewind=rewind, sleep=MagicMock())
+    assert resp.status_code == 503
@@ -0,0 +1,296 @@
+import json
+import posixpath
+import pytest
+import threading
+from unittest.mock import MagicMock
+from ebrains_drive.exceptions import ClientHttpError, DoesNotExist
+from ebrains_drive.files import SeafDir, SeafFile
+from ebrains_drive.repo import Repo
+from ebrains_drive.transfer import STATE_SUFFIX
+
+class MockHttpResp:
+    def __init__(self, resp=None, text=''):
+        self.resp = resp
+        self.text = text
+    def json(self):
+        return self.resp
+
+@pytest.fixture
+def repo():
+    repo = MagicMock()
+    repo.id = 'repo-id'
+    repo.client = MagicMock()
+    repo.client.metadata_cache = None
+    repo.client.content_cache = None
+    return repo
+
+
+def test_upload_tree(repo, tmp_path):
+    (tmp_path / 'a' / 'b').mkdir(parents=True)
+    (tmp_path / 'empty').mkdir()
+    (tmp_path / 'top.txt').write_bytes(b'top')
+    (tmp_path / 'a' / 'b' / 'deep.nii').write_bytes(b'deep')
+    (tmp_path / 'a' / 'skip.tmp').write_bytes(b'skip')
+
+    existing = SeafDir(repo, '/dst', 'dir-id', 'dir')
+    existing.entries = [SeafFile(repo, '/dst/top.txt', 'file-id', 'file', 3)]
+    def get_dir(path):
+        if path == '/dst':
+            return existing
+        raise DoesNotExist(path)
+    repo.get_dir.side_effect = get_dir
+
+    uploads = []
+    def post(url, files=None, **kwargs):
+        if 'upload' in url:
+            uploads.append(files)
+            return MockHttpResp([{'name': files['file'][0], 'id': 'new-id', 'size': 4}])
+        return MockHttpResp({})
+    repo.client.get.return_value = MockHttpResp(text='"https://drive/upload-api/token"')
+    repo.client.post.side_effect = post
+
+    seafdir = SeafDir(repo, '/dst', 'dir-id', 'dir')
+    results = seafdir.upload_tree(str(tmp_path), exclude=['*.tmp'], max_workers=2)
+    results = {r.remote_path: r for r in results}
+
+    assert set(results) == {'/dst/top.txt', '/dst/a/b/deep.nii'}
+    assert isinstance(results['/dst/top.txt'].error, FileExistsError)
+    assert results['/dst/a/b/deep.nii'].ok
+    assert results['/dst/a/b/deep.nii'].dirent.path == '/dst/a/b/deep.nii'
+    # a single upload link, and sub folders created through relative_path
+    assert repo.client.get.call_count == 1
+    assert [f['relative_path'] for f in uploads] == ['a/b']
+    # the empty directory is created with its parents
+    mkdir_calls = [c for c in repo.client.post.call_args_list if 'upload' not in c.args[0]]
+    assert len(mkdir_calls) == 1
+    assert mkdir_calls[0].kwargs['data']['create_parents'] == 'true'
+
+
+class MockStreamResp(MockHttpResp):
+    def __init__(self, content):
+        super().__init__()
+        self.content = content
+    def iter_content(self, chunk_size):
+        yield self.content
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        ...
+
+def test_download_tree(repo, tmp_path):
+    listings = {
+        '/src': [{'name': 'a', 'type': 'dir', 'id': 'a-id'},
+                 {'name': 'top.txt', 'type': 'file', 'id': 'top-id', 'size': 3},
+                 {'name': 'skip.tmp', 'type': 'file', 'id': 'skip-id', 'size': 4}],
+        '/src/a': [{'name': 'deep.nii', 'type': 'file', 'id': 'deep-id', 'size': 4}],
+    }
+    def get(url, **kwargs):
+        if url.startswith('https://drive/files'):
+            return MockStreamResp(url.rsplit('/', 1)[1].encode())
+        path = url.split('p=')[1].replace('%2F', '/')
+        if url.startswith('/api2/repos/repo-id/dir/'):
+            return MockHttpResp(listings[path])
+        return MockHttpResp(text='"https://drive/files/%s"' % posixpath.basename(path))
+    repo.client.get.side_effect = get
+
+    seafdir = SeafDir(repo, '/src', 'dir-id', 'dir')
+    results = seafdir.download_tree(str(tmp_path / 'dst'), exclude=['*.tmp'])
+
+    assert sorted(r.remote_path for r in results) == ['/src/a/deep.nii', '/src/top.txt']
+    assert all(r.ok for r in results)
+    assert (tmp_path / 'dst' / 'top.txt').read_bytes() == b'top.txt'
+    assert (tmp_path / 'dst' / 'a' / 'deep.nii').read_bytes() == b'deep.nii'
+    assert not (tmp_path / 'dst' / 'skip.tmp').exists()
+
+
+def test_download_tree_lists_during_downloads(repo, tmp_path):
+    listings = {
+        '/src': [{'name': 'a', 'type': 'dir', 'id': 'a-id'}, {'name': 'top.txt', 'type': 'file', 'id': 'top-id', 'size': 3}],
+        '/src/a': [{'name': 'deep.nii', 'type': 'file', 'id': 'deep-id', 'size': 4}],
+    }
+    sub_listed = threading.Event()
+    def get(url, **kwargs):
+        if url.startswith('https://drive/files'):
+            # the download of top.txt waits for the listing of a
+            assert sub_listed.wait(timeout=5)
+            return MockStreamResp(b'x')
+        path = url.split('p=')[1].replace('%2F', '/')
+        if url.startswith('/api2/repos/repo-id/dir/'):
+            if path == '/src/a':
+                sub_listed.set()
+            return MockHttpResp(listings[path])
+        return MockHttpResp(text='"https://drive/files/%s"' % posixpath.basename(path))
+    repo.client.get.side_effect = get
+
+    results = SeafDir(repo, '/src', 'dir-id', 'dir').download_tree(str(tmp_path), max_workers=1)
+    assert all(r.ok for r in results) and len(results) == 2
+
+
+def test_move_items(repo):
+    seafdir = SeafDir(repo, '/src', 'dir-id', 'dir')
+    seafdir.entries = [SeafFile(repo, '/src/a.txt', 'a-id', 'file', 1), SeafDir(repo, '/src/sub', 'sub-id', 'dir')]
+    kept = SeafFile(repo, '/src/b.txt', 'b-id', 'file', 2)
+    seafdir.entries.append(kept)
+    sub = seafdir.entries[1]
+    sub.entries = [SeafFile(repo, '/src/sub/c.txt', 'c-id', 'file', 1)]
+
+    moved = seafdir.move_items(['a.txt', sub], '/dst')
+
+    url = repo.client.post.call_args.args[0]
+    assert url == '/api/v2.1/repos/sync-batch-move-item/'
+    assert repo.client.post.call_args.kwargs['json']['src_dirents'] == ['a.txt', 'sub']
+    assert [d.path for d in moved] == ['/dst/a.txt', '/dst/sub']
+    assert sub.path == '/dst/sub' and sub.id == 'sub-id' and sub.entries is None
+    assert seafdir.entries == [kept]
+    repo.client.get.assert_not_called()
+
+
+def test_copy_items_across_repos(monkeypatch):
+    monkeypatch.setattr(SeafDir, 'TASK_POLL_INTERVAL', (0, 0))
+    repo = Repo(MagicMock(metadata_cache=None), id='repo-id')
+    seafdir = SeafDir(repo, '/src', 'dir-id', 'dir')
+    seafdir.entries = [SeafFile(repo, '/src/a.txt', 'a-id', 'file', 1)]
+    repo.client.post.return_value = MockHttpResp({'task_id': 'task'})
+    repo.client.get.side_effect = [MockHttpResp({'done': False}), MockHttpResp({'done': True, 'successful': True})]
+    repo.client.repos.get_repo.return_value = Repo(repo.client, id='other-repo', name='other')
+
+    copies = seafdir.copy_items(['a.txt'], '/dst', dst_repo_id='other-repo')
+
+    assert repo.client.post.call_args.args[0] == '/api/v2.1/repos/async-batch-copy-item/'
+    assert repo.client.get.call_count == 2
+    assert copies[0].path == '/dst/a.txt' and copies[0].repo.id == 'other-repo'
+    assert str(copies[0].repo) == "(id='other-repo', name='other')"
+    repo.client.repos.get_repo.assert_called_once_with('other-repo')
+    assert seafdir.entries[0].path == '/src/a.txt'
+
+
+def test_entries_index(repo):
+    listing = [{'name': 'a.txt', 'type': 'file', 'id': 'a-id', 'size': 1}, {'name': 'sub', 'type': 'dir', 'id': 'sub-id'}]
+    repo.client.get.side_effect = lambda url, **kwargs: MockHttpResp(listing, text='"https://drive/upload"')
+    repo.client.post.side_effect = lambda url, files, **kwargs: MockHttpResp([{'name': files['file'][0], 'id': 'new-id', 'size': 3}])
+    seafdir = SeafDir(repo, '/d', 'dir-id', 'dir')
+
+    found = seafdir.check_exists_many(['a.txt', 'sub', 'b.txt'])
+    assert found['a.txt'].path == '/d/a.txt' and found['sub'].isdir and found['b.txt'] is False
+    assert seafdir.check_exists('sub', entity_type='file') is False
+    assert [e.name for e in seafdir.ls(entity_type='file', force_refresh=False)] == ['a.txt']
+
+    # uploads are added to the index, without listing the dir again
+    listed = repo.client.get.call_count
+    seafdir.upload(b'new', 'b.txt')
+    assert seafdir.check_exists('b.txt', force_refresh=False).id == 'new-id'
+    assert [e.name for e in seafdir.ls(entity_type='file', force_refresh=False)] == ['a.txt', 'b.txt']
+    assert repo.client.get.call_count == listed + 1  # the upload link
+
+
+def test_walk(repo):
+    listings = {
+        '/': [{'name': 'a', 'type': 'dir', 'id': 'a-id'},
+              {'name': 'skip', 'type': 'dir', 'id': 'skip-id'},
+              {'name': 'top.txt', 'type': 'file', 'id': 'top-id', 'size': 3}],
+        '/a': [{'name': 'b', 'type': 'dir', 'id': 'b-id'},
+               {'name': 'c', 'type': 'dir', 'id': 'c-id'},
+               {'name': 'a.txt', 'type': 'file', 'id': 'a-txt-id', 'size': 1}],
+        '/a/b': [{'name': 'deep', 'type': 'dir', 'id': 'deep-id'}],
+        '/a/c': [],
+        '/a/b/deep': [],
+    }
+    listed = []
+    def get(url, **kwargs):
+        path = url.split('p=')[1].replace('%2F', '/')
+        listed.append(path)
+        if path not in listings:
+            raise DoesNotExist(path)
+        return MockHttpResp(listings[path])
+    repo.client.get.side_effect = get
+    walk_repo = Repo(repo.client, id='repo-id')
+
+    walked = [(path, [d.name for d in dirs], [f.name for f in files])
+              for path, dirs, files in walk_repo.walk(prune=lambda d: d.name == 'skip', max_workers=2)]
+    assert walked == [('/', ['a'], ['top.txt']), ('/a', ['b', 'c'], ['a.txt']),
+                      ('/a/b', ['deep'], []), ('/a/c', [], []), ('/a/b/deep', [], [])]
+    assert '/skip' not in listed
+
+    # pruning in place, and depth limit
+    walked = []
+    for path, dirs, files in walk_repo.walk('/a', max_depth=1):
+        walked.append(path)
+        dirs[:] = [d for d in dirs if d.name != 'c']
+    assert walked == ['/a', '/a/b']
+
+    listings['/a'].append({'name': 'gone', 'type': 'dir', 'id': 'gone-id'})
+    errors = []
+    walked = [path for path, dirs, files in walk_repo.walk('/a', onerror=errors.append)]
+    assert '/a/gone' not in walked and isinstance(errors[0], DoesNotExist)
+    with pytest.raises(DoesNotExist):
+        list(walk_repo.walk('/a'))
+
+
+def test_mkdir_after_deleting_child(repo):
+    listings = [[{'name': 'a', 'type': 'dir', 'id': 'a-id'}], [], [{'name': 'a', 'type': 'dir', 'id': 'new-a-id'}]]
+    repo.client.get.side_effect = lambda url, **kwargs: MockHttpResp(listings.pop(0))
+    repo.client.post.return_value = MagicMock(headers={'Location': 'https://drive/api2/repos/repo-id/dir/?p=/d/a'})
+    seafdir = SeafDir(repo, '/d', 'dir-id', 'dir')
+    seafdir.ls()
+
+    seafdir.check_exists('a', force_refresh=False).delete()
+    created = seafdir.mkdir('a')
+
+    assert created.path == '/d/a'
+    assert seafdir.check_exists('a', force_refresh=False) is created
+    with pytest.raises(FileExistsError):
+        seafdir.mkdir('a')
+    assert listings == []
+
+
+def test_mkdir_renamed_by_server(repo):
+    # 'a' was created by someone else since the dir was listed
+    repo.client.get.return_value = MockHttpResp([])
+    repo.client.post.return_value = MagicMock(headers={'Location': 'https://drive/api2/repos/repo-id/dir/?p=/d/a%20%281%29'})
+    seafdir = SeafDir(repo, '/d', 'dir-id', 'dir')
+    seafdir.ls()
+
+    created = seafdir.mkdir('a')
+
+    assert created.path == '/d/a (1)' and created.name == 'a (1)'
+    assert [e.name for e in seafdir.ls(force_refresh=False)] == ['a (1)']
+
+
+def test_resumable_upload_renews_expired_link(repo, tmp_path, monkeypatch):
+    monkeypatch.setattr(SeafDir, 'RESUMABLE_CHUNK_SIZE', 4)
+    (tmp_path / 'big').write_bytes(b'0123456789')
+    links = iter(['"https://drive/upload-1"', '"https://drive/upload-2"'])
+    repo.client.get.side_effect = lambda url, **kwargs: MockHttpResp(text=next(links))
+    sent = []
+    def post(url, files, headers):
+        if url.startswith('https://drive/upload-1') and sent:
+            raise ClientHttpError(403, 'expired')
+        sent.append((url, files['file'][1], headers['Content-Range']))
+    repo.client.post.side_effect = post
+    seafdir = SeafDir(repo, '/d', 'dir-id', 'dir')
+    seafdir.entries = []
+
+    seafdir.upload_local_file(str(tmp_path / 'big'), resume=True)
+
+    assert sent == [('https://drive/upload-1?ret-json=1', b'0123', 'bytes 0-3/10'),
+                    ('https://drive/upload-2?ret-json=1', b'4567', 'bytes 4-7/10'),
+                    ('https://drive/upload-2?ret-json=1', b'89', 'bytes 8-9/10')]
+    repo.get_file.assert_called_once_with('/d/big')
+
+
+def test_resumable_upload_keeps_last_offset(repo, tmp_path, monkeypatch):
+    monkeypatch.setattr(SeafDir, 'RESUMABLE_CHUNK_SIZE', 4)
+    (tmp_path / 'big').write_bytes(b'0123456789')
+    repo.client.get.return_value = MockHttpResp(text='"https://drive/upload"')
+    def post(url, files, headers):
+        if headers['Content-Range'].startswith('bytes 8-'):
+            raise ClientHttpError(500, 'interrupted')
+    repo.client.post.side_effect = post
+    seafdir = SeafDir(repo, '/d', 'dir-id', 'dir')
+    seafdir.entries = []
+
+    with pytest.raises(ClientHttpError):
+        seafdir.upload_local_file(str(tmp_path / 'big'), resume=True)
+
+    saved = json.loads((tmp_path / ('big' + STATE_SUFFIX)).read_text())
+    assert saved['done'] == {'offset': 8}
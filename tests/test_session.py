@@ -0,0 +1,38 @@
+import gc
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from ebrains_drive.session import SessionManager
+
+
+def test_sessions_are_thread_local_and_share_the_pool():
+    manager = SessionManager(pool_maxsize=4)
+    sessions = []
+    threads = [threading.Thread(target=lambda: sessions.append(manager.session)) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert manager.session is manager.session
+    assert len({id(s) for s in sessions + [manager.session]}) == 3
+    assert all(s.get_adapter('https://foo') is manager.adapter for s in sessions)
+    assert manager.adapter._pool_maxsize == 4
+
+    manager.close()
+    assert manager.closed
+
+
+def test_keep_alive_off():
+    manager = SessionManager(keep_alive=False)
+    assert manager.session.headers['Connection'] == 'close'
+
+def test_sessions_of_ended_threads_are_released():
+    manager = SessionManager()
+    for _ in range(3):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda _: manager.session, range(20)))
+    gc.collect()
+    assert len(manager._sessions) == 0
+    main_session = manager.session
+    assert list(manager._sessions) == [main_session]
+    manager.close()
@@ -0,0 +1,231 @@
+import hashlib
+import posixpath
+import pytest
+from unittest.mock import MagicMock
+from urllib.parse import unquote
+from ebrains_drive.files import SeafDir
+from ebrains_drive.sync import BucketSync, DriveSync, SyncAction
+
+class MockHttpResp:
+    def __init__(self, resp=None, text='', content=b''):
+        self.resp = resp
+        self.text = text
+        self.content = content
+    def json(self):
+        return self.resp
+    def iter_content(self, chunk_size):
+        yield self.content
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        ...
+
+class MockDrive:
+    """In-memory remote tree: {path: content} for files, dir ids derived from their content"""
+    metadata_cache = None
+    content_cache = None
+
+    def __init__(self, files):
+        self.files = dict(files)
+        self.listed = []
+
+    def dir_id(self, path):
+        return 'dir-%d' % hash(tuple(sorted((p, c) for p, c in self.files.items() if p.startswith(path + '/'))))
+
+    def listing(self, path):
+        prefix = path.rstrip('/') + '/'
+        entries = {}
+        for p, content in self.files.items():
+            if p.startswith(prefix):
+                name, _, rest = p[len(prefix):].partition('/')
+                if rest:
+                    entries[name] = {'name': name, 'type': 'dir', 'id': self.dir_id(prefix + name)}
+                else:
+                    entries[name] = {'name': name, 'type': 'file', 'id': 'id-%s' % content.decode(), 'size': len(content)}
+        return list(entries.values())
+
+    def get(self, url, **kwargs):
+        if url.startswith('https://drive/files'):
+            return MockHttpResp(content=self.files[url[len('https://drive/files'):]])
+        if 'upload-link' in url:
+            return MockHttpResp(text='"https://drive/upload"')
+        path = unquote(url.split('p=')[1])
+        if url.startswith('/api2/repos/repo-id/dir/'):
+            self.listed.append(path)
+            return MockHttpResp(self.listing(path))
+        return MockHttpResp(text='"https://drive/files%s"' % path)
+
+    def post(self, url, files=None, **kwargs):
+        name, fp = files['file']
+        content = fp.read()
+        path = posixpath.join(files['parent_dir'], files.get('relative_path', ''), name)
+        self.files[path] = content
+        return MockHttpResp([{'name': name, 'id': 'id-%s' % content.decode(), 'size': len(content)}])
+
+    def delete(self, url, **kwargs):
+        del self.files[unquote(url.split('p=')[1])]
+
+@pytest.fixture
+def drive():
+    return MockDrive({'/r/a.txt': b'a', '/r/d/b.txt': b'bb', '/r/e/f.txt': b'f'})
+
+@pytest.fixture
+def seafdir(drive):
+    repo = MagicMock()
+    repo.id = 'repo-id'
+    repo.client = drive
+    def get_dir(path):
+        d = SeafDir(repo, path, drive.dir_id(path), 'dir')
+        d.load_entries()
+        return d
+    repo.get_dir.side_effect = get_dir
+    return SeafDir(repo, '/r', drive.dir_id('/r'), 'dir')
+
+
+def test_first_sync_both_ways(drive, seafdir, tmp_path):
+    (tmp_path / 'c.txt').write_bytes(b'c')
+    sync = DriveSync(str(tmp_path), seafdir)
+
+    plan = sync.run(dry_run=True)
+    assert sorted(plan) == sorted([
+        SyncAction('download', 'a.txt', 'missing locally'),
+        SyncAction('upload', 'c.txt', 'missing remotely'),
+        SyncAction('download', 'd/b.txt', 'missing locally'),
+        SyncAction('download', 'e/f.txt', 'missing locally'),
+        SyncAction('mkdir_local', 'd', 'missing locally'),
+        SyncAction('mkdir_local', 'e', 'missing locally'),
+    ])
+    assert all(r.ok for r in sync.execute(plan))
+    assert (tmp_path / 'd' / 'b.txt').read_bytes() == b'bb'
+    assert drive.files['/r/c.txt'] == b'c'
+
+
+def test_incremental_sync_skips_unchanged_subtrees(drive, seafdir, tmp_path):
+    DriveSync(str(tmp_path), seafdir).run()
+    drive.files['/r/d/b.txt'] = b'new'
+    (tmp_path / 'a.txt').write_bytes(b'local')
+    drive.listed.clear()
+
+    plan = DriveSync(str(tmp_path), seafdir).run(dry_run=True)
+
+    assert sorted(plan) == sorted([SyncAction('download', 'd/b.txt', 'remote changed'),
+                                   SyncAction('upload', 'a.txt', 'local changed')])
+    # the unchanged sub directory e is not listed
+    assert '/r/e' not in drive.listed
+    assert '/r/d' in drive.listed
+
+
+def test_conflicts_and_deletions(drive, seafdir, tmp_path):
+    DriveSync(str(tmp_path), seafdir).run()
+    drive.files['/r/a.txt'] = b'remote'
+    (tmp_path / 'a.txt').write_bytes(b'local')
+    (tmp_path / 'd' / 'b.txt').unlink()
+
+    plan = DriveSync(str(tmp_path), seafdir, delete=True).run(dry_run=True)
+    assert sorted(plan) == [SyncAction('conflict', 'a.txt', 'changed on both sides'),
+                            SyncAction('delete_remote', 'd/b.txt', 'deleted locally')]
+
+    plan = DriveSync(str(tmp_path), seafdir, conflict='remote').run(dry_run=True)
+    assert sorted(plan) == [SyncAction('download', 'a.txt', 'conflict, remote wins'),
+                            SyncAction('download', 'd/b.txt', 'missing locally')]
+
+
+class MockDataproxyFile:
+    def __init__(self, bucket, name, content, last_modified='t0'):
+        self.bucket = bucket
+        self.name = name
+        self.content = content
+        self.hash = hashlib.md5(content).hexdigest()
+        self.bytes = len(content)
+        self.last_modified = last_modified
+    def download_to(self, path):
+        with open(path, 'wb') as fp:
+            fp.write(self.content)
+    def delete(self):
+        del self.bucket.objects[self.name]
+
+class MockBucket:
+    SEGMENT_PREFIX = '.segments'
+    dataproxy_entity_name = 'bucket'
+    target = 'buckets'
+    def __init__(self, objects):
+        self.objects = {name: MockDataproxyFile(self, name, content) for name, content in objects.items()}
+    def ls(self, prefix=None):
+        return [f for name, f in sorted(self.objects.items()) if name.startswith(prefix or '')]
+    def upload(self, path, name):
+        with open(path, 'rb') as fp:
+            self.objects[name] = MockDataproxyFile(self, name, fp.read(), last_modified='t1')
+
+
+def test_bucket_sync_download(tmp_path):
+    bucket = MockBucket({'data/a.nii': b'aaa', 'data/sub/b.nii': b'b', 'other/c': b'c'})
+    (tmp_path / 'extra').write_bytes(b'x')
+
+    results = BucketSync(str(tmp_path), bucket, prefix='data/', delete=True).run()
+    assert sorted(r.action.op for r in results) == ['delete_local', 'download', 'download']
+    assert (tmp_path / 'sub' / 'b.nii').read_bytes() == b'b'
+    assert not (tmp_path / 'extra').exists()
+
+    # nothing changed: nothing to do
+    assert BucketSync(str(tmp_path), bucket, prefix='data/').run(dry_run=True) == []
+
+    bucket.objects['data/a.nii'] = MockDataproxyFile(bucket, 'data/a.nii', b'new', last_modified='t2')
+    assert BucketSync(str(tmp_path), bucket, prefix='data/').run(dry_run=True) == [
+        SyncAction('download', 'a.nii', 'remote changed')]
+
+
+def test_bucket_sync_upload(tmp_path):
+    bucket = MockBucket({'a': b'same', 'stale': b's'})
+    (tmp_path / 'a').write_bytes(b'same')
+    (tmp_path / 'b').write_bytes(b'bb')
+
+    sync = BucketSync(str(tmp_path), bucket, direction='upload', compare='hash', delete=True)
+    assert sorted(sync.run(dry_run=True)) == [SyncAction('delete_remote', 'stale', 'missing from source'),
+                                              SyncAction('upload', 'b', 'missing from target')]
+    sync.run()
+    assert set(bucket.objects) == {'a', 'b'}
+    assert BucketSync(str(tmp_path), bucket, direction='upload', compare='hash').run(dry_run=True) == []
+
+
+def test_bucket_sync_skips_segments(tmp_path):
+    bucket = MockBucket({'big': b'0123', '.segments/big/upload-id/00000000': b'01', '.segments/big/upload-id/00000001': b'23'})
+    assert [a.path for a in BucketSync(str(tmp_path / 'down'), bucket).run(dry_run=True)] == ['big']
+
+    (tmp_path / 'up').mkdir()
+    (tmp_path / 'up' / 'big').write_bytes(b'0123')
+    sync = BucketSync(str(tmp_path / 'up'), bucket, direction='upload', delete=True)
+    assert sync.run(dry_run=True) == []
+
+
+@pytest.mark.parametrize('compare', ['mtime', 'hash'])
+def test_same_size_without_manifest_is_not_in_sync(drive, seafdir, tmp_path, compare):
+    (tmp_path / 'a.txt').write_bytes(b'x')
+    (tmp_path / 'd').mkdir()
+    (tmp_path / 'e').mkdir()
+
+    sync = DriveSync(str(tmp_path), seafdir, compare=compare, include=['a.txt'])
+    assert sync.run(dry_run=True) == [SyncAction('conflict', 'a.txt', 'on both sides, never synced')]
+    sync.run()
+    # still not recorded as synced
+    assert DriveSync(str(tmp_path), seafdir, compare=compare, include=['a.txt']).run(dry_run=True) == [
+        SyncAction('conflict', 'a.txt', 'on both sides, never synced')]
+
+    plan = DriveSync(str(tmp_path), seafdir, direction='download', compare=compare, include=['a.txt']).run(dry_run=True)
+    assert plan == [SyncAction('download', 'a.txt', 'remote changed')]
+    sync = DriveSync(str(tmp_path), seafdir, direction='upload', compare=compare, include=['a.txt'])
+    assert sync.run(dry_run=True) == [SyncAction('upload', 'a.txt', 'local changed')]
+    assert all(r.ok for r in sync.run())
+    assert drive.files['/r/a.txt'] == b'x'
+    assert DriveSync(str(tmp_path), seafdir, compare=compare, include=['a.txt']).run(dry_run=True) == []
+
+
+def test_bucket_sync_same_size_without_manifest(tmp_path):
+    bucket = MockBucket({'same': b'abc', 'stale': b'new'})
+    (tmp_path / 'same').write_bytes(b'abc')
+    (tmp_path / 'stale').write_bytes(b'old')
+
+    sync = BucketSync(str(tmp_path), bucket)
+    assert sync.run(dry_run=True) == [SyncAction('download', 'stale', 'differs')]
+    sync.run()
+    assert (tmp_path / 'stale').read_bytes() == b'new'
+    assert BucketSync(str(tmp_path), bucket).run(dry_run=True) == []
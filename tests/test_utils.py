@@ -14,3 +14,17 @@ test_401_parameters = [
 def test_on_401_wrap(func,is_generator):
     wrapped_fn = on_401_raise_unauthorized('oh noes')(func)
     assert inspect.isgeneratorfunction(wrapped_fn) == is_generator
+
+async def async_generator_fn():
+    yield 1
+
+async def coroutine_fn():
+    return 1
+
+@pytest.mark.parametrize('func,check', [
+    (async_generator_fn, inspect.isasyncgenfunction),
+    (coroutine_fn, inspect.iscoroutinefunction),
+])
+def test_on_401_wrap_async(func, check):
+    wrapped_fn = on_401_raise_unauthorized('oh noes')(func)
+    assert check(wrapped_fn)